@@ -0,0 +1,191 @@
+"""Multi-process deployment: several server processes behind a local balancer.
+
+The generation and the rendering are CPU-bound Python, so one server process
+uses about one core. Run from the `src` directory instead of `main.py`:
+
+    MATHEMA_WORKERS=4 python balancer.py
+
+The balancer listens on `HD_HOST`:`HD_PORT` (0.0.0.0:8888 by default) and
+starts `MATHEMA_WORKERS` (the number of CPUs by default) `main.py` processes
+on the following ports. A hyperdiv session lives in the process, which
+serves its websocket, so the sessions are sticky: the first response sets a
+cookie with the worker number, and all the following requests of the
+browser, including the websocket, go to the same worker.
+
+The workers share the rendered images and the solution pools through the
+disk cache (see `disk_cache.py`), and restart if they exit.
+"""
+
+from itertools import count
+from typing import Any
+
+import os
+import subprocess
+import sys
+
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError, HTTPRequest
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.web import Application, RequestHandler
+from tornado.websocket import WebSocketClientConnection, WebSocketHandler, websocket_connect
+
+
+WORKER_COOKIE = "mathema_worker"
+
+# Not forwarded between the browser and the workers.
+_HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "content-length",
+}
+
+
+class Workers:
+    """The worker processes and the choice of a worker for a browser."""
+
+    def __init__(self, num_of_workers: int, first_port: int) -> None:
+        self.ports = [first_port + i for i in range(num_of_workers)]
+        self.processes: list[subprocess.Popen | None] = [None] * num_of_workers
+        self._next_worker = count()
+
+    def start(self, worker: int) -> None:
+        environment = os.environ | {
+            "HD_HOST": "127.0.0.1",
+            "HD_PORT": str(self.ports[worker]),
+            "MATHEMA_METRICS_PORT": str(
+                int(os.environ.get("MATHEMA_METRICS_PORT", "9888")) + worker
+            ),
+        }
+
+        self.processes[worker] = subprocess.Popen(
+            [sys.executable, "main.py"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=environment
+        )
+
+    def restart_exited(self) -> None:
+        for worker, process in enumerate(self.processes):
+            if process is None or process.poll() is not None:
+                if process is not None:
+                    print(f"Log (ERROR): worker {worker} exited with {process.returncode}, restarting.", flush=True)
+                self.start(worker)
+
+    def stop(self) -> None:
+        for process in self.processes:
+            if process is not None:
+                process.terminate()
+
+    def choose(self, handler: RequestHandler) -> int:
+        """The worker of the browser, or the next worker in turn for a new one."""
+
+        cookie = handler.get_cookie(WORKER_COOKIE)
+        if cookie is not None and cookie.isdigit() and int(cookie) < len(self.ports):
+            return int(cookie)
+
+        return next(self._next_worker) % len(self.ports)
+
+
+class ProxyHandler(RequestHandler):
+    def initialize(self, workers: Workers) -> None:
+        self.workers = workers
+
+    async def get(self, *args: Any) -> None:
+        worker = self.workers.choose(self)
+
+        request = HTTPRequest(
+            f"http://127.0.0.1:{self.workers.ports[worker]}{self.request.uri}",
+            method=self.request.method,
+            headers={
+                name: value for name, value in self.request.headers.get_all()
+                if name.lower() not in _HOP_BY_HOP_HEADERS
+            },
+            body=self.request.body or None,
+            follow_redirects=False,
+            decompress_response=False
+        )
+
+        try:
+            response = await AsyncHTTPClient().fetch(request, raise_error=False)
+        except (HTTPClientError, OSError):
+            self.send_error(502)
+            return
+
+        self.set_status(response.code, response.reason)
+        for name in ("Server", "Date", "Content-Type"):
+            self.clear_header(name)
+        for name, value in response.headers.get_all():
+            if name.lower() not in _HOP_BY_HOP_HEADERS:
+                self.add_header(name, value)
+
+        self.set_cookie(WORKER_COOKIE, str(worker), httponly=True, samesite="Lax")
+
+        if response.body:
+            self.write(response.body)
+
+    head = get
+
+
+class WebSocketProxyHandler(WebSocketHandler):
+    def initialize(self, workers: Workers) -> None:
+        self.workers = workers
+        self.worker_connection: WebSocketClientConnection | None = None
+
+    def check_origin(self, origin: str) -> bool:
+        # Checked by the worker, which gets the original headers.
+        return True
+
+    async def open(self, *args: Any) -> None:
+        worker = self.workers.choose(self)
+
+        try:
+            self.worker_connection = await websocket_connect(
+                HTTPRequest(
+                    f"ws://127.0.0.1:{self.workers.ports[worker]}{self.request.uri}",
+                    headers={
+                        name: value for name, value in self.request.headers.get_all()
+                        if name.lower() not in _HOP_BY_HOP_HEADERS
+                        and not name.lower().startswith("sec-websocket")
+                    }
+                ),
+                on_message_callback=self._on_worker_message
+            )
+        except (HTTPClientError, OSError):
+            self.close(1011, "The worker is not available.")
+
+    def _on_worker_message(self, message: str | bytes | None) -> None:
+        if message is None:
+            self.close()
+        else:
+            self.write_message(message, binary=isinstance(message, bytes))
+
+    async def on_message(self, message: str | bytes) -> None:
+        if self.worker_connection is not None:
+            await self.worker_connection.write_message(message, binary=isinstance(message, bytes))
+
+    def on_close(self) -> None:
+        if self.worker_connection is not None:
+            self.worker_connection.close()
+
+
+def main() -> None:
+    host = os.environ.get("HD_HOST", "0.0.0.0")
+    port = int(os.environ.get("HD_PORT", "8888"))
+    num_of_workers = int(os.environ.get("MATHEMA_WORKERS", str(os.cpu_count() or 1)))
+
+    workers = Workers(num_of_workers, port + 1)
+    workers.restart_exited()
+    PeriodicCallback(workers.restart_exited, 1000).start()
+
+    application = Application([
+        (r"/ws", WebSocketProxyHandler, dict(workers=workers)),
+        (r"/(.*)", ProxyHandler, dict(workers=workers)),
+    ])
+    application.listen(port, address=host)
+    print(f"Running {num_of_workers} workers at http://{host}:{port}", flush=True)
+
+    try:
+        IOLoop.current().start()
+    finally:
+        workers.stop()
+
+
+if __name__ == "__main__":
+    main()
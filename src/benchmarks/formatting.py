@@ -0,0 +1,71 @@
+"""Benchmark of the number-to-TeX formatting of the solutions.
+
+Run from the `src` directory:
+
+    python -m benchmarks.formatting
+"""
+
+from components import tex_formatting
+from generator.types import Solution
+
+from random import Random
+from time import perf_counter
+
+
+NUM_OF_SOLUTIONS = 10_000
+
+
+def _random_solutions(seed: int = 0) -> list[Solution]:
+    """Solutions resembling the generated ones: integer coefficients,
+    proper fractions and rounded answers, some of them failed (-inf).
+    """
+
+    random = Random(seed)
+    solutions: list[Solution] = []
+
+    for _ in range(NUM_OF_SOLUTIONS):
+        solutions.append(Solution({
+            "a": random.randint(-12, 12),
+            "b": random.randint(-20, 20),
+            "c": random.randint(1, 5) / random.randint(2, 5),
+            "x_1": round(random.uniform(-10, 10), random.choice((0, 4))),
+            "x_2": random.choice((float("-inf"), float(random.randint(-10, 10))))
+        }))
+
+    return solutions
+
+
+def _measure(name: str, function, *args) -> None:
+    start = perf_counter()
+    function(*args)
+    print(f"{name:<28}{(perf_counter() - start) * 1000:>10.1f} ms")
+
+
+def main() -> None:
+    solutions = _random_solutions()
+    proper = {"a": False, "b": False, "c": True, "x_1": False, "x_2": False}
+
+    tex_formatting._format_finite_number.cache_clear()
+    print(f"Formatting {NUM_OF_SOLUTIONS} solutions:")
+
+    _measure(
+        "uncached",
+        lambda: [
+            {
+                name: (
+                    tex_formatting.NOT_A_NUMBER if value == float("-inf")
+                    else tex_formatting._format_finite_number.__wrapped__(value, proper[name])
+                )
+                for name, value in solution.items()
+            }
+            for solution in solutions
+        ]
+    )
+    _measure("cold cache", tex_formatting.solutions_to_string_variables, solutions, proper)
+    _measure("warm cache", tex_formatting.solutions_to_string_variables, solutions, proper)
+
+    print(tex_formatting._format_finite_number.cache_info())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Benchmark of the generation and rendering of every registered page.
+
+Run from the `src` directory:
+
+    python -m benchmarks.generation --output results.json
+    python -m benchmarks.generation --compare results.json
+
+Every page is benchmarked with its default conditions ("default") and with
+all of its extra conditions checked ("hard"). The random generator is seeded,
+so the runs are comparable between the hyperdiv and matplotlib versions.
+"""
+
+from components.page_specs import PageSpec, discover_page_specs
+from components.tex_formatting import solutions_to_string_variables
+from components.tex_image_generator import replace_vars_in_formulas, tex_image
+from components.image_store import store_image
+from generator import evaluate, generate_solutions
+from generator.types import Solution
+import metrics
+import registrar
+from routes import (
+    basic_arithmetic,
+    linear_equations,
+    quadratic_equations
+)
+
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Any
+
+import json
+import random
+import tracemalloc
+
+
+RENDERED_FORMULAS_PER_PAGE = 10
+
+
+def _generate(
+    page: str,
+    spec: PageSpec,
+    conditions: set[str],
+    num_of_solutions: int,
+    seed: int
+) -> tuple[set[Solution] | None, float]:
+    random.seed(seed)
+    start = perf_counter()
+
+    solutions = generate_solutions(
+        spec.variables(), conditions, num_of_solutions, page,
+        is_canceled=lambda: False
+    )
+
+    return solutions, perf_counter() - start
+
+
+def _benchmark_generation(
+    page: str,
+    spec: PageSpec,
+    conditions: set[str],
+    num_of_solutions: int,
+    seed: int
+) -> dict[str, Any]:
+    _, time_to_first = _generate(page, spec, conditions, 1, seed)
+
+    metrics.reset()
+    solutions, time_to_all = _generate(page, spec, conditions, num_of_solutions, seed)
+    attempts = metrics.snapshot().get(
+        ("mathema_generation_attempts_total", (("page", page),)), 0
+    )
+
+    tracemalloc.start()
+    _generate(page, spec, conditions, num_of_solutions, seed)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "result": "ok" if solutions else "failed",
+        "num_of_solutions": len(solutions or ()),
+        "attempts": attempts,
+        "attempts_per_second": attempts / time_to_all if time_to_all else 0,
+        "time_to_first_solution_s": time_to_first,
+        "time_to_all_solutions_s": time_to_all,
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def _benchmark_rendering(spec: PageSpec, solutions: list[Solution]) -> dict[str, Any]:
+    proper = {name: False for name in spec.variables_defaults}
+    answers = [
+        Solution(
+            {
+                name: round(evaluate(formula, solution), 4)
+                for name, formula in spec.answer_variables.items()
+            },
+            solution
+        )
+        for solution in solutions
+    ]
+
+    tex_formulas = replace_vars_in_formulas(
+        spec.tex_formula, solutions_to_string_variables(solutions, proper)
+    )
+    if spec.answer_tex_formula_generator is not None:
+        answers_proper = {**spec.proper_fraction_variables, **proper}
+        tex_formulas += [
+            spec.answer_tex_formula_generator(variables)
+            for variables in solutions_to_string_variables(answers, answers_proper)
+        ]
+
+    rendered = tex_formulas[:2 * RENDERED_FORMULAS_PER_PAGE]
+    start = perf_counter()
+    images = [tex_image(tex_formula, is_light_theme=True) for tex_formula in rendered]
+    render_time = perf_counter() - start
+
+    start = perf_counter()
+    for image in images:
+        store_image(image)
+    store_time = perf_counter() - start
+
+    return {
+        "render_ms_per_formula": render_time * 1000 / max(len(rendered), 1),
+        "store_ms_per_formula": store_time * 1000 / max(len(rendered), 1),
+        # The share of the formulas that would be served from the image cache.
+        "cache_hit_ratio": 1 - len(set(tex_formulas)) / max(len(tex_formulas), 1),
+    }
+
+
+def run_benchmarks(num_of_solutions: int, seed: int, page_filter: str = "") -> dict[str, Any]:
+    metrics.ENABLED = True
+    hrefs = [href for href in registrar.get_page_hrefs() if page_filter in href]
+    results: dict[str, Any] = {}
+
+    for page, spec in discover_page_specs(hrefs).items():
+        subsets = {
+            "default": spec.conditions(),
+            "hard": spec.conditions(range(len(spec.extra_conditions))),
+        }
+        results[page] = {}
+
+        for subset_name, conditions in subsets.items():
+            result = _benchmark_generation(page, spec, conditions, num_of_solutions, seed)
+
+            if subset_name == "default":
+                solutions, _ = _generate(page, spec, conditions, num_of_solutions, seed)
+                result |= _benchmark_rendering(spec, list(solutions or ()))
+
+            results[page][subset_name] = result
+            print(f"{page:<36}{subset_name:<10}", json.dumps(result))
+
+    return {"num_of_solutions": num_of_solutions, "seed": seed, "pages": results}
+
+
+def compare(previous: dict[str, Any], current: dict[str, Any]) -> None:
+    """Print the ratio of the current timings to the previous ones."""
+
+    for page, subsets in current["pages"].items():
+        for subset_name, result in subsets.items():
+            previous_result = previous["pages"].get(page, {}).get(subset_name)
+            if previous_result is None:
+                continue
+
+            ratios = ", ".join(
+                f"{name}: {result[name] / previous_result[name]:.2f}x"
+                for name in (
+                    "time_to_first_solution_s", "time_to_all_solutions_s",
+                    "render_ms_per_formula", "peak_memory_bytes"
+                )
+                if previous_result.get(name) and name in result
+            )
+            print(f"{page:<36}{subset_name:<10}{ratios}")
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--solutions", type=int, default=50, help="solutions per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pages", default="", help="only the pages containing this text")
+    parser.add_argument("--output", help="save the results as JSON to this path")
+    parser.add_argument("--compare", help="compare with the results saved at this path")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.solutions, args.seed, args.pages)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark of the render pass of the pages, after an input is changed.
+
+Run from the `src` directory:
+
+    python -m benchmarks.render_pass
+
+Every page is rendered in a session without a browser (hyperdiv's mock
+runner), then its last checkbox is toggled and its slider is moved
+repeatedly, and the time of the render pass (running the app, as many
+times as it takes, and diffing the components) is measured.
+"""
+
+from main import main as application
+import registrar
+
+from argparse import ArgumentParser
+from statistics import median
+from time import perf_counter
+from typing import Any, Iterator
+
+from hyperdiv.test_utils import MockManualRunner, mock_initial_updates
+
+
+def _components(dom: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    yield dom
+    for child in dom.get("children", []):
+        if isinstance(child, dict):
+            yield from _components(child)
+
+
+def _benchmark_page(
+    href: str,
+    window_width: int,
+    num_of_renders: int
+) -> dict[str, list[float]] | None:
+    initial_updates = [
+        ("location", "path", href) if update[:2] == ("location", "path")
+        else ("window", "width", window_width) if update[:2] == ("window", "width")
+        else update
+        for update in mock_initial_updates
+    ]
+
+    runner = MockManualRunner(application, initial_updates)
+    runner.advance()
+
+    keys: dict[str, list[str]] = {}
+    for component in _components(runner.connection.msgs[-1]["dom"]):
+        keys.setdefault(component["name"], []).append(component["key"])
+    if "checkbox" not in keys or "slider" not in keys:
+        return None
+
+    events = {
+        "checkbox": lambda i: (keys["checkbox"][-1], "checked", i % 2 == 0),
+        "slider": lambda i: (keys["slider"][-1], "value", 10 + i % 50),
+    }
+
+    times: dict[str, list[float]] = {}
+    for event_name, event in events.items():
+        times[event_name] = []
+
+        for i in range(num_of_renders):
+            start = perf_counter()
+            runner.process_updates([event(i)])
+            times[event_name].append(perf_counter() - start)
+
+    return times
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--renders", type=int, default=200, help="render passes per page")
+    parser.add_argument("--width", type=int, default=1400, help="window width, the sidebar is a drawer below 1000")
+    parser.add_argument("--pages", default="", help="only the pages containing this text")
+    args = parser.parse_args()
+
+    for href in registrar.get_page_hrefs():
+        if args.pages not in href:
+            continue
+
+        times = _benchmark_page(href, args.width, args.renders)
+        if times is None:
+            continue
+
+        print(f"{href:<36}" + ", ".join(
+            f"{event_name}: median {median(event_times) * 1000:>6.2f} ms"
+            for event_name, event_times in times.items()
+        ))
+
+
+if __name__ == "__main__":
+    main()
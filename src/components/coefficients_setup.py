@@ -98,14 +98,13 @@ def num_of_equations(**kwargs) -> int:
     """A component for setting up the number of equations (solutions).
     Consists of a slider and two buttons for changing the value.
     Returns the number of equations.
+    The slider is not debounced (hyperdiv sends every step of it), a step
+    renders the page again without the cached settings sections.
     """
     
-    slider_state = hd.state(value=0)
-    
-    hd.text(
-        f"Кількість прикладів — {int(slider_state.value)}",
-        margin_top=2
-    )
+    # The number is written after the slider is read, so that moving the
+    # slider does not make the app run again to show the new number.
+    label = hd.text(margin_top=2)
     
     with hd.hbox(
         gap="4%", width="80%",
@@ -114,7 +113,7 @@ def num_of_equations(**kwargs) -> int:
     ):
         less_button = hd.button("-", font_size=hd.FontSize.large, pill=True, width=2.5)
         
-        min_value, max_value = 1, 50
+        min_value, max_value = 1, 1000
         num_of_equations_slider = hd.slider(
             min_value=min_value, max_value=max_value, value=6,
             width="100%", track_active_color=hd.Color.primary,
@@ -127,9 +126,10 @@ def num_of_equations(**kwargs) -> int:
     elif more_button.clicked and num_of_equations_slider.value + 1 <= max_value:
         num_of_equations_slider.value += 1
 
-    slider_state.value = num_of_equations_slider.value
+    value = int(num_of_equations_slider.value)
+    label.content = f"Кількість прикладів — {value}"
     
-    return int(slider_state.value)
+    return value
 
 
 def get_fractions(*variable_names: VariableNameType) -> tuple[
@@ -142,37 +142,28 @@ def get_fractions(*variable_names: VariableNameType) -> tuple[
     represented as a dictionary {variable_name: bool}.
     """
     
-    proper_checkboxes: dict[VariableNameType, hd.checkbox] = {}
-    decimal_checkboxes: dict[VariableNameType, hd.checkbox] = {}
+    proper: dict[VariableNameType, bool] = {}
+    decimal: dict[VariableNameType, bool] = {}
 
     for i, variable_name in enumerate(variable_names):
         with hd.scope(i):
-            proper_checkboxes[variable_name] = extra_condition(
+            proper_checkbox = extra_condition(
                 f"Коефіцієнт {variable_name} є простим дробом",
                 variable_name + r" = \frac{p}{q}"
             )
-            decimal_checkboxes[variable_name] = extra_condition(
+            decimal_checkbox = extra_condition(
                 f"Коефіцієнт {variable_name} є десятковим дробом",
                 variable_name + r" = n.\overline{d_1 d_2}"
             )
         
-        for f_checkbox_type, s_checkbox_type in (
-            (decimal_checkboxes, proper_checkboxes),
-            (proper_checkboxes, decimal_checkboxes)
-        ):
-            f_checkbox_type[variable_name].disabled = s_checkbox_type[variable_name].checked
-            f_checkbox_type[variable_name].checked = (
-                False if f_checkbox_type[variable_name].disabled
-                else f_checkbox_type[variable_name].checked
-            )
-
-    proper: dict[VariableNameType, bool] = {
-        variable_name: checkbox.checked
-        for variable_name, checkbox in proper_checkboxes.items()
-    }
-    decimal: dict[VariableNameType, bool] = {
-        variable_name: checkbox.checked
-        for variable_name, checkbox in decimal_checkboxes.items()
-    }
+        # A proper fraction cannot be decimal and vice versa. The written props
+        # are not read back, as that would make the app run again.
+        decimal[variable_name] = decimal_checkbox.checked and not proper_checkbox.checked
+        proper[variable_name] = proper_checkbox.checked and not decimal[variable_name]
+
+        decimal_checkbox.disabled = proper[variable_name]
+        decimal_checkbox.checked = decimal[variable_name]
+        proper_checkbox.disabled = decimal[variable_name]
+        proper_checkbox.checked = proper[variable_name]
 
     return proper, decimal
@@ -6,37 +6,91 @@ from generator.types import (
     VariableProperties,
     GenerationTask
 )
-from generator import generate_solutions, evaluate
+from generator import evaluate
+from generator.scheduler import scheduler
 import components.coefficients_setup as cs
+from components import session_results
+from components.session_results import GenerationResults
+import metrics
+from components.tex_formatting import solutions_to_string_variables
 from components.tex_image_generator import (
     show_solutions,
     TexImageGenerator,
-    replace_vars_in_formula
+    replace_vars_in_formula,
+    replace_vars_in_formulas
 )
+from components.image_store import store_worksheet
+from components.page_specs import page_spec
+from components.worksheet_export import worksheet_pdf
 
 from collections import defaultdict
+from copy import deepcopy
+from random import getrandbits
 from typing import Annotated, Iterable, Mapping, Callable, Any
+from uuid import uuid4
+
+import asyncio
 
 import hyperdiv as hd
 
 
+def get_answers(
+    solutions: list[Solution] | None,
+    answer_variables: Mapping[VariableNameType, FormulaType]
+) -> list[Solution] | None:
+    """The values of the answer formulas for each of the solutions,
+    together with the values of the solution. None if there are no solutions.
+    """
+
+    if not solutions:
+        return None
+
+    # The answers computed by the generator with the solutions, if any.
+    if all(
+        solution.answers is not None and answer_variables.keys() <= solution.answers.keys()
+        for solution in solutions
+    ):
+        return [solution.answers for solution in solutions]
+
+    answers: list[Solution] = list()
+
+    for solution in solutions:
+        variables: dict[VariableNameType, float] = {
+            var_name: round(evaluate(var_formula, solution), 4)
+            for var_name, var_formula in answer_variables.items()
+        }
+
+        answers.append(Solution(variables, solution))
+
+    return answers
+
+
 @hd.global_state
 class GeneratorState(hd.BaseState):
-    """State that is being passed to the generator components."""
+    """State that is being passed to the generator components.
+    The generated solutions and answers are kept in the server-side
+    session results storage, the state keeps only the key to them.
+    """
 
     variables: dict[VariableNameType, VariableProperties] = hd.Prop(hd.Any, dict())
     proper: dict[VariableNameType, bool] = hd.Prop(hd.Any, dict())
     conditions: set[FormulaType] = hd.Prop(hd.Any, set())
     num_of_solutions: int = hd.Prop(hd.Any, int())
-    solutions: list[Solution] | None = hd.Prop(hd.Any, list())
+    tex_formula: str = hd.Prop(hd.Any, str())
 
     answer_variables: Mapping[VariableNameType, str] = hd.Prop(hd.Any, dict())
     proper_fraction_variables: Mapping[VariableNameType, bool] = hd.Prop(hd.Any, dict())
-    answers: list[Solution] | None = hd.Prop(hd.Any, list())
+
+    session_id: str = hd.Prop(hd.Any, str())
+    results_version: int = hd.Prop(hd.Any, int())
+    queue_position: int = hd.Prop(hd.Any, int())
 
     location: str = hd.Prop(hd.Any, str())
 
     def reset_component(self) -> None:
+        if self.session_id:
+            session_results.discard(self.session_id)
+
         super().reset_component()
 
         self.variables = defaultdict(
@@ -45,71 +99,160 @@ class GeneratorState(hd.BaseState):
         self.proper = defaultdict(lambda: False)
         self.conditions = set()
         self.num_of_solutions = int()
-        self.solutions = list()
+        self.tex_formula = str()
         self.answer_variables = dict()
         self.proper_fraction_variables = dict()
-        self.answers = list()
 
     def reset_if_location_changed(self) -> None:
         location = hd.location().path
         if self.location != location:
+            # The generation of the previous page is not needed anymore.
+            GenerationTask().clear()
             self.reset_component()
         self.location = location
 
-    def get_answers(self) -> None:
-        if not self.solutions:
-            self.answers = None
-            return
+    def _results(self) -> GenerationResults | None:
+        # Reading the version makes the components rerender when the results change.
+        if self.results_version == 0:
+            return None
+
+        return session_results.get(self.session_id)
+
+    @property
+    def solutions(self) -> list[Solution] | None:
+        """The generated solutions, or None if the generation failed."""
+
+        results = self._results()
+        if results is None or results.evicted:
+            return list()
+        return results.solutions
+
+    @property
+    def answers(self) -> list[Solution] | None:
+        results = self._results()
+        if results is None or results.evicted:
+            return list()
+        return results.answers
+
+    @property
+    def results_evicted(self) -> bool:
+        """Whether the results were evicted while the session was idle."""
+
+        results = self._results()
+        return results is not None and results.evicted
+
+    async def _generate(
+        self,
+        results: GenerationResults,
+        loading_button: hd.button,
+        generation_task: GenerationTask
+    ) -> None:
+        """Generate the solutions and the answers of the results
+        from their inputs and seed, and store them.
+        Waits in the generation queue, showing the position in it meanwhile.
+        Does nothing if the generation task is canceled meanwhile.
+        """
+
+        cancel_event = generation_task.cancel_event
+        if not self.session_id:
+            self.session_id = uuid4().hex
+
+        # The generation task shows the error, if any, the button stops loading anyway.
+        try:
+            future = scheduler.submit(
+                self.session_id,
+                results.variables,
+                results.conditions,
+                results.num_of_solutions,
+                results.location,
+                results.seed,
+                cancel_event,
+                results.answer_variables
+            )
 
-        self.answers = list()
+            # The task waits on the ioloop, so the queued requests occupy no threads.
+            generation = asyncio.wrap_future(future)
+            while not generation.done() and not cancel_event.is_set():
+                queue_position = scheduler.position(future)
+                if self.queue_position != queue_position:
+                    self.queue_position = queue_position
 
-        for solution in self.solutions:
-            variables: dict[VariableNameType, float] = {
-                var_name: round(evaluate(var_formula, solution), 4)
-                for var_name, var_formula in self.answer_variables.items()
-            }
+                await asyncio.wait([generation], timeout=0.25)
 
-            self.answers.append(Solution(variables, solution))
+            if cancel_event.is_set():
+                return
 
-    def get_solutions(self, loading_button: hd.button) -> None:
-        conditions = self.conditions
-        variables = self.variables
-        num_of_equations = self.num_of_solutions
-        generator_location = hd.location().path
+            solutions_set, results.seed = generation.result()
+            results.evicted = False
 
-        solutions_set = generate_solutions(
-            variables,
-            conditions,
-            num_of_equations,
-            generator_location
-        )
+            if solutions_set is None:
+                results.solutions = None
+                results.answers = None
+            else:
+                results.solutions = list(solutions_set)
+
+                for variable_name, variable_properties in results.variables.items():
+                    self.proper[variable_name] = variable_properties.is_proper_fraction
+
+                results.answers = get_answers(results.solutions, results.answer_variables)
 
-        if solutions_set is None:
-            self.solutions = None
-            self.answers = None
+            try:
+                session_results.store(self.session_id, results)
+            finally:
+                # The previous results are discarded, if the new ones are over the size cap.
+                self.results_version += 1
+        finally:
+            self.queue_position = 0
             loading_button.loading = False
-            return
 
-        self.solutions = list(solutions_set)
+    async def get_solutions(
+        self,
+        loading_button: hd.button,
+        generation_task: GenerationTask
+    ) -> None:
+        results = GenerationResults(
+            location=hd.location().path,
+            variables={
+                variable_name: deepcopy(variable_properties)
+                for variable_name, variable_properties in self.variables.items()
+            },
+            conditions=frozenset(self.conditions),
+            num_of_solutions=self.num_of_solutions,
+            answer_variables=dict(self.answer_variables),
+            seed=getrandbits(64),
+            solutions=None,
+            answers=None
+        )
+
+        await self._generate(results, loading_button, generation_task)
 
-        for variable_name, variable_properties in self.variables.items():
-            self.proper[variable_name] = variable_properties.is_proper_fraction
+    async def restore_solutions(
+        self,
+        loading_button: hd.button,
+        generation_task: GenerationTask
+    ) -> None:
+        """Regenerate the evicted results from their stored seed."""
 
-        self.get_answers()
-        loading_button.loading = False
+        results = self._results()
+        if results is None or not results.evicted:
+            loading_button.loading = False
+            return
 
+        metrics.increment("mathema_session_results_restored_total", page=results.location)
+        await self._generate(results, loading_button, generation_task)
 
+
+@hd.cached
 def heading(tex_formula: str, image_generator: TexImageGenerator) -> None:
     """A component for displaying the heading of the generator page.
     Consists of an image of a formula.
-    Also resets the generator state if the page is changed.
+    Cached, so it is rendered again only if the theme is changed.
     """
     
     hd.image(image_generator(tex_formula, 0.02), height=2.8)
 
 
 def coefficients_setup_section(
-    state: GeneratorState,
     variables_defaults: Mapping[
         VariableNameType, tuple[
             Annotated[str, "default from"],
@@ -121,14 +264,40 @@ def coefficients_setup_section(
     """A component for setting up coefficients.
     Consists of an interval setup and a checkbox for proper and decimal fractions
     for each variable (coefficient).
+    The section is rendered and sets the variables of the state again only when
+    its inputs or the page are changed, e.g. not when the number of solutions is.
+    The text inputs are not debounced: hyperdiv sends every keystroke as an
+    event and has no server-side hook to delay it, so a keystroke renders
+    the section again (and only it).
     """
-    
+
+    _coefficients_setup_section(tuple(variables_defaults.items()), fractions_avaliable)
+
+
+@hd.cached
+def _coefficients_setup_section(
+    variables_defaults: tuple[
+        tuple[
+            VariableNameType, tuple[
+                Annotated[str, "default from"],
+                Annotated[str, "default to"]
+            ]
+        ], ...
+    ],
+    fractions_avaliable: bool
+) -> None:
+    # The arguments of a cached function are hashed, so the global
+    # state (a new object on every render) is not passed.
+    state = GeneratorState()
+
     hd.h3("Налаштування коефіцієнтів", margin_top=1.5)
     state.reset_if_location_changed()
 
-    for i, (
-        variable_name, (default_start, default_stop)
-    ) in enumerate(variables_defaults.items()):
+    spec = page_spec()
+    spec.variables_defaults = dict(variables_defaults)
+    spec.fractions_avaliable = fractions_avaliable
+
+    for i, (variable_name, (default_start, default_stop)) in enumerate(variables_defaults):
         with hd.scope(i):
             num_range = cs.numbers_range(variable_name, default_start, default_stop)
         
@@ -138,7 +307,7 @@ def coefficients_setup_section(
 
     if fractions_avaliable:
         with hd.box(margin_top=1):
-            proper, decimal = cs.get_fractions(*variables_defaults.keys())
+            proper, decimal = cs.get_fractions(*(variable_name for variable_name, _ in variables_defaults))
             
             for variable_name, is_proper_fraction in proper.items():
                 state.variables[variable_name].is_proper_fraction = is_proper_fraction
@@ -147,7 +316,6 @@ def coefficients_setup_section(
 
 
 def extra_conditions_section(
-    state: GeneratorState,
     extra_conditions: Iterable[
         tuple[
             Annotated[str, "description"],
@@ -159,11 +327,33 @@ def extra_conditions_section(
 ) -> None:
     """A component for setting up extra conditions.
     Consists of a checkbox and an image of a formula after it for each condition.
+    The section is rendered and sets the conditions of the state again only when
+    its checkboxes or the page are changed.
     """
 
+    _extra_conditions_section(tuple(extra_conditions), tuple(default_conditions))
+
+
+@hd.cached
+def _extra_conditions_section(
+    extra_conditions: tuple[
+        tuple[
+            Annotated[str, "description"],
+            Annotated[str, "TeX formula"],
+            Annotated[FormulaType, "generator conditon"]
+        ], ...
+    ],
+    default_conditions: tuple[FormulaType, ...]
+) -> None:
+    state = GeneratorState()
+
     hd.h3("Додаткові умови", margin_top=2, margin_bottom=1.25)
     state.reset_if_location_changed()
 
+    spec = page_spec()
+    spec.extra_conditions = extra_conditions
+    spec.default_conditions = default_conditions
+
     for condition in default_conditions:
         state.conditions.add(condition)
 
@@ -204,24 +394,53 @@ def generation_section(
 
     hd.h3("Генерація", margin_top=2)
     state.reset_if_location_changed()
+    state.tex_formula = tex_formula
+    page_spec().tex_formula = tex_formula
 
     state.num_of_solutions = cs.num_of_equations()
     generate_btn = hd.button("Генерувати", margin_top=2)
 
     generation_task = GenerationTask()
 
+    # A failed restoration is not retried on every render, the next click generates again.
+    if state.results_evicted and not generation_task.running and not generation_task.error:
+        generate_btn.loading = True
+        generation_task.rerun(state.restore_solutions, generate_btn, generation_task)
+
     if generation_task.running:
         with hd.box(padding=(12, 0, 12, 0)):
-            hd.text(
-                "Генерація прикладів...",
-                font_color=hd.Color.neutral_400,
-                font_size=hd.FontSize.two_x_large
-            )
+            if state.queue_position:
+                hd.text(
+                    f"Ваше місце в черзі: {state.queue_position}",
+                    font_color=hd.Color.neutral_400,
+                    font_size=hd.FontSize.two_x_large
+                )
+            else:
+                hd.text(
+                    "Генерація прикладів...",
+                    font_color=hd.Color.neutral_400,
+                    font_size=hd.FontSize.two_x_large
+                )
         return
 
+    admission = hd.state(rejected=False)
+
     if generate_btn.clicked:
-        generate_btn.loading = True
-        generation_task.rerun(state.get_solutions, generate_btn)
+        # Past the bound of the generation queue, the new requests are not admitted.
+        admission.rejected = scheduler.full
+
+        if not admission.rejected:
+            generate_btn.loading = True
+            generation_task.rerun(state.get_solutions, generate_btn, generation_task)
+
+    if admission.rejected:
+        hd.text(
+            "Сервер зараз перевантажений. Спробуйте згенерувати приклади трохи пізніше.",
+            font_color=hd.Color.danger,
+            margin_top=2
+        )
+    elif generation_task.error:
+        hd.text("Не вдалося згенерувати приклади.", font_color=hd.Color.danger, margin_top=2)
 
     if state.solutions:
         hd.h3("Результати генерації", margin_bottom=1.5, margin_top=2)
@@ -236,6 +455,70 @@ def generation_section(
         _solution_generation_error()
 
 
+def _export_worksheet(
+    solutions: Iterable[Solution],
+    answers: Iterable[Solution],
+    proper: Mapping[VariableNameType, bool],
+    answers_proper: Mapping[VariableNameType, bool],
+    tex_formula: str,
+    answer_tex_formula_generator: Callable[[Mapping[VariableNameType, str]], str]
+) -> str:
+    """Typeset the solutions and the answers into a PDF worksheet.
+    Returns the URL of the worksheet.
+    """
+
+    tex_formulas = [
+        str(i + 1) + r") \; " + example_tex_formula
+        for i, example_tex_formula in enumerate(replace_vars_in_formulas(
+            tex_formula,
+            solutions_to_string_variables(solutions, proper)
+        ))
+    ]
+    answer_tex_formulas = [
+        str(i + 1) + r") \; " + answer_tex_formula_generator(variables)
+        for i, variables in enumerate(solutions_to_string_variables(answers, answers_proper))
+    ]
+
+    return store_worksheet(worksheet_pdf((
+        ("Приклади", tex_formulas),
+        ("Відповіді", answer_tex_formulas)
+    )))
+
+
+def worksheet_export(
+    state: GeneratorState,
+    answers_proper: Mapping[VariableNameType, bool],
+    answer_tex_formula_generator: Callable[[Mapping[VariableNameType, str]], str]
+) -> None:
+    """A component for exporting the generated solutions to a printable PDF.
+    Consists of an export button, and a download link once the worksheet is ready.
+    """
+
+    export_task = hd.task()
+    export_state = hd.state(solutions_id=None)
+
+    if export_state.solutions_id != id(state.solutions):
+        export_state.solutions_id = id(state.solutions)
+        export_task.clear()
+
+    with hd.hbox(gap=2, align="center", justify="center", margin_bottom=3):
+        export_btn = hd.button("Експорт у PDF", loading=export_task.running)
+
+        if export_task.done and export_task.result:
+            hd.link("Завантажити PDF", href=export_task.result, target="_blank")
+
+    if export_btn.clicked and not export_task.running:
+        export_task.rerun(
+            _export_worksheet,
+            state.solutions,
+            state.answers,
+            state.proper,
+            answers_proper,
+            state.tex_formula,
+            answer_tex_formula_generator
+        )
+
+
 def answers_section(
     state: GeneratorState,
     answer_variables: Mapping[VariableNameType, str],
@@ -251,6 +534,11 @@ def answers_section(
 
     state.reset_if_location_changed()
 
+    spec = page_spec()
+    spec.answer_variables = dict(answer_variables)
+    spec.proper_fraction_variables = dict(proper_fraction_variables)
+    spec.answer_tex_formula_generator = tex_formula_generator
+
     generation_task = GenerationTask()
 
     if generation_task.running:
@@ -262,11 +550,15 @@ def answers_section(
     if not state.answers:
         return
 
+    answers_proper = {**proper_fraction_variables, **state.proper}
+
     with hd.details("Відповіді", width="100%", margin_top=4, margin_bottom=3):
         show_solutions(
             state.answers,
-            {**proper_fraction_variables, **state.proper},
+            answers_proper,
             tex_formula_generator,
             solution_image_generator,
             dividers=False
         )
+
+    worksheet_export(state, answers_proper, tex_formula_generator)
@@ -0,0 +1,247 @@
+"""A section of the page of the user-defined generators.
+
+The user writes the variables with their intervals, the conditions and the
+answers in the same formula language as the generator pages (`routes/*.py`),
+and the TeX template of the problems with the same macros. The formulas are
+checked against the grammar of `generator/custom.py` and the generation runs
+in a worker process (see `generator/custom_worker.py`).
+"""
+
+from components.components import get_answers
+from components.coefficients_setup import num_of_equations
+from components.tex_image_generator import (
+    TexImageGenerator,
+    replace_vars_in_formula,
+    show_solutions
+)
+from generator import custom
+from generator.custom import CustomGenerator, FormulaError
+from generator.custom_worker import BudgetExceededError, pool
+from generator.types import GenerationTask, Solution
+
+from collections import defaultdict
+from random import getrandbits
+from typing import Annotated, Mapping
+
+import asyncio
+import re
+
+import hyperdiv as hd
+
+
+MAX_TEX_FORMULA_LENGTH = 200
+
+# E.g. "a: 1..10" or "b: -5..5".
+_VARIABLE_PATTERN = re.compile(r"^\s*(\w+)\s*:\s*(-?\d+)\s*\.\.\s*(-?\d+)\s*$")
+# E.g. "x = b - a", but not "x == b - a".
+_ANSWER_PATTERN = re.compile(r"^\s*(\w+)\s*=(?!=)\s*(.+)$")
+
+
+def parse_custom_generator(
+    variables_text: str,
+    conditions_text: str,
+    answers_text: str
+) -> CustomGenerator:
+    """Parse and check a custom generator, written one variable, condition
+    or answer per line.
+    Raises FormulaError for a line or a formula outside of the grammar,
+    and ValueError if the generator is over the limits.
+    """
+
+    variables_intervals: dict[str, tuple[int, int]] = {}
+    for line in filter(str.strip, variables_text.splitlines()):
+        match = _VARIABLE_PATTERN.match(line)
+        if match is None:
+            raise FormulaError(line, "Invalid variable")
+        variables_intervals[match[1]] = (int(match[2]), int(match[3]))
+
+    answer_variables: dict[str, str] = {}
+    for line in filter(str.strip, answers_text.splitlines()):
+        match = _ANSWER_PATTERN.match(line)
+        if match is None:
+            raise FormulaError(line, "Invalid answer")
+        answer_variables[match[1]] = match[2]
+
+    return custom.custom_generator(
+        variables_intervals, conditions_text.splitlines(), answer_variables
+    )
+
+
+def _answer_tex_formula(generator: CustomGenerator, variables: Mapping[str, str]) -> str:
+    return r",\; ".join(f"{name} = {variables[name]}" for name, _ in generator.answers)
+
+
+async def _generate(
+    generator: CustomGenerator,
+    num_of_solutions: int,
+    generation_task: GenerationTask
+) -> tuple[
+    Annotated[list[Solution] | None, "solutions"],
+    Annotated[list[Solution] | None, "answers"],
+    Annotated[str | None, "error message"]
+]:
+    cancel_event = generation_task.cancel_event
+
+    # The task keeps only the message of an exception, so the errors are reported in the result.
+    try:
+        solutions = await asyncio.to_thread(
+            pool.generate, generator, num_of_solutions, getrandbits(64), cancel_event.is_set
+        )
+    except BudgetExceededError:
+        return None, None, "Генерація зайняла забагато часу. Спростіть умови або розширте інтервали."
+    except FormulaError as e:
+        return None, None, f"Вираз «{generator.source(e.formula)}» не обчислюється для жодних значень змінних."
+
+    if solutions is None:
+        return None, None, None
+
+    solutions_list = list(solutions)
+    return solutions_list, get_answers(solutions_list, generator.answer_variables), None
+
+
+def _check_tex_formula(
+    tex_formula: str,
+    generator: CustomGenerator,
+    image_generator: TexImageGenerator
+) -> str | None:
+    """Render the template with the names of the variables.
+    Returns the image, or None if the template is invalid.
+    """
+
+    if len(tex_formula) > MAX_TEX_FORMULA_LENGTH:
+        return None
+
+    try:
+        return image_generator(replace_vars_in_formula(
+            tex_formula, {name: name for name, _, _ in generator.variables_intervals}
+        ))
+    except Exception:
+        # KeyError for an unknown variable, ValueError for invalid TeX, and mathtext
+        # raises other errors too, e.g. RecursionError for deeply nested braces.
+        return None
+
+
+def custom_generator_section(image_generator: TexImageGenerator) -> None:
+    """A component for defining a custom generator and generating its problems.
+    Consists of the inputs of the variables, the conditions, the answers and
+    the TeX template, the number of the problems and the generation button,
+    and displays the problems and the answers once generated.
+    """
+
+    with hd.box(gap=1, width="100%"):
+        variables_input = hd.textarea(
+            "Змінні", value="a: 1..20\nb: 1..20", rows=3, maxlength=200,
+            help_text="Одна змінна на рядок, з цілим інтервалом, наприклад a: 1..20."
+        )
+        conditions_input = hd.textarea(
+            "Умови", value="a > b\n(a - b) % 2 == 0", rows=3, maxlength=1000,
+            help_text=(
+                "Одна умова на рядок: арифметика, порівняння, and, or, not, "
+                "abs, min, max, is_square, .is_integer()."
+            )
+        )
+        answers_input = hd.textarea(
+            "Відповіді", value="x = (a - b) / 2", rows=2, maxlength=500,
+            help_text="Одна відповідь на рядок, наприклад x = (a - b) / 2."
+        )
+        tex_input = hd.text_input(
+            "Шаблон прикладу (TeX)", value=r"2x + \VAR{b} = \VAR{a}",
+            maxlength=MAX_TEX_FORMULA_LENGTH,
+            help_text=r"Змінні підставляються макросами \VAR{a}, \SVAR{a}, \BVAR{a}, \CVAR{a}, \CSVAR{a}."
+        )
+
+    tex_formula = tex_input.value.strip()
+    generator = None
+    error = None
+
+    try:
+        generator = parse_custom_generator(
+            variables_input.value, conditions_input.value, answers_input.value
+        )
+    except FormulaError as e:
+        error = f"Недопустимий вираз: «{e.formula}»."
+    except ValueError:
+        error = (
+            f"Генератор має від 1 до {custom.MAX_VARIABLES} змінних з інтервалами "
+            f"в межах ±{custom.MAX_BOUND}, до {custom.MAX_CONDITIONS} умов "
+            f"і до {custom.MAX_ANSWERS} відповідей."
+        )
+
+    if generator is not None:
+        preview = _check_tex_formula(tex_formula, generator, image_generator)
+
+        if preview is None:
+            generator = None
+            error = "Неправильний TeX-шаблон, або в ньому невідомі змінні."
+        else:
+            hd.image(preview, height=3, margin_top=1.5)
+
+    if error is not None:
+        hd.text(error, font_color=hd.Color.danger, margin_top=1)
+
+    hd.h3("Генерація", margin_top=2)
+
+    num_of_solutions = num_of_equations()
+    generate_btn = hd.button("Генерувати", margin_top=2, disabled=generator is None)
+
+    generation_task = GenerationTask()
+    generated = hd.state(generator=None, tex_formula=str())
+
+    if generate_btn.clicked and generator is not None:
+        generated.generator = generator
+        generated.tex_formula = tex_formula
+        generation_task.rerun(_generate, generator, num_of_solutions, generation_task)
+
+    if generation_task.running:
+        hd.text(
+            "Генерація прикладів...",
+            font_color=hd.Color.neutral_400,
+            font_size=hd.FontSize.two_x_large,
+            padding=(12, 0, 12, 0)
+        )
+        return
+
+    if generation_task.error:
+        hd.text("Не вдалося згенерувати приклади.", font_color=hd.Color.danger, margin_top=2)
+
+    if not generation_task.done or generated.generator is None or generation_task.result is None:
+        return
+
+    solutions, answers, error = generation_task.result
+
+    if error is not None:
+        hd.text(error, font_color=hd.Color.danger, margin_top=2)
+        return
+    if solutions is None:
+        hd.text(
+            "Неможливо згенерувати достатньо унікальних прикладів.<br>"
+            "Перевірте правильність вхідних даних.",
+            font_color=hd.Color.danger,
+            margin_top=2
+        )
+        return
+    if not solutions:
+        return
+
+    hd.h3("Результати генерації", margin_bottom=1.5, margin_top=2)
+
+    proper: defaultdict[str, bool] = defaultdict(bool)
+
+    show_solutions(
+        solutions,
+        proper,
+        lambda variables: replace_vars_in_formula(generated.tex_formula, variables),
+        image_generator
+    )
+
+    if not answers or not generated.generator.answers:
+        return
+
+    with hd.details("Відповіді", width="100%", margin_top=4, margin_bottom=3):
+        show_solutions(
+            answers,
+            proper,
+            lambda variables: _answer_tex_formula(generated.generator, variables),
+            image_generator,
+            dividers=False
+        )
@@ -0,0 +1,140 @@
+"""Content-addressed store of the rendered formula images and worksheets.
+
+The files are written to the `assets` directory and served by the
+`/assets/` static route, so the components can reference them by URL
+instead of pushing the file bytes through the hyperdiv state.
+The images are also indexed by what they were rendered from, in the disk
+cache shared by the server processes, so no formula is rendered twice.
+
+Storing or using a file refreshes its modification time, and `prune` removes
+the files (and the index entries) not refreshed for `MATHEMA_ASSETS_MAX_AGE`
+seconds (7 days by default), so the store keeps only the recently used files.
+"""
+
+import disk_cache
+
+from hashlib import sha256
+from os import path, makedirs, replace
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from time import monotonic, time
+
+import os
+
+
+ASSETS_DIRECTORY = path.join(path.dirname(path.abspath(__file__)), path.pardir, "assets")
+ASSETS_URL = "/assets"
+MAX_AGE = float(os.environ.get("MATHEMA_ASSETS_MAX_AGE", str(7 * 24 * 60 * 60)))
+
+# The directories are scanned at most once per this many seconds.
+_PRUNE_INTERVAL = 60 * 60
+_PRUNED_DIRECTORIES = ("formulas", "worksheets")
+
+_last_prune_time: float | None = None
+_prune_lock = Lock()
+
+
+def _url_path(url: str) -> str:
+    return path.join(ASSETS_DIRECTORY, url.removeprefix(ASSETS_URL + "/").split("?")[0])
+
+
+def touch(url: str) -> bool:
+    """Refresh the modification time of the stored file, so it is not pruned.
+    Returns False if the file is not stored (anymore).
+    """
+
+    try:
+        os.utime(_url_path(url))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _store(content: bytes, directory_name: str, extension: str) -> str:
+    """Save the content under its hash in the given assets subdirectory.
+    Returns the URL of the file. The URL carries the hash as the `v`
+    argument, which makes the static route answer with a long-lived
+    `Cache-Control` header (the `ETag` header is always sent).
+    """
+
+    digest = sha256(content).hexdigest()[:32]
+    file_name = f"{digest}.{extension}"
+    directory = path.join(ASSETS_DIRECTORY, directory_name)
+    file_path = path.join(directory, file_name)
+
+    if not touch(f"{ASSETS_URL}/{directory_name}/{file_name}"):
+        makedirs(directory, exist_ok=True)
+
+        # Write to a temporary file first, so a concurrent request never
+        # gets a partially written file.
+        with NamedTemporaryFile(dir=directory, delete=False) as file:
+            file.write(content)
+        replace(file.name, file_path)
+
+    return f"{ASSETS_URL}/{directory_name}/{file_name}?v={digest}"
+
+
+def find_image(render_key: str) -> str | None:
+    """The URL of the image stored with the render key, if any."""
+
+    url = disk_cache.read("images", render_key)
+    if url is None:
+        return None
+
+    return url.decode() if touch(url.decode()) else None
+
+
+def store_image(image: bytes, render_key: str | None = None) -> str:
+    """Save a PNG image of a formula. Returns the URL of the image.
+    The render key (e.g. the formula and the rendering settings)
+    makes the image findable by `find_image`.
+    """
+
+    url = _store(image, "formulas", "png")
+
+    if render_key is not None:
+        url = disk_cache.write("images", render_key, url.encode()).decode()
+
+    return url
+
+
+def store_worksheet(worksheet: bytes) -> str:
+    """Save a PDF worksheet. Returns the URL of the worksheet."""
+
+    return _store(worksheet, "worksheets", "pdf")
+
+
+def prune() -> None:
+    """Remove the files and the index entries not refreshed for `MAX_AGE` seconds.
+    Does nothing if the store was pruned less than an hour ago.
+    """
+
+    global _last_prune_time
+
+    with _prune_lock:
+        if _last_prune_time is not None and monotonic() - _last_prune_time < _PRUNE_INTERVAL:
+            return
+        _last_prune_time = monotonic()
+
+    oldest_time = time() - MAX_AGE
+    num_of_removed = 0
+
+    for directory_name in _PRUNED_DIRECTORIES:
+        try:
+            entries = os.scandir(path.join(ASSETS_DIRECTORY, directory_name))
+        except FileNotFoundError:
+            continue
+
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime < oldest_time:
+                        os.remove(entry.path)
+                        num_of_removed += 1
+                except FileNotFoundError:
+                    pass
+
+    disk_cache.prune("images", MAX_AGE)
+
+    if num_of_removed:
+        print(f"Log (OK): removed {num_of_removed} unused assets.", flush=True)
@@ -0,0 +1,105 @@
+from generator.types import FormulaType, Interval, VariableNameType, VariableProperties
+
+from dataclasses import dataclass, field
+from threading import local
+from typing import Annotated, Callable, Iterable, Mapping
+
+import hyperdiv as hd
+
+
+@dataclass
+class PageSpec:
+    """Inputs of the sections of a generator page.
+    The sections record them while `discover_page_specs` renders the page,
+    so that the generator of the page can also run outside of it
+    (e.g. in the benchmarks and the worksheets).
+    """
+
+    variables_defaults: dict[
+        VariableNameType, tuple[
+            Annotated[str, "default from"],
+            Annotated[str, "default to"]
+        ]
+    ] = field(default_factory=dict)
+    fractions_avaliable: bool = True
+    extra_conditions: tuple[
+        tuple[
+            Annotated[str, "description"],
+            Annotated[str, "TeX formula"],
+            Annotated[FormulaType, "generator conditon"]
+        ], ...
+    ] = tuple()
+    default_conditions: tuple[FormulaType, ...] = tuple()
+    tex_formula: str = str()
+    answer_variables: dict[VariableNameType, FormulaType] = field(default_factory=dict)
+    proper_fraction_variables: dict[VariableNameType, bool] = field(default_factory=dict)
+    answer_tex_formula_generator: Callable[[Mapping[VariableNameType, str]], str] | None = None
+
+    def variables(self) -> dict[VariableNameType, VariableProperties]:
+        """Properties of the variables with the default intervals and no fractions."""
+
+        return {
+            variable_name: VariableProperties(
+                Interval(float(default_start), float(default_stop)), False, False
+            )
+            for variable_name, (default_start, default_stop) in self.variables_defaults.items()
+        }
+
+    def conditions(self, extra_conditions: Iterable[int] = tuple()) -> set[FormulaType]:
+        """The default conditions and the extra conditions with the given indices."""
+
+        return {
+            *self.default_conditions,
+            *(self.extra_conditions[i][2] for i in extra_conditions)
+        }
+
+
+_page_specs: dict[str, PageSpec] = {}
+# Set in the thread of `discover_page_specs` while it renders the pages.
+_discovery = local()
+
+
+def page_spec() -> PageSpec:
+    """The spec of the current page to record its inputs in, while
+    `discover_page_specs` renders it. Otherwise a new spec, which is
+    thrown away, so the renders of the sessions keep no global state.
+    """
+
+    if not getattr(_discovery, "active", False):
+        return PageSpec()
+
+    return _page_specs.setdefault(hd.location().path, PageSpec())
+
+
+def discover_page_specs(hrefs: Iterable[str]) -> dict[str, PageSpec]:
+    """Render each of the pages once outside of a browser session,
+    which records their specs. Returns the specs by the page href.
+    """
+
+    from hyperdiv.test_utils import MockManualRunner
+    import registrar
+
+    hrefs = list(hrefs)
+    _discovery.active = True
+
+    try:
+        for href in hrefs:
+            if href in _page_specs:
+                continue
+
+            MockManualRunner(
+                registrar.router.run,
+                initial_updates=[
+                    ("location", "path", href),
+                    ("location", "query_args", ""),
+                    ("location", "hash_arg", ""),
+                    ("theme", "mode", "light"),
+                    ("theme", "system_mode", "light"),
+                    ("window", "width", 1200),
+                    ("window", "height", 900),
+                ]
+            ).advance()
+    finally:
+        _discovery.active = False
+
+    return {href: _page_specs[href] for href in hrefs if href in _page_specs}
@@ -0,0 +1,178 @@
+"""Server-side storage of the generated results of the sessions.
+
+The generator state of a session keeps only a key into this storage, so the
+results of the idle sessions (e.g. classroom tabs left open all day) can be
+evicted from a background thread. An evicted result keeps the inputs and the
+seed of its generation, and is regenerated when the session comes back.
+
+Configured with the environment variables:
+
+* `MATHEMA_SESSION_IDLE_SECONDS` — the results of the sessions idle for
+  longer are evicted (1800 by default).
+* `MATHEMA_SESSION_MAX_BYTES` — the results larger than this are not stored
+  (4 MiB by default).
+* `MATHEMA_SESSION_SWEEP_INTERVAL` — seconds between the evictions (60 by default).
+
+The same background thread prunes the unused images and worksheets
+(see `image_store.prune`).
+"""
+
+from components import image_store
+from generator.types import FormulaType, Solution, VariableNameType, VariableProperties
+import metrics
+
+from dataclasses import dataclass, field
+from threading import Lock, Thread
+from time import monotonic, sleep
+from typing import Iterable
+
+import os
+import sys
+
+
+IDLE_SECONDS = float(os.environ.get("MATHEMA_SESSION_IDLE_SECONDS", "1800"))
+MAX_BYTES = int(os.environ.get("MATHEMA_SESSION_MAX_BYTES", str(4 * 1024 * 1024)))
+SWEEP_INTERVAL = float(os.environ.get("MATHEMA_SESSION_SWEEP_INTERVAL", "60"))
+
+# The inputs of the evicted results are forgotten too after this time,
+# as the sessions are most likely closed by then.
+_FORGET_SECONDS = 24 * 60 * 60
+
+
+@dataclass
+class GenerationResults:
+    """The results of a generation and everything needed to regenerate them."""
+
+    location: str
+    variables: dict[VariableNameType, VariableProperties]
+    conditions: frozenset[FormulaType]
+    num_of_solutions: int
+    answer_variables: dict[VariableNameType, FormulaType]
+    seed: int
+    solutions: list[Solution] | None
+    answers: list[Solution] | None
+    evicted: bool = False
+    size: int = 0
+    last_access: float = field(default_factory=monotonic)
+
+
+def _solutions_size(solutions: Iterable[Solution] | None) -> int:
+    """Approximate size of the solutions in bytes.
+    The variable names are shared between the solutions, so only the values count.
+    """
+
+    if solutions is None:
+        return 0
+
+    size = sys.getsizeof(solutions)
+    for solution in solutions:
+        size += sys.getsizeof(solution) + sys.getsizeof(dict(solution))
+        size += sum(sys.getsizeof(value) for value in solution.values())
+
+    return size
+
+
+_results: dict[str, GenerationResults] = {}
+_lock = Lock()
+
+
+def _report_size() -> None:
+    with _lock:
+        total_size = sum(results.size for results in _results.values())
+        num_of_results = sum(not results.evicted for results in _results.values())
+
+    metrics.set_gauge("mathema_session_results_bytes", total_size)
+    metrics.set_gauge("mathema_session_results", num_of_results)
+
+
+class ResultsTooLargeError(ValueError):
+    """The results are larger than `MAX_BYTES`."""
+
+
+def store(session_id: str, results: GenerationResults) -> None:
+    """Store the results of the session, replacing the previous ones.
+    Raises ResultsTooLargeError if the results are over the size cap,
+    then the previous results of the session are discarded.
+    """
+
+    results.size = _solutions_size(results.solutions) + _solutions_size(results.answers)
+    results.last_access = monotonic()
+
+    if results.size > MAX_BYTES:
+        discard(session_id)
+        metrics.increment("mathema_session_results_refused_total")
+        raise ResultsTooLargeError(
+            f"The results take {results.size} bytes, over the cap of {MAX_BYTES} bytes."
+        )
+
+    with _lock:
+        _results[session_id] = results
+
+    _report_size()
+
+
+def get(session_id: str) -> GenerationResults | None:
+    """The results of the session, if any. Marks the session as active."""
+
+    with _lock:
+        results = _results.get(session_id)
+        if results is not None:
+            results.last_access = monotonic()
+
+    return results
+
+
+def discard(session_id: str) -> None:
+    with _lock:
+        _results.pop(session_id, None)
+
+
+def evict_idle() -> None:
+    """Evict the results of the idle sessions."""
+
+    now = monotonic()
+    num_of_evicted = 0
+    evicted_size = 0
+
+    with _lock:
+        for session_id, results in list(_results.items()):
+            idle_time = now - results.last_access
+
+            if idle_time > _FORGET_SECONDS:
+                del _results[session_id]
+                continue
+            if results.evicted:
+                continue
+
+            if idle_time <= IDLE_SECONDS:
+                continue
+
+            num_of_evicted += 1
+            evicted_size += results.size
+
+            results.solutions = results.answers = None
+            results.evicted = True
+            results.size = 0
+
+    if evicted_size:
+        print(
+            f"Log (OK): evicted the results of {num_of_evicted} sessions "
+            f"({evicted_size / 1024:.0f} KiB).",
+            flush=True
+        )
+        metrics.increment("mathema_session_results_evicted_total", num_of_evicted, reason="idle")
+
+    _report_size()
+
+
+def _evict_periodically() -> None:
+    while True:
+        sleep(SWEEP_INTERVAL)
+        evict_idle()
+        image_store.prune()
+
+
+def start_evictor() -> None:
+    """Start the periodical eviction and pruning in a daemon thread."""
+
+    Thread(target=_evict_periodically, daemon=True).start()
@@ -0,0 +1,67 @@
+from generator.types import VariableNameType, VariableValueType
+
+from fractions import Fraction
+from functools import lru_cache
+from math import isfinite
+from typing import Iterable, Mapping
+
+
+# The TeX string of the values that are not numbers: failed evaluations
+# (reported as -inf by the generator), NaN and infinities.
+NOT_A_NUMBER = "NaN"
+
+
+def float_to_tex_proper_fraction(number: float) -> str:
+    fraction = Fraction(number).limit_denominator(100)
+
+    if fraction.denominator == 1:
+        return str(int(number))
+
+    return (
+        ("-" if fraction.numerator < 0 else "")
+        + r"\frac{"
+        + str(abs(fraction.numerator)) + r"}{"
+        + str(fraction.denominator) + r"}"
+    )
+
+
+@lru_cache(maxsize=65536)
+def _format_finite_number(number: VariableValueType, is_proper_fraction: bool) -> str:
+    if is_proper_fraction:
+        return float_to_tex_proper_fraction(number)
+    if number.is_integer():
+        return str(int(number))
+    return str(number)
+
+
+def format_number(number: VariableValueType, is_proper_fraction: bool) -> str:
+    """Convert a variable value to its TeX representation.
+    Finite values are memoized, since the generated values mostly are
+    small integers and fractions with small denominators.
+    """
+
+    # Non-finite values are checked before the cache lookup:
+    # NaN is not equal to itself and would never hit the cache.
+    if not isfinite(number):
+        return NOT_A_NUMBER
+
+    return _format_finite_number(number, is_proper_fraction)
+
+
+def solution_to_string_variables(
+    solution: Mapping[VariableNameType, VariableValueType],
+    proper: Mapping[VariableNameType, bool]
+) -> dict[VariableNameType, str]:
+    return {
+        variable_name: format_number(variable_value, proper[variable_name])
+        for variable_name, variable_value in solution.items()
+    }
+
+
+def solutions_to_string_variables(
+    solutions: Iterable[Mapping[VariableNameType, VariableValueType]],
+    proper: Mapping[VariableNameType, bool]
+) -> list[dict[VariableNameType, str]]:
+    """Convert the values of every solution to their TeX representations."""
+
+    return [solution_to_string_variables(solution, proper) for solution in solutions]
@@ -1,9 +1,19 @@
+from components.image_store import find_image, store_image, touch
+from components.tex_formatting import solutions_to_string_variables
 from generator.types import Solution, VariableNameType, VariableValueType
+import metrics
+import profiling
 
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from functools import lru_cache
-from fractions import Fraction
+from math import ceil
+import re
+from threading import Lock
+from time import perf_counter
 from typing import (
+    Annotated,
     Callable,
     Protocol,
     Sequence,
@@ -14,130 +24,220 @@ from typing import (
 )
 
 import hyperdiv as hd
-import matplotlib
-import matplotlib.pyplot as plt
 
 
-matplotlib.use("Agg")
-plt.rc("mathtext", fontset="cm")
+# matplotlib keeps global state (the rc parameters, the font and mathtext
+# caches), so renders from the prefetch thread and from the UI thread
+# must not interleave.
+render_lock = Lock()
+_prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tex-prefetch")
+
+SOLUTIONS_PER_PAGE = 20
 
 
 class TexImageGenerator(Protocol):
-    def __call__(self, tex_formula: str, pad_inches: float = 0.0) -> bytes: ...
+    """Renders a formula and returns the URL of the image."""
 
+    def __call__(self, tex_formula: str, pad_inches: float = 0.0) -> str: ...
 
-def tex_image(tex_formula: str, pad_inches: float = 0.0) -> bytes:
-    fig = plt.figure(dpi=650)
-    
-    color = "black" if hd.theme().is_light else "white"
-    fig.text(0, 0, f"${tex_formula}$", ha="center", va="center", color=color)
+    def prefetch(self, tex_formulas: Iterable[str]) -> None: ...
 
-    output = BytesIO()
 
-    fig.savefig(
-        output, transparent=True, format="png",
-        bbox_inches='tight', pad_inches=pad_inches
-    )
+@lru_cache(maxsize=None)
+def load_matplotlib() -> None:
+    """Import and configure matplotlib.
+    Importing it takes most of the startup time, so it is done on the first
+    render (or in the warm-up) rather than at import. Call under `render_lock`.
+    """
+
+    import matplotlib
+
+    matplotlib.use("Agg")
+    matplotlib.rcParams["mathtext.fontset"] = "cm"
+
+
+def warm_up() -> None:
+    """Load matplotlib and its mathtext fonts by rendering a formula,
+    so that the first user does not wait for it.
+    """
+
+    start_time = perf_counter()
+    tex_image(r"x^2 = \frac{1}{2}", is_light_theme=True)
+    warm_up_time = perf_counter() - start_time
+
+    print(f"Log (OK): rendering warmed up in {warm_up_time:.2f} s.", flush=True)
+    metrics.set_gauge("mathema_render_warm_up_seconds", warm_up_time)
+
+
+def tex_image(
+    tex_formula: str,
+    pad_inches: float = 0.0,
+    is_light_theme: bool | None = None
+) -> bytes:
+    if is_light_theme is None:
+        is_light_theme = hd.theme().is_light
+
+    start_time = perf_counter()
+
+    with render_lock:
+        load_matplotlib()
+        from matplotlib.figure import Figure
+
+        fig = Figure(dpi=650)
+
+        color = "black" if is_light_theme else "white"
+        fig.text(0, 0, f"${tex_formula}$", ha="center", va="center", color=color)
+
+        output = BytesIO()
+
+        fig.savefig(
+            output, transparent=True, format="png",
+            bbox_inches='tight', pad_inches=pad_inches
+        )
+
+        output.seek(0)
+        img = output.getvalue()
 
-    output.seek(0)
-    img = output.getvalue()
+        output.close()
 
-    output.close()
-    plt.close(fig)
+    metrics.observe("mathema_render_seconds", perf_counter() - start_time)
 
     return img
 
 
 def get_cached_image_generator() -> TexImageGenerator:
-    @lru_cache
-    def cached_image_generator(is_light_theme: bool, *args, **kwargs) -> bytes:
-        return tex_image(*args, **kwargs)
+    @lru_cache(maxsize=4096)
+    def cached_image_generator(
+        is_light_theme: bool,
+        tex_formula: str,
+        pad_inches: float = 0.0
+    ) -> str:
+        # Another server process may have rendered the formula already.
+        render_key = f"{is_light_theme}:{pad_inches}:{tex_formula}"
+        image = find_image(render_key)
+        if image is not None:
+            return image
 
-    def wrapper(*args, **kwargs) -> bytes:
-        return cached_image_generator(hd.theme().is_light, *args, **kwargs)
+        metrics.increment("mathema_image_cache_misses_total")
+        return store_image(tex_image(tex_formula, pad_inches, is_light_theme), render_key)
 
-    return wrapper
+    class CachedImageGenerator:
+        def __call__(self, tex_formula: str, pad_inches: float = 0.0) -> str:
+            is_light_theme = hd.theme().is_light
+            misses = cached_image_generator.cache_info().misses
+            image = cached_image_generator(is_light_theme, tex_formula, pad_inches)
 
+            if cached_image_generator.cache_info().misses == misses:
+                metrics.increment("mathema_image_cache_hits_total")
 
-def float_to_tex_proper_fraction(number: float) -> str:
-    fraction = Fraction(number).limit_denominator(100)
+                # The used images are kept in the store, the pruned ones are rendered again.
+                if not touch(image):
+                    cached_image_generator.cache_clear()
+                    image = cached_image_generator(is_light_theme, tex_formula, pad_inches)
 
-    if fraction.denominator == 1:
-        return str(int(number))
+            return image
 
-    return (
-        ("-" if fraction.numerator < 0 else "")
-        + r"\frac{"
-        + str(abs(fraction.numerator)) + r"}{"
-        + str(fraction.denominator) + r"}"
-    )
+        def prefetch(self, tex_formulas: Iterable[str]) -> None:
+            """Render the formulas in the background, so that the following
+            calls with the same formulas are served from the cache.
+            """
+
+            is_light_theme = hd.theme().is_light
+            tex_formulas = tuple(tex_formulas)
+
+            def render() -> None:
+                for tex_formula in tex_formulas:
+                    cached_image_generator(is_light_theme, tex_formula, 0.0)
+
+            _prefetch_executor.submit(render)
+
+    return CachedImageGenerator()
+
+
+def _signed(value: str) -> str:
+    return ("+" if not value.startswith("-") else "") + value
+
+
+# Macros of the TeX templates, applied to the string value of a variable.
+_MACROS: dict[str, Callable[[str], str]] = {
+    # Just variable value.
+    "VAR": lambda value: value,
+
+    # Variable value with brackets if negative.
+    "BVAR": lambda value: f"({value})" if value.startswith("-") else value,
+
+    # Variable value with "+" or "-" sign.
+    "SVAR": _signed,
+
+    # "-" if variable value is -1, "" if it is 1, otherwise variable value.
+    "CVAR": lambda value: "-" if value == "-1" else ("" if value == "1" else value),
+
+    # "-" if variable value is -1, "+" if it is 1, otherwise variable value with "+" or "-" sign.
+    "CSVAR": lambda value: "-" if value == "-1" else ("+" if value == "1" else _signed(value)),
+}
+_MACRO_PATTERN = re.compile(r"\\(" + "|".join(_MACROS) + r")\{([^{}]+)\}")
+
+CompiledTexTemplate: TypeAlias = tuple[
+    Annotated[tuple[str, ...], "literals"],
+    Annotated[tuple[tuple[Callable[[str], str], VariableNameType], ...], "macro slots"]
+]
+
+
+@lru_cache(maxsize=1024)
+def compile_tex_template(tex_formula: str) -> CompiledTexTemplate:
+    """Split a TeX template into literal parts and macro slots.
+    There is always one literal more than slots: the template is
+    literals[0] + slot[0] + literals[1] + ... + slot[-1] + literals[-1].
+    """
+
+    literals: list[str] = []
+    slots: list[tuple[Callable[[str], str], VariableNameType]] = []
+    position = 0
+
+    for match in _MACRO_PATTERN.finditer(tex_formula):
+        literals.append(tex_formula[position:match.start()])
+        slots.append((_MACROS[match[1]], match[2]))
+        position = match.end()
+
+    literals.append(tex_formula[position:])
+
+    return tuple(literals), tuple(slots)
+
+
+def _substitute(
+    compiled_template: CompiledTexTemplate,
+    variables: Mapping[VariableNameType, str]
+) -> str:
+    literals, slots = compiled_template
+
+    parts: list[str] = [literals[0]]
+
+    for (macro, variable_name), literal in zip(slots, literals[1:]):
+        parts.append(macro(variables[variable_name]))
+        parts.append(literal)
+
+    return "".join(parts)
 
 
 def replace_vars_in_formula(
     tex_formula: str,
     variables: Mapping[VariableNameType, str]
 ) -> str:
-    macros: dict[str, Callable[[str], str]] = {
-        # Just variable value.
-        "VAR": lambda var_name: variables[var_name],
-        
-        # Variable value with brackets if negative.
-        "BVAR": (
-            lambda var_name: (
-                f"({variables[var_name]})"
-                if variables[var_name].startswith("-")
-                else variables[var_name]
-            )
-        ),
+    return _substitute(compile_tex_template(tex_formula), variables)
 
-        # Variable value with "+" or "-" sign.
-        "SVAR": (
-            lambda var_name: (
-                ("+" if not variables[var_name].startswith("-") else "")
-                + variables[var_name]
-            )
-        ),
-        
-        # "-" if variable value is -1, "" if it is 1, otherwise variable value.
-        "CVAR": (
-            lambda var_name: (
-                "-" if variables[var_name] == "-1" else (
-                    "" if variables[var_name] == "1" else variables[var_name]
-                )
-            )
-        ),
-        
-        # "-" if variable value is -1, "+" if it is 1, otherwise variable value with "+" or "-" sign.
-        "CSVAR": (
-            lambda var_name: (
-                (
-                    "-" if variables[var_name] == "-1" else (
-                        "+" if variables[var_name] == "1" else (
-                            ("+" if not variables[var_name].startswith("-") else "")
-                            + variables[var_name]
-                        )
-                    )
-                )
-            )
-        )
-    }
 
-    output_formula = tex_formula
-
-    for macro_name, macro in macros.items():
-        parts = output_formula.split("\\" + macro_name + "{")
-        result: list[str] = [parts[0]]
-        
-        for part in parts[1:]:
-            variable_name, rest = part[0], part[2:]
-            result.extend((macro(variable_name), rest))
+def replace_vars_in_formulas(
+    tex_formula: str,
+    variables_list: Iterable[Mapping[VariableNameType, str]]
+) -> list[str]:
+    """Substitute the variables of every solution into the same template."""
 
-        output_formula = "".join(result)
+    compiled_template = compile_tex_template(tex_formula)
 
-    return output_formula
+    return [_substitute(compiled_template, variables) for variables in variables_list]
 
 
-def two_column_images(images: Sequence[bytes], dividers: bool) -> None:
+def two_column_images(images: Sequence[str], dividers: bool) -> None:
     if dividers:
         with hd.box(width="100%", margin_bottom=1):
             hd.divider()
@@ -163,42 +263,112 @@ def two_column_images(images: Sequence[bytes], dividers: bool) -> None:
                                 hd.image(image, height=2, margin_top=1.25)
 
 
-def solution_to_string_variables(
-    solution: Mapping[VariableNameType, VariableValueType],
-    proper: Mapping[VariableNameType, bool]
-) -> dict[VariableNameType, str]:
-    variables: dict[VariableNameType, str] = {}
+def pagination(page: int, num_of_pages: int) -> int:
+    """A component for switching between the pages of the solutions.
+    Consists of the previous/next page buttons and the current page label.
+    Returns the selected page.
+    """
 
-    for variable_name, variable_value in solution.items():
-        if variable_value == float("-inf"):
-            variables[variable_name] = "NaN"
-        elif proper[variable_name]:
-            variables[variable_name] = float_to_tex_proper_fraction(variable_value)
-        elif variable_value.is_integer():
-            variables[variable_name] = str(int(variable_value))
-        else:
-            variables[variable_name] = str(variable_value)
+    with hd.hbox(gap=2, margin_top=2, align="center", justify="center"):
+        previous_button = hd.button(
+            "<", pill=True, size="small", disabled=page == 0
+        )
+        hd.text(f"Сторінка {page + 1} з {num_of_pages}")
+        next_button = hd.button(
+            ">", pill=True, size="small", disabled=page == num_of_pages - 1
+        )
 
-    return variables
+    if previous_button.clicked and page > 0:
+        page -= 1
+    elif next_button.clicked and page < num_of_pages - 1:
+        page += 1
+
+    return page
+
+
+def get_memory_image_generator(maxsize: int) -> TexImageGenerator:
+    """An image generator, which keeps at most `maxsize` images in memory
+    and returns them as data URLs, instead of storing them in the assets.
+    For the formulas written by the users, which would fill the disk.
+    """
+
+    @lru_cache(maxsize=maxsize)
+    def memory_image_generator(
+        is_light_theme: bool,
+        tex_formula: str,
+        pad_inches: float = 0.0
+    ) -> str:
+        image = tex_image(tex_formula, pad_inches, is_light_theme)
+        return "data:image/png;base64," + b64encode(image).decode()
+
+    class MemoryImageGenerator:
+        def __call__(self, tex_formula: str, pad_inches: float = 0.0) -> str:
+            return memory_image_generator(hd.theme().is_light, tex_formula, pad_inches)
+
+        def prefetch(self, tex_formulas: Iterable[str]) -> None:
+            is_light_theme = hd.theme().is_light
+            tex_formulas = tuple(tex_formulas)
+
+            def render() -> None:
+                for tex_formula in tex_formulas:
+                    memory_image_generator(is_light_theme, tex_formula, 0.0)
+
+            _prefetch_executor.submit(render)
+
+    return MemoryImageGenerator()
 
 
 def show_solutions(
-    solutions: Iterable[Mapping[VariableNameType, VariableValueType]],
+    solutions: Sequence[Mapping[VariableNameType, VariableValueType]],
     proper: Mapping[VariableNameType, bool],
     tex_formula_generator: Callable[[Mapping[VariableNameType, str]], str],
     image_generator: TexImageGenerator,
     dividers: bool = True
 ) -> None:
-    solutions_tuple = tuple(solutions)
-    images: list[bytes] = []
+    """Display the solutions page by page.
+    Only the images of the current page are rendered and sent to the client,
+    the images of the next page are prefetched in the background.
+    """
 
-    for i, solution in enumerate(solutions_tuple):
-        variables = solution_to_string_variables(solution, proper)
+    start_time = perf_counter()
 
-        image = image_generator(
+    def solution_tex_formulas(start: int, stop: int) -> list[str]:
+        return [
             str(i + 1) + r") \; " + tex_formula_generator(variables)
-        )
+            for i, variables in enumerate(
+                solutions_to_string_variables(solutions[start:stop], proper),
+                start
+            )
+        ]
+
+    page_state = hd.state(page=0, solutions_id=None)
+    num_of_pages = max(ceil(len(solutions) / SOLUTIONS_PER_PAGE), 1)
+
+    if page_state.solutions_id != id(solutions):
+        page_state.solutions_id = id(solutions)
+        page_state.page = 0
+
+    if num_of_pages > 1:
+        page_state.page = pagination(min(page_state.page, num_of_pages - 1), num_of_pages)
 
-        images.append(image)
+    start = page_state.page * SOLUTIONS_PER_PAGE
+    stop = start + SOLUTIONS_PER_PAGE
+    location = hd.location().path
 
-    two_column_images(images, dividers)
+    with profiling.profiled(
+        "show_solutions", location,
+        solutions=len(solutions), page=page_state.page + 1
+    ):
+        images = [
+            image_generator(tex_formula)
+            for tex_formula in solution_tex_formulas(start, stop)
+        ]
+
+        two_column_images(images, dividers)
+
+        if stop < len(solutions):
+            image_generator.prefetch(solution_tex_formulas(stop, stop + SOLUTIONS_PER_PAGE))
+
+    metrics.observe(
+        "mathema_show_solutions_seconds", perf_counter() - start_time, page=location
+    )
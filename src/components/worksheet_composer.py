@@ -0,0 +1,312 @@
+"""Worksheets mixing the problems of several generator pages.
+
+A worksheet is composed of parts, e.g. 10 additions, 5 linear equations and
+5 quadratic equations, each with the settings of its page. The parts are
+requests of the session to the generation scheduler, so they go through its
+admission control like the requests of the generator pages: the parts with
+cached pools are served at once, the others wait for their turn in the queue.
+At most `MAX_PARTS_IN_FLIGHT` parts of a worksheet are submitted at once, so
+a large worksheet does not take all the generation slots from the other
+sessions. Every part is typeset as soon as its generation finishes.
+
+The problems are numbered through the whole worksheet, and the answer key
+follows them with the same numbers.
+"""
+
+from components.components import GeneratorState, get_answers
+from components.image_store import store_worksheet
+from components.page_specs import PageSpec, discover_page_specs
+from components.tex_formatting import solutions_to_string_variables
+from components.tex_image_generator import replace_vars_in_formulas
+from components.worksheet_export import worksheet_pdf
+from generator.scheduler import GenerationResultType, scheduler
+from generator.types import (
+    GenerationTask,
+    Interval,
+    Solution,
+    VariableNameType,
+    VariableProperties
+)
+import metrics
+import registrar
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass, field
+from random import getrandbits
+from threading import Event
+from time import perf_counter
+from typing import Annotated, Hashable, Iterable, Mapping, Sequence
+from uuid import uuid4
+
+import asyncio
+
+import hyperdiv as hd
+
+
+# The same as the maximum of the number of solutions on the generator pages.
+MAX_SOLUTIONS_PER_PART = 1000
+# The sections of the pages, which are not generator pages.
+NOT_GENERATOR_SECTIONS = ("/worksheets/", "/custom/")
+MAX_PARTS_IN_FLIGHT = 2
+
+
+@dataclass(frozen=True)
+class WorksheetPart:
+    """The problems of one generator page in a worksheet."""
+
+    # The href of a registered generator page, e.g. "/basic_arithmetic/addition".
+    page: str
+    num_of_solutions: int
+    # The intervals of the variables, the defaults of the page for the others.
+    intervals: Mapping[VariableNameType, tuple[float, float]] = field(default_factory=dict)
+    # The indices of the checked extra conditions of the page.
+    extra_conditions: tuple[int, ...] = tuple()
+    proper_fractions: frozenset[VariableNameType] = frozenset()
+    decimal_fractions: frozenset[VariableNameType] = frozenset()
+
+    def variables(self, spec: PageSpec) -> dict[VariableNameType, VariableProperties]:
+        variables = spec.variables()
+
+        for variable_name, properties in variables.items():
+            if variable_name in self.intervals:
+                properties.interval = Interval(*map(float, self.intervals[variable_name]))
+            properties.is_proper_fraction = variable_name in self.proper_fractions
+            properties.is_decimal_fraction = variable_name in self.decimal_fractions
+
+        return variables
+
+
+def _tex_formulas(
+    spec: PageSpec,
+    variables: Mapping[VariableNameType, VariableProperties],
+    solutions: Sequence[Solution]
+) -> tuple[
+    Annotated[list[str], "problems"],
+    Annotated[list[str], "answers"]
+]:
+    """The TeX formulas of the problems and the answers of the part, not numbered yet."""
+
+    proper = {
+        variable_name: properties.is_proper_fraction
+        for variable_name, properties in variables.items()
+    }
+
+    tex_formulas = replace_vars_in_formulas(
+        spec.tex_formula, solutions_to_string_variables(solutions, proper)
+    )
+
+    answers = get_answers(list(solutions), spec.answer_variables) or []
+    if spec.answer_tex_formula_generator is None:
+        return tex_formulas, []
+
+    answers_proper = {**spec.proper_fraction_variables, **proper}
+    answer_tex_formulas = [
+        spec.answer_tex_formula_generator(answer_variables)
+        for answer_variables in solutions_to_string_variables(answers, answers_proper)
+    ]
+
+    return tex_formulas, answer_tex_formulas
+
+
+def compose_worksheet(
+    parts: Iterable[WorksheetPart],
+    session: Hashable | None = None,
+    cancel_event: Event | None = None
+) -> str | None:
+    """Generate the problems of the parts and typeset them, with the answer key,
+    into one PDF worksheet. The parts are requests of the `session` (a new one
+    by default) to the generation scheduler.
+    Returns the URL of the worksheet, or None if the problems of a part
+    cannot be generated or `cancel_event` is set meanwhile.
+    Raises ValueError for a part of a page which is not a generator page.
+    """
+
+    start_time = perf_counter()
+    parts = [part for part in parts if part.num_of_solutions > 0]
+    if session is None:
+        session = uuid4().hex
+    if cancel_event is None:
+        cancel_event = Event()
+
+    specs = discover_page_specs({part.page for part in parts})
+    for part in parts:
+        if part.page not in specs:
+            raise ValueError(f"{part.page} is not a generator page.")
+
+    part_variables = [part.variables(specs[part.page]) for part in parts]
+    not_submitted = deque(range(len(parts)))
+    futures: dict[Future[GenerationResultType], int] = {}
+    part_formulas: dict[int, tuple[list[str], list[str]]] = {}
+
+    try:
+        while not_submitted or futures:
+            if cancel_event.is_set():
+                return None
+
+            while not_submitted and len(futures) < MAX_PARTS_IN_FLIGHT:
+                i = not_submitted.popleft()
+                spec = specs[parts[i].page]
+
+                # Every part is a separate request, as the scheduler keeps one request per session.
+                future = scheduler.submit(
+                    (session, i),
+                    part_variables[i],
+                    frozenset(spec.conditions(parts[i].extra_conditions)),
+                    parts[i].num_of_solutions,
+                    parts[i].page,
+                    getrandbits(64),
+                    cancel_event,
+                    spec.answer_variables
+                )
+                futures[future] = i
+
+            done, _ = wait(futures, timeout=0.25, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = futures.pop(future)
+                solutions, _ = future.result()
+
+                if not solutions:
+                    return None
+
+                part_formulas[i] = _tex_formulas(specs[parts[i].page], part_variables[i], list(solutions))
+    finally:
+        # The generations of the other parts are not needed, if one fails.
+        cancel_event.set()
+
+    tex_formulas: list[str] = []
+    answer_tex_formulas: list[str] = []
+
+    for i in range(len(parts)):
+        problems, answers = part_formulas[i]
+
+        for j, tex_formula in enumerate(problems):
+            number = len(tex_formulas) + 1
+            tex_formulas.append(str(number) + r") \; " + tex_formula)
+
+            if j < len(answers):
+                answer_tex_formulas.append(str(number) + r") \; " + answers[j])
+
+    worksheet = store_worksheet(worksheet_pdf((
+        ("Приклади", tex_formulas),
+        ("Відповіді", answer_tex_formulas)
+    )))
+
+    metrics.observe("mathema_worksheet_compose_seconds", perf_counter() - start_time)
+
+    return worksheet
+
+
+async def _compose_with_all_conditions(
+    entries: tuple[
+        tuple[
+            Annotated[str, "page"],
+            Annotated[int, "number of solutions"],
+            Annotated[bool, "all extra conditions"]
+        ], ...
+    ],
+    compose_task: GenerationTask
+) -> str | None:
+    # The state of the session is read on the ioloop, the composition runs in a thread.
+    cancel_event = compose_task.cancel_event
+    state = GeneratorState()
+    if not state.session_id:
+        state.session_id = uuid4().hex
+    specs = discover_page_specs(page for page, _, _ in entries)
+
+    parts = [
+        WorksheetPart(
+            page, num_of_solutions,
+            extra_conditions=(
+                tuple(range(len(specs[page].extra_conditions)))
+                if all_extra_conditions and page in specs else tuple()
+            )
+        )
+        for page, num_of_solutions, all_extra_conditions in entries
+    ]
+
+    return await asyncio.to_thread(
+        compose_worksheet, parts, ("worksheet", state.session_id), cancel_event
+    )
+
+
+def _num_of_solutions(text_input: hd.text_input) -> int:
+    value = text_input.value.strip()
+    if not value.isdigit():
+        return 0
+
+    return min(int(value), MAX_SOLUTIONS_PER_PART)
+
+
+def worksheet_composer_section() -> None:
+    """A component for composing a worksheet of the problems of several generator pages.
+    Consists of an input of the number of problems and a checkbox for all the extra
+    conditions for each page, and a button for composing the worksheet,
+    with a download link once it is ready.
+    """
+
+    hd.h3("Склад аркуша", margin_top=1.5, margin_bottom=1)
+
+    location = hd.location().path
+    entries = []
+
+    for i, page in enumerate(registrar.get_page_hrefs()):
+        names = registrar.get_names(page)
+        if page == location or names is None or page.startswith(NOT_GENERATOR_SECTIONS):
+            continue
+
+        section_name, page_name = names
+
+        with hd.scope(i):
+            with hd.hbox(gap=1, margin_top=0.75, align="center", justify="space-between", width="100%"):
+                hd.text(f"{section_name} — {page_name}")
+
+                with hd.hbox(gap=1, align="center"):
+                    num_input = hd.text_input(
+                        placeholder="0", width=6, input_type="number",
+                        no_spin_buttons=True, size="small"
+                    )
+                    conditions_checkbox = hd.checkbox("Усі додаткові умови")
+
+        num_of_solutions = _num_of_solutions(num_input)
+        if num_of_solutions:
+            entries.append((page, num_of_solutions, conditions_checkbox.checked))
+
+    # The task of the generator pages, so leaving the page cancels the composition (see `main`).
+    compose_task = GenerationTask()
+    compose_state = hd.state(entries=None)
+
+    if compose_state.entries != entries:
+        compose_state.entries = entries
+        compose_task.clear()
+
+    with hd.hbox(gap=2, align="center", justify="center", margin_top=2, margin_bottom=3):
+        compose_btn = hd.button(
+            "Скласти аркуш", loading=compose_task.running, disabled=not entries
+        )
+
+        if compose_task.done and compose_task.result:
+            hd.link("Завантажити PDF", href=compose_task.result, target="_blank")
+
+    if compose_task.done and compose_task.result is None:
+        hd.text(
+            "Неможливо згенерувати достатньо унікальних прикладів для однієї зі сторінок.",
+            font_color=hd.Color.danger
+        )
+    if compose_task.error:
+        hd.text("Не вдалося скласти аркуш.", font_color=hd.Color.danger)
+
+    admission = hd.state(rejected=False)
+
+    if compose_btn.clicked and not compose_task.running:
+        # Past the bound of the generation queue, the new requests are not admitted.
+        admission.rejected = scheduler.full
+
+        if not admission.rejected:
+            compose_task.rerun(_compose_with_all_conditions, tuple(entries), compose_task)
+
+    if admission.rejected:
+        hd.text(
+            "Сервер зараз перевантажений. Спробуйте скласти аркуш трохи пізніше.",
+            font_color=hd.Color.danger
+        )
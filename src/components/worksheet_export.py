@@ -0,0 +1,71 @@
+from components.tex_image_generator import load_matplotlib, render_lock
+
+from io import BytesIO
+from typing import TYPE_CHECKING, Annotated, Iterable, Sequence
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+
+# A4 portrait, in inches.
+_PAGE_SIZE = (8.27, 11.69)
+_MARGIN = 0.07
+_TITLE_HEIGHT = 0.05
+_ROWS_PER_COLUMN = 24
+_FONT_SIZE = 12
+
+
+def _draw_page(figure: "Figure", title: str, tex_formulas: Sequence[str]) -> None:
+    """Place the title and up to two columns of formulas on the page.
+    The formulas fill the left column first, then the right one.
+    """
+
+    figure.text(0.5, 1 - _MARGIN, title, ha="center", va="top", fontsize=_FONT_SIZE + 4)
+
+    top = 1 - _MARGIN - _TITLE_HEIGHT
+    row_height = (top - _MARGIN) / _ROWS_PER_COLUMN
+    column_width = (1 - 2 * _MARGIN) / 2
+
+    for i, tex_formula in enumerate(tex_formulas):
+        column, row = divmod(i, _ROWS_PER_COLUMN)
+        figure.text(
+            _MARGIN + column * column_width, top - row * row_height,
+            f"${tex_formula}$", ha="left", va="top", fontsize=_FONT_SIZE
+        )
+
+
+def worksheet_pdf(
+    sections: Iterable[
+        tuple[
+            Annotated[str, "section title"],
+            Annotated[Sequence[str], "TeX formulas"]
+        ]
+    ]
+) -> bytes:
+    """Typeset the sections of a worksheet (e.g. examples and answers)
+    into a single vector PDF document. Every section starts on a new page.
+    Returns the PDF bytes.
+    """
+
+    with render_lock:
+        load_matplotlib()
+        from matplotlib.backends.backend_pdf import PdfPages
+        from matplotlib.figure import Figure
+
+    formulas_per_page = 2 * _ROWS_PER_COLUMN
+    output = BytesIO()
+
+    with PdfPages(output) as pdf:
+        for title, tex_formulas in sections:
+            for start in range(0, max(len(tex_formulas), 1), formulas_per_page):
+                # Figures are drawn one page at a time, so the UI thread
+                # never waits for the whole document to be typeset.
+                with render_lock:
+                    figure = Figure(figsize=_PAGE_SIZE)
+                    _draw_page(figure, title, tex_formulas[start:start + formulas_per_page])
+                    pdf.savefig(figure)
+
+    worksheet = output.getvalue()
+    output.close()
+
+    return worksheet
@@ -0,0 +1,109 @@
+"""On-disk cache shared by the server processes.
+
+The entries are files named by the hash of their key, in a subdirectory per
+namespace of `MATHEMA_CACHE_DIR` (`src/cache` by default). The entries are
+written once: when several processes compute the same entry concurrently,
+the first written one is kept and returned to all of them. The entries older
+than the `max_age` of the reader are missing for it, and are replaced when
+written again.
+"""
+
+from hashlib import sha256
+from tempfile import NamedTemporaryFile
+from time import time
+
+import os
+import shutil
+
+
+CACHE_DIRECTORY = os.environ.get(
+    "MATHEMA_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+)
+
+
+def _entry_path(namespace: str, key: str) -> str:
+    return os.path.join(CACHE_DIRECTORY, namespace, sha256(key.encode()).hexdigest()[:32])
+
+
+def read(namespace: str, key: str, max_age: float | None = None) -> bytes | None:
+    """The content of the entry, or None if there is no such entry,
+    or it is older than `max_age` seconds.
+    """
+
+    try:
+        with open(_entry_path(namespace, key), "rb") as file:
+            if max_age is not None and os.fstat(file.fileno()).st_mtime < time() - max_age:
+                return None
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+def write(namespace: str, key: str, content: bytes, max_age: float | None = None) -> bytes:
+    """Write the entry, unless it is already written (and not older than
+    `max_age` seconds).
+    Returns the content of the entry, which is the given content
+    or the content written first by another process.
+    """
+
+    entry_path = _entry_path(namespace, key)
+    directory = os.path.dirname(entry_path)
+    os.makedirs(directory, exist_ok=True)
+
+    # Write to a temporary file first, then link it to the entry path,
+    # which fails if the entry exists, so a partial entry is never read.
+    with NamedTemporaryFile(dir=directory, delete=False) as file:
+        file.write(content)
+
+    try:
+        os.link(file.name, entry_path)
+    except FileExistsError:
+        existing = read(namespace, key, max_age)
+        if existing is not None:
+            return existing
+
+        # The entry has expired, replace it.
+        os.replace(file.name, entry_path)
+    finally:
+        try:
+            os.remove(file.name)
+        except FileNotFoundError:
+            pass
+
+    return content
+
+
+def remove_namespaces(prefix: str, keep: str) -> None:
+    """Remove the namespaces starting with the prefix, except `keep`
+    (e.g. the ones of the previous versions).
+    """
+
+    try:
+        names = os.listdir(CACHE_DIRECTORY)
+    except FileNotFoundError:
+        return
+
+    for name in names:
+        if name.startswith(prefix) and name != keep:
+            shutil.rmtree(os.path.join(CACHE_DIRECTORY, name), ignore_errors=True)
+
+
+def prune(namespace: str, max_age: float) -> None:
+    """Remove the entries older than `max_age` seconds."""
+
+    directory = os.path.join(CACHE_DIRECTORY, namespace)
+    oldest_time = time() - max_age
+
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return
+
+    with entries:
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < oldest_time:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -1,6 +1,10 @@
 from math import isqrt
 
 
+# The largest integer power `bounded_power` computes, in bits.
+MAX_POWER_BITS = 1024
+
+
 def is_square(n: float) -> bool:
     if not n.is_integer():
         return False
@@ -8,3 +12,23 @@ def is_square(n: float) -> bool:
     i = abs(int(n))
     k = isqrt(i)
     return i == k * k
+
+
+def bounded_power(base: float, exponent: float) -> float:
+    """`base ** exponent`, refusing the integer powers above `MAX_POWER_BITS`
+    bits (e.g. `10 ** 10 ** 8`), which would take minutes to compute,
+    and the complex results (e.g. `(-1) ** 0.5`).
+    The float powers overflow by themselves.
+    """
+
+    if (
+        isinstance(base, int) and isinstance(exponent, int)
+        and exponent > 0 and abs(base) > 1
+        and (abs(base).bit_length() - 1) * exponent > MAX_POWER_BITS
+    ):
+        raise OverflowError("integer power too large")
+
+    power = base ** exponent
+    if isinstance(power, complex):
+        raise ValueError("complex power")
+    return power
@@ -0,0 +1,405 @@
+"""Compiler of the generator conditions into one fused predicate.
+
+The conditions of a page repeat their subexpressions (e.g. the discriminant
+`b*b - 4*a*c` and its square root in the quadratic equations), and every
+condition is evaluated separately on every attempt. The compiler parses all
+the conditions, folds the constant subexpressions and computes each
+repeated subexpression only once, at its first evaluation, with an
+assignment expression (`:=`). The later uses read the assigned temporary,
+if the first evaluation is guaranteed to happen before them, i.e. it is not
+skipped by a short-circuiting `and`/`or`, a conditional expression or
+a chained comparison.
+
+The predicate returns the index of the first unsatisfied condition, or -1.
+It gives the same results as evaluating the conditions one by one with
+`generator.evaluate`: when a condition raises an exception, the attempt is
+evaluated again that way, and complex results are truthy, as `evaluate`
+turns them into -inf.
+
+The answer formulas can be compiled into the predicate too, which then
+returns the answers of the accepted values instead of -1, computed the same
+as `round(evaluate(answer, values), 4)`, but reusing the subexpressions
+computed by the conditions (e.g. the discriminant). The squares of the
+integer variables are written as products (`b**2` as `b*b`), so that they
+are shared with the conditions written either way. This is exact for the
+integers only: `x**2` and `x*x` may differ in the last bit for floats.
+"""
+
+from generator import _generator_builtins
+from generator.types import FormulaType, VariableNameType, VariableValueType
+
+from functools import lru_cache
+from typing import Any, Callable, TypeAlias
+
+import ast
+
+
+PredicateType: TypeAlias = Callable[..., int | tuple[Any, ...]]
+EvaluateType: TypeAlias = Callable[[FormulaType, dict[VariableNameType, VariableValueType]], object]
+
+_TEMPORARY_PREFIX = "_cse_"
+
+# Functions without side effects, which can be called once for several uses.
+_PURE_FUNCTIONS = frozenset(("is_square", "abs", "round", "int", "float"))
+_PURE_METHODS = frozenset(("is_integer",))
+
+
+def _is_pure(node: ast.expr) -> bool:
+    """Whether the expression has no side effects and no short-circuiting."""
+
+    match node:
+        case ast.Name() | ast.Constant():
+            return True
+        case ast.BinOp(left=left, right=right):
+            return _is_pure(left) and _is_pure(right)
+        case ast.UnaryOp(operand=operand):
+            return _is_pure(operand)
+        case ast.Compare(left=left, comparators=[comparator]):
+            return _is_pure(left) and _is_pure(comparator)
+        case ast.Call(func=ast.Name(id=name), args=args, keywords=[]):
+            return name in _PURE_FUNCTIONS and all(map(_is_pure, args))
+        case ast.Call(func=ast.Attribute(value=value, attr=attr), args=[], keywords=[]):
+            return attr in _PURE_METHODS and _is_pure(value)
+
+    return False
+
+
+def _is_worth_reusing(node: ast.expr) -> bool:
+    """Whether computing the expression costs more than reading a temporary."""
+
+    match node:
+        case ast.Name() | ast.Constant():
+            return False
+        case ast.UnaryOp(operand=ast.Name() | ast.Constant()):
+            return False
+
+    return _is_pure(node)
+
+
+def _key(node: ast.expr) -> str:
+    return ast.dump(node, annotate_fields=False, include_attributes=False)
+
+
+class _ConstantFolder(ast.NodeTransformer):
+    """Replace the arithmetic on constants with its result."""
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.expr:
+        self.generic_visit(node)
+        return self._fold(node, isinstance(node.left, ast.Constant) and isinstance(node.right, ast.Constant))
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.expr:
+        self.generic_visit(node)
+        return self._fold(node, isinstance(node.operand, ast.Constant))
+
+    @staticmethod
+    def _fold(node: ast.expr, is_constant: bool) -> ast.expr:
+        if not is_constant:
+            return node
+
+        try:
+            value = eval(compile(ast.Expression(node), "<constant>", "eval"), {})
+        except Exception:
+            # E.g. division by zero, which must still raise when evaluated.
+            return node
+
+        return ast.copy_location(ast.Constant(value), node)
+
+
+class _SquareExpander(ast.NodeTransformer):
+    """Write the squares of the integer variables as products."""
+
+    def __init__(self, integer_names: frozenset[VariableNameType]) -> None:
+        self.integer_names = integer_names
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.expr:
+        self.generic_visit(node)
+
+        match node:
+            case ast.BinOp(
+                left=ast.Name(id=name), op=ast.Pow(), right=ast.Constant(value=2)
+            ) if name in self.integer_names and type(node.right.value) is int:
+                return ast.copy_location(
+                    ast.BinOp(ast.Name(name, ast.Load()), ast.Mult(), ast.Name(name, ast.Load())),
+                    node
+                )
+
+        return node
+
+
+class _CommonSubexpressionEliminator:
+    """Rewrites the conditions in their evaluation order, keeping track
+    of the temporaries, which are assigned on every path to the current node.
+    """
+
+    def __init__(self, repeated: set[str]) -> None:
+        self.repeated = repeated
+        self.temporaries: dict[str, str] = {}
+
+    def temporary(self, key: str) -> str:
+        if key not in self.temporaries:
+            self.temporaries[key] = f"{_TEMPORARY_PREFIX}{len(self.temporaries)}"
+        return self.temporaries[key]
+
+    def rewrite(
+        self,
+        node: ast.expr,
+        assigned: frozenset[str]
+    ) -> tuple[ast.expr, frozenset[str], frozenset[str]]:
+        """Returns the rewritten node, the temporaries assigned after it is
+        evaluated, and the temporaries assigned after it is evaluated to a truthy value.
+        """
+
+        key = _key(node) if _is_worth_reusing(node) else None
+
+        if key is not None and key in assigned:
+            return ast.Name(self.temporaries[key], ast.Load()), assigned, assigned
+
+        new_node, after, after_true = self._rewrite_children(node, assigned)
+
+        if key is not None and key in self.repeated:
+            new_node = ast.NamedExpr(ast.Name(self.temporary(key), ast.Store()), new_node)
+            after, after_true = after | {key}, after_true | {key}
+
+        return new_node, after, after_true
+
+    def _rewrite_children(
+        self,
+        node: ast.expr,
+        assigned: frozenset[str]
+    ) -> tuple[ast.expr, frozenset[str], frozenset[str]]:
+        match node:
+            case ast.BoolOp(op=ast.And(), values=values):
+                new_values = []
+                after_first = after_true = assigned
+
+                for i, value in enumerate(values):
+                    # A value is evaluated only if the previous ones are truthy.
+                    new_value, after, after_true = self.rewrite(value, after_true)
+                    new_values.append(new_value)
+                    if i == 0:
+                        after_first = after
+
+                return ast.BoolOp(ast.And(), new_values), after_first, after_true
+
+            case ast.BoolOp(op=ast.Or(), values=values):
+                new_values = []
+                after_first = after_all = assigned
+
+                for i, value in enumerate(values):
+                    # A value is evaluated only if the previous ones are falsy.
+                    new_value, after_all, _ = self.rewrite(value, after_all)
+                    new_values.append(new_value)
+                    if i == 0:
+                        after_first = after_all
+
+                return ast.BoolOp(ast.Or(), new_values), after_first, after_first
+
+            case ast.UnaryOp(op=op, operand=operand):
+                new_operand, after, _ = self.rewrite(operand, assigned)
+                return ast.UnaryOp(op, new_operand), after, after
+
+            case ast.BinOp(left=left, op=op, right=right):
+                new_left, after, _ = self.rewrite(left, assigned)
+                new_right, after, _ = self.rewrite(right, after)
+                return ast.BinOp(new_left, op, new_right), after, after
+
+            case ast.Compare(left=left, ops=ops, comparators=comparators):
+                new_left, after, _ = self.rewrite(left, assigned)
+                new_first, after, _ = self.rewrite(comparators[0], after)
+                after_true = after
+
+                # The further comparisons of a chain are evaluated
+                # only if the previous ones are true.
+                new_comparators = [new_first]
+                for comparator in comparators[1:]:
+                    new_comparator, after_true, _ = self.rewrite(comparator, after_true)
+                    new_comparators.append(new_comparator)
+
+                return ast.Compare(new_left, ops, new_comparators), after, after_true
+
+            case ast.Call(func=ast.Name() as func, args=args, keywords=[]):
+                new_args = []
+                after = assigned
+                for arg in args:
+                    new_arg, after, _ = self.rewrite(arg, after)
+                    new_args.append(new_arg)
+
+                return ast.Call(func, new_args, []), after, after
+
+            case ast.Call(func=ast.Attribute(value=value, attr=attr), args=[], keywords=[]):
+                new_value, after, _ = self.rewrite(value, assigned)
+                return ast.Call(ast.Attribute(new_value, attr, ast.Load()), [], []), after, after
+
+        # Other expressions are left as they are.
+        return node, assigned, assigned
+
+
+def _count_subexpressions(node: ast.expr, counts: dict[str, int]) -> None:
+    if _is_worth_reusing(node):
+        key = _key(node)
+        counts[key] = counts.get(key, 0) + 1
+
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, ast.expr):
+            _count_subexpressions(child, counts)
+
+
+def _is_boolean(node: ast.expr) -> bool:
+    """Whether the expression always evaluates to a bool (never to a complex number)."""
+
+    match node:
+        case ast.Compare() | ast.UnaryOp(op=ast.Not()):
+            return True
+        case ast.BoolOp(values=values):
+            return all(map(_is_boolean, values))
+        case ast.Call(func=ast.Name(id="is_square")):
+            return True
+        case ast.Call(func=ast.Attribute(attr="is_integer")):
+            return True
+
+    return False
+
+
+def _truth(value: object) -> bool:
+    # `evaluate` turns complex results into -inf, which is truthy.
+    return True if isinstance(value, complex) else bool(value)
+
+
+def _answer(value: Any) -> Any:
+    # The same as `round(evaluate(answer, values), 4)` without errors.
+    return round(float("-inf") if isinstance(value, complex) else value, 4)
+
+
+def _answers_fallback(
+    answers: tuple[FormulaType, ...],
+    variable_names: tuple[VariableNameType, ...],
+    evaluate: EvaluateType
+) -> Callable[..., tuple[Any, ...]]:
+    def compute_answers(*values: VariableValueType) -> tuple[Any, ...]:
+        variables = dict(zip(variable_names, values))
+        return tuple(round(evaluate(answer, variables), 4) for answer in answers)
+
+    return compute_answers
+
+
+def _fallback(
+    conditions: tuple[FormulaType, ...],
+    variable_names: tuple[VariableNameType, ...],
+    evaluate: EvaluateType,
+    answers: tuple[FormulaType, ...]
+) -> PredicateType:
+    compute_answers = _answers_fallback(answers, variable_names, evaluate)
+
+    def failed_condition_index(*values: VariableValueType) -> int | tuple[Any, ...]:
+        variables = dict(zip(variable_names, values))
+
+        for i, condition in enumerate(conditions):
+            if not evaluate(condition, variables):
+                return i
+        return compute_answers(*values) if answers else -1
+
+    return failed_condition_index
+
+
+@lru_cache(maxsize=256)
+def compile_conditions(
+    conditions: tuple[FormulaType, ...],
+    variable_names: tuple[VariableNameType, ...],
+    evaluate: EvaluateType,
+    answers: tuple[FormulaType, ...] = (),
+    integer_names: frozenset[VariableNameType] = frozenset()
+) -> PredicateType:
+    """Compile the conditions into one predicate taking the values of the
+    variables as positional arguments, in the order of the names.
+    The predicate returns the index of the first condition not satisfied,
+    otherwise -1, or the tuple of the values of the answers, if any.
+    `evaluate` evaluates a single formula, when the predicate falls back to it.
+    The `integer_names` variables always have integer values.
+    """
+
+    fallback = _fallback(conditions, variable_names, evaluate, answers)
+
+    try:
+        trees = [
+            _SquareExpander(integer_names).visit(
+                _ConstantFolder().visit(ast.parse(formula.strip(), mode="eval").body)
+            )
+            for formula in conditions + answers
+        ]
+    except SyntaxError:
+        return fallback
+
+    counts: dict[str, int] = {}
+    for tree in trees:
+        _count_subexpressions(tree, counts)
+
+    eliminator = _CommonSubexpressionEliminator(
+        {key for key, count in counts.items() if count > 1}
+    )
+
+    body: list[ast.stmt] = []
+    assigned: frozenset[str] = frozenset()
+
+    for i, tree in enumerate(trees[:len(conditions)]):
+        # The next conditions are evaluated only if this one is satisfied.
+        test, _, assigned = eliminator.rewrite(tree, assigned)
+        if not _is_boolean(tree):
+            test = ast.Call(ast.Name("_truth", ast.Load()), [test], [])
+
+        body.append(ast.If(
+            ast.UnaryOp(ast.Not(), test),
+            [ast.Return(ast.Constant(i))],
+            []
+        ))
+
+    arguments = [ast.Name(name, ast.Load()) for name in variable_names]
+    function_body: list[ast.stmt] = []
+    if body:
+        function_body.append(ast.Try(
+            body,
+            [ast.ExceptHandler(
+                ast.Name("Exception", ast.Load()), None,
+                [ast.Return(ast.Call(ast.Name("_fallback", ast.Load()), arguments, []))]
+            )],
+            [], []
+        ))
+
+    if answers:
+        # All the conditions are satisfied, so their temporaries are assigned.
+        # An answer raising an error makes all of them computed by `evaluate`.
+        answer_values = []
+        for tree in trees[len(conditions):]:
+            value, assigned, _ = eliminator.rewrite(tree, assigned)
+            answer_values.append(ast.Call(ast.Name("_answer", ast.Load()), [value], []))
+
+        function_body.append(ast.Try(
+            [ast.Return(ast.Tuple(answer_values, ast.Load()))],
+            [ast.ExceptHandler(
+                ast.Name("Exception", ast.Load()), None,
+                [ast.Return(ast.Call(ast.Name("_answers_fallback", ast.Load()), arguments, []))]
+            )],
+            [], []
+        ))
+    else:
+        function_body.append(ast.Return(ast.Constant(-1)))
+
+    function = ast.FunctionDef(
+        name="failed_condition_index",
+        args=ast.arguments([], [ast.arg(name) for name in variable_names], None, [], [], None, []),
+        body=function_body,
+        decorator_list=[],
+        returns=None,
+        type_params=[]
+    )
+
+    module = ast.fix_missing_locations(ast.Module([function], []))
+    namespace = {
+        **_generator_builtins.__dict__,
+        "_truth": _truth,
+        "_answer": _answer,
+        "_fallback": fallback,
+        "_answers_fallback": _answers_fallback(answers, variable_names, evaluate),
+    }
+    exec(compile(module, "<conditions>", "exec"), namespace)
+
+    return namespace["failed_condition_index"]
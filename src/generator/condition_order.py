@@ -0,0 +1,138 @@
+"""Adaptive order of the conditions of a page.
+
+The conditions come as a set, in arbitrary order, so a cheap and selective
+condition (e.g. `a != 0`) could be evaluated after the expensive ones, which
+are then evaluated for nothing. While generating, every `SAMPLE_INTERVAL`-th
+attempt evaluates all the conditions separately, measuring the time of each
+and whether it rejects the values. The conditions are ordered by the time per
+rejection (the cheapest and most selective first), and reordered every
+`REORDER_INTERVAL` attempts. The conditions raising errors (e.g. `a % b == 0`
+with `b == 0`) go after the others, which may reject the values first
+(e.g. `b != 0`), as an error makes the compiled predicate evaluate all the
+conditions again one by one.
+
+The statistics are kept per page for the lifetime of the process, so the next
+generation of the page starts with the measured order. The order does not
+change which values are accepted, as the conditions are independent formulas.
+"""
+
+from generator import _generator_builtins
+from generator.types import FormulaType, VariableNameType, VariableValueType
+
+from dataclasses import dataclass
+from functools import lru_cache
+from threading import Lock
+from time import perf_counter
+from types import CodeType
+from typing import Iterable, Mapping
+
+
+SAMPLE_INTERVAL = 32
+REORDER_INTERVAL = 1024
+# The conditions measured fewer times are ordered as not measured yet.
+MIN_SAMPLES = 8
+# The statistics are halved at this number of samples, so the order
+# follows the recent generations (e.g. after the intervals are changed).
+MAX_SAMPLES = 10_000
+
+
+@dataclass(slots=True)
+class _ConditionStatistics:
+    samples: int = 0
+    rejections: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+
+    @property
+    def seconds_per_rejection(self) -> float:
+        if self.rejections == 0:
+            return float("inf")
+        return self.seconds / self.rejections
+
+
+_statistics: dict[str, dict[FormulaType, _ConditionStatistics]] = {}
+_lock = Lock()
+
+
+@lru_cache(maxsize=1024)
+def _compile_condition(condition: FormulaType) -> CodeType | None:
+    try:
+        return compile(condition.strip(), "<condition>", "eval")
+    except SyntaxError:
+        return None
+
+
+def _evaluate(
+    code: CodeType | None,
+    values: Mapping[VariableNameType, VariableValueType]
+) -> tuple[bool, bool]:
+    """Whether the condition rejects the values, and whether it raises an error.
+    The same truth as in `evaluate`: the errors and the complex results are -inf, which is truthy.
+    """
+
+    if code is None:
+        return False, True
+
+    try:
+        result = eval(code, _generator_builtins.__dict__, values)
+    except Exception:
+        return False, True
+
+    return not isinstance(result, complex) and not result, False
+
+
+def measure(
+    generator_location: str,
+    conditions: tuple[FormulaType, ...],
+    values: Mapping[VariableNameType, VariableValueType]
+) -> None:
+    """Evaluate every condition with the values and record its time and result."""
+
+    measurements = []
+    for condition in conditions:
+        code = _compile_condition(condition)
+
+        start_time = perf_counter()
+        rejects, raises = _evaluate(code, values)
+        measurements.append((condition, perf_counter() - start_time, rejects, raises))
+
+    with _lock:
+        page_statistics = _statistics.setdefault(generator_location, {})
+
+        for condition, seconds, rejects, raises in measurements:
+            statistics = page_statistics.setdefault(condition, _ConditionStatistics())
+            statistics.samples += 1
+            statistics.rejections += rejects
+            statistics.errors += raises
+            statistics.seconds += seconds
+
+            if statistics.samples >= MAX_SAMPLES:
+                statistics.samples //= 2
+                statistics.rejections //= 2
+                statistics.errors //= 2
+                statistics.seconds /= 2
+
+
+def order_conditions(generator_location: str, conditions: Iterable[FormulaType]) -> tuple[FormulaType, ...]:
+    """The conditions ordered by the measured time per rejection, the ones
+    raising errors last. The conditions not measured yet go first, the shorter ones first.
+    """
+
+    with _lock:
+        page_statistics = {
+            condition: (
+                statistics.errors > 0,
+                statistics.seconds_per_rejection,
+                statistics.seconds / statistics.samples
+            )
+            for condition, statistics in _statistics.get(generator_location, {}).items()
+            if statistics.samples >= MIN_SAMPLES
+        }
+
+    def rank(condition: FormulaType) -> tuple:
+        if condition not in page_statistics:
+            return (0, len(condition), condition)
+
+        return (1, *page_statistics[condition], condition)
+
+    return tuple(sorted(conditions, key=rank))
@@ -0,0 +1,211 @@
+"""User-defined generators.
+
+The formulas of the generator pages (`routes/*.py`) are written by the
+developers and evaluated as they are. The formulas of a custom generator come
+from the users, so they are checked against a whitelisted grammar first:
+
+* numeric constants (at most `MAX_CONSTANT` in magnitude) and the variables
+  of the generator;
+* arithmetic (`+ - * / // % **`), comparisons, `and`, `or`, `not` and
+  conditional expressions;
+* calls of the `FUNCTIONS` and the `.is_integer()` method;
+
+and nothing else — no other names, attributes, subscripts, strings, lambdas,
+comprehensions or keyword arguments. The checked formula is rewritten with
+`**` replaced by `bounded_power` (see `_generator_builtins.py`), as the power
+is the only operation of the grammar whose result can grow far beyond its
+operands. With the constants, the intervals and the length of the formulas
+bounded, the results of the other operations stay small.
+
+The formulas are checked and rewritten once, the generation runs in a worker
+process with a CPU budget (see `custom_worker.py`).
+"""
+
+from generator.types import FormulaType, Interval, VariableNameType, VariableProperties
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Annotated, Iterable, Mapping
+
+import ast
+import keyword
+
+
+# Not `round`, as rounding an integer to the negative number of digits
+# computes a power of ten (e.g. `round(5, -10 ** 8)`).
+FUNCTIONS = frozenset(("abs", "min", "max", "is_square"))
+
+MAX_FORMULA_LENGTH = 200
+MAX_CONSTANT = 10 ** 9
+# The largest magnitude of the bounds of the intervals of the variables.
+MAX_BOUND = 10 ** 6
+MAX_VARIABLES = 6
+MAX_CONDITIONS = 10
+MAX_ANSWERS = 4
+
+_BINARY_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+_UNARY_OPERATORS = (ast.UAdd, ast.USub, ast.Not)
+_COMPARISON_OPERATORS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+
+class FormulaError(ValueError):
+    """A formula (or a name) of a custom generator outside of the grammar."""
+
+    def __init__(self, formula: str, reason: str) -> None:
+        super().__init__(f"{reason} in {formula!r}")
+        self.formula = formula
+        self.reason = reason
+
+
+def _check_node(node: ast.AST, formula: str, variable_names: frozenset[VariableNameType]) -> None:
+    match node:
+        case ast.Constant(value=value):
+            if type(value) not in (int, float, bool):
+                raise FormulaError(formula, f"Constant {value!r} is not a number")
+            if abs(value) > MAX_CONSTANT:
+                raise FormulaError(formula, f"Constant {value!r} is too large")
+            return
+        case ast.Name(id=name):
+            if name not in variable_names:
+                raise FormulaError(formula, f"Unknown name {name!r}")
+            return
+        case ast.Call(func=ast.Name(id=name), args=args, keywords=[]) if name in FUNCTIONS:
+            children: list[ast.AST] = args
+        case ast.Call(func=ast.Attribute(value=value, attr="is_integer"), args=[], keywords=[]):
+            children = [value]
+        case ast.BinOp(left=left, op=op, right=right) if isinstance(op, _BINARY_OPERATORS):
+            children = [left, right]
+        case ast.UnaryOp(op=op, operand=operand) if isinstance(op, _UNARY_OPERATORS):
+            children = [operand]
+        case ast.BoolOp(values=values):
+            children = values
+        case ast.Compare(left=left, ops=ops, comparators=comparators) if all(
+            isinstance(op, _COMPARISON_OPERATORS) for op in ops
+        ):
+            children = [left, *comparators]
+        case ast.IfExp(test=test, body=body, orelse=orelse):
+            children = [test, body, orelse]
+        case _:
+            raise FormulaError(formula, f"{type(node).__name__} is not allowed")
+
+    for child in children:
+        _check_node(child, formula, variable_names)
+
+
+class _BoundPowers(ast.NodeTransformer):
+    def visit_BinOp(self, node: ast.BinOp) -> ast.AST:
+        self.generic_visit(node)
+
+        if isinstance(node.op, ast.Pow):
+            return ast.Call(ast.Name("bounded_power", ast.Load()), [node.left, node.right], [])
+        return node
+
+
+def check_name(name: str) -> VariableNameType:
+    """Check that a name of a variable or an answer is a plain identifier,
+    distinct from the functions and the names used by the compiled formulas.
+    Returns the name, raises FormulaError otherwise.
+    """
+
+    if (
+        not name.isidentifier() or not name.isascii() or keyword.iskeyword(name)
+        or name.startswith("_") or name in FUNCTIONS or name == "bounded_power"
+    ):
+        raise FormulaError(name, "Invalid name")
+
+    return name
+
+
+@lru_cache(maxsize=1024)
+def check_formula(formula: str, variable_names: frozenset[VariableNameType]) -> FormulaType:
+    """Check the formula against the grammar (see the module docstring).
+    Returns the formula with the powers bounded, raises FormulaError otherwise.
+    """
+
+    formula = formula.strip()
+    if len(formula) > MAX_FORMULA_LENGTH:
+        raise FormulaError(formula, "The formula is too long")
+
+    try:
+        tree = ast.parse(formula, mode="eval")
+    except SyntaxError:
+        raise FormulaError(formula, "Invalid syntax") from None
+
+    _check_node(tree.body, formula, variable_names)
+
+    return ast.unparse(ast.fix_missing_locations(_BoundPowers().visit(tree)))
+
+
+@dataclass(frozen=True)
+class CustomGenerator:
+    """A checked user-defined generator. Made by `custom_generator`."""
+
+    variables_intervals: tuple[tuple[VariableNameType, int, int], ...]
+    conditions: tuple[FormulaType, ...]
+    answers: tuple[tuple[VariableNameType, FormulaType], ...]
+    # The checked formulas with the formulas as written by the user.
+    sources: tuple[tuple[FormulaType, str], ...] = tuple()
+
+    def variables(self) -> dict[VariableNameType, VariableProperties]:
+        return {
+            name: VariableProperties(Interval(float(start), float(stop)), False, False)
+            for name, start, stop in self.variables_intervals
+        }
+
+    @property
+    def answer_variables(self) -> dict[VariableNameType, FormulaType]:
+        return dict(self.answers)
+
+    def source(self, formula: FormulaType) -> str:
+        """The formula as written by the user, of the checked formula."""
+
+        return dict(self.sources).get(formula, formula)
+
+
+def custom_generator(
+    variables_intervals: Mapping[
+        VariableNameType, tuple[
+            Annotated[int, "from"],
+            Annotated[int, "to"]
+        ]
+    ],
+    conditions: Iterable[str],
+    answer_variables: Mapping[VariableNameType, str]
+) -> CustomGenerator:
+    """Check the user-defined integer variables with their intervals,
+    the conditions and the answer formulas.
+    Raises FormulaError for a name or a formula outside of the grammar,
+    and ValueError if the generator is over the limits.
+    """
+
+    conditions = tuple(condition for condition in conditions if condition.strip())
+
+    if not 0 < len(variables_intervals) <= MAX_VARIABLES:
+        raise ValueError(f"A generator has from 1 to {MAX_VARIABLES} variables.")
+    if len(conditions) > MAX_CONDITIONS:
+        raise ValueError(f"A generator has at most {MAX_CONDITIONS} conditions.")
+    if len(answer_variables) > MAX_ANSWERS:
+        raise ValueError(f"A generator has at most {MAX_ANSWERS} answers.")
+
+    for name, (start, stop) in variables_intervals.items():
+        check_name(name)
+        if not -MAX_BOUND <= start <= stop <= MAX_BOUND:
+            raise ValueError(f"The interval of {name} is not within ±{MAX_BOUND}.")
+
+    for name in answer_variables:
+        if name in variables_intervals:
+            raise FormulaError(name, "The answer has the name of a variable")
+        check_name(name)
+
+    variable_names = frozenset(variables_intervals)
+    formulas = {
+        formula.strip(): check_formula(formula, variable_names)
+        for formula in conditions + tuple(answer_variables.values())
+    }
+
+    return CustomGenerator(
+        tuple((name, int(start), int(stop)) for name, (start, stop) in variables_intervals.items()),
+        tuple(formulas[condition.strip()] for condition in conditions),
+        tuple((name, formulas[formula.strip()]) for name, formula in answer_variables.items()),
+        tuple((checked, formula) for formula, checked in formulas.items())
+    )
@@ -0,0 +1,255 @@
+"""Generation of the custom generators in the worker processes.
+
+The formulas of a custom generator are checked (see `custom.py`), but the
+checks cannot bound the time of a generation: a few conditions that are
+rarely true take all the attempts. So the custom generations run in separate
+worker processes, not in the server process:
+
+* at most `MATHEMA_CUSTOM_WORKERS` (1 by default) at once, the others wait
+  for a free worker;
+* at a lower priority (`nice`), so they take the CPU left over by the server
+  processes;
+* with the CPU time of every request limited to `MATHEMA_CUSTOM_CPU_SECONDS`
+  (5 by default) by the kernel (`RLIMIT_CPU`), and the wall time to three
+  times as much by the server, which kills the worker past it.
+
+A condition or an answer raising an exception (e.g. `1 / (a - b)` with
+`a == b`, or a power refused by `bounded_power`) rejects the values. A
+formula raising for all of `FORMULA_SAMPLES` random values is reported
+to the user as a formula error, before generating.
+
+A worker is started on the first request and serves the following ones,
+so the formulas are compiled once per worker. A killed worker is started
+again on the next request. The requests and the results are pickled through
+the standard input and output of the worker, its prints go to the standard
+error.
+"""
+
+from generator.custom import CustomGenerator, FormulaError
+from generator.types import FormulaType, Solution
+import metrics
+
+from math import ceil
+from queue import Empty, SimpleQueue
+from random import Random
+from select import select
+from time import perf_counter
+from typing import Annotated, BinaryIO, Callable, TypeAlias, cast
+
+import os
+import pickle
+import resource
+import signal
+import subprocess
+import sys
+
+
+# The location of the custom generations in the statistics of the generator.
+LOCATION = "/custom"
+# The priority of the workers, added to the priority of the server.
+NICENESS = 10
+FORMULA_SAMPLES = 100
+
+_RequestType: TypeAlias = tuple[
+    CustomGenerator,
+    Annotated[int, "number of solutions"],
+    Annotated[int, "seed"],
+    Annotated[float, "CPU seconds"]
+]
+_ResultType: TypeAlias = tuple[
+    Annotated[set[Solution] | None, "solutions"],
+    Annotated[FormulaType | None, "formula raising for all the values"]
+]
+
+
+class BudgetExceededError(RuntimeError):
+    """The custom generation took more than its CPU or wall time."""
+
+
+class _Worker:
+    def __init__(self) -> None:
+        src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "generator.custom_worker"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=src
+        )
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.wait()
+
+        for pipe in (self.process.stdin, self.process.stdout):
+            if pipe is not None:
+                pipe.close()
+
+
+class CustomGenerationPool:
+    def __init__(self, num_of_workers: int, cpu_seconds: float) -> None:
+        self.cpu_seconds = cpu_seconds
+
+        # None for a worker, which is not started yet.
+        self._idle: SimpleQueue[_Worker | None] = SimpleQueue()
+        for _ in range(num_of_workers):
+            self._idle.put(None)
+
+    def generate(
+        self,
+        generator: CustomGenerator,
+        num_of_solutions: int,
+        seed: int,
+        is_canceled: Callable[[], bool] | None = None
+    ) -> set[Solution] | None:
+        """Generate the solutions of the custom generator in a worker.
+        Returns the solutions, with the answers, None if there are not enough
+        of them, or empty set if `is_canceled` returned True meanwhile.
+        Raises BudgetExceededError if the generation took too long, and
+        FormulaError for a formula raising an exception for all the values.
+        """
+
+        if is_canceled is None:
+            def is_canceled() -> bool:
+                return False
+
+        while True:
+            try:
+                worker = self._idle.get(timeout=0.25)
+                break
+            except Empty:
+                if is_canceled():
+                    return set()
+
+        start_time = perf_counter()
+        result = "failed"
+
+        try:
+            if worker is None or not worker.alive:
+                worker = _Worker()
+
+            assert worker.process.stdin is not None and worker.process.stdout is not None
+            request: _RequestType = (generator, num_of_solutions, seed, self.cpu_seconds)
+            pickle.dump(request, worker.process.stdin)
+            worker.process.stdin.flush()
+
+            deadline = start_time + 3 * self.cpu_seconds
+            while not select([worker.process.stdout], [], [], 0.25)[0]:
+                if is_canceled():
+                    worker.kill()
+                    result = "canceled"
+                    return set()
+                if perf_counter() > deadline:
+                    worker.kill()
+                    result = "timeout"
+                    raise BudgetExceededError("The custom generation took too long.")
+
+            try:
+                solutions, raising_formula = cast(_ResultType, pickle.load(worker.process.stdout))
+            except EOFError:
+                worker.kill()
+
+                if worker.process.returncode == -signal.SIGXCPU:
+                    result = "timeout"
+                    raise BudgetExceededError("The custom generation took too long.") from None
+                raise RuntimeError("The custom generation worker exited.") from None
+
+            if raising_formula is not None:
+                raise FormulaError(raising_formula, "The formula raises an error for all the values")
+
+            result = "ok" if solutions else "failed"
+            return solutions
+        finally:
+            self._idle.put(worker)
+
+            metrics.increment("mathema_custom_generation_runs_total", result=result)
+            metrics.observe("mathema_custom_generation_seconds", perf_counter() - start_time)
+
+
+def _raising_formula(generator: CustomGenerator, rng: Random) -> FormulaType | None:
+    """The first condition or answer raising an exception for all the sampled
+    values, if any.
+    """
+
+    from generator.generator import FormulaEvaluationError, evaluate_strict
+
+    samples = [
+        {name: rng.randint(start, stop) for name, start, stop in generator.variables_intervals}
+        for _ in range(FORMULA_SAMPLES)
+    ]
+
+    for formula in generator.conditions + tuple(formula for _, formula in generator.answers):
+        for values in samples:
+            try:
+                evaluate_strict(formula, values)
+                break
+            except FormulaEvaluationError:
+                pass
+        else:
+            return formula
+
+    return None
+
+
+def _serve(requests: BinaryIO, results: BinaryIO) -> None:
+    """Serve the requests of the server, until it closes the standard input."""
+
+    from generator.generator import generate_solutions
+
+    os.nice(NICENESS)
+
+    while True:
+        try:
+            request: _RequestType = pickle.load(requests)
+        except EOFError:
+            return
+
+        generator, num_of_solutions, seed, cpu_seconds = request
+
+        # The limit is on the CPU time of the process, so it is moved
+        # past the time taken by the previous requests.
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        resource.setrlimit(
+            resource.RLIMIT_CPU,
+            (ceil(usage.ru_utime + usage.ru_stime + cpu_seconds), resource.RLIM_INFINITY)
+        )
+
+        rng = Random(seed)
+        result: _ResultType = (None, _raising_formula(generator, rng))
+
+        if result[1] is None:
+            result = (
+                generate_solutions(
+                    generator.variables(),
+                    generator.conditions,
+                    num_of_solutions,
+                    LOCATION,
+                    rng=rng,
+                    answer_variables=generator.answer_variables,
+                    strict=True
+                ),
+                None
+            )
+
+        pickle.dump(result, results)
+        results.flush()
+
+
+def main() -> None:
+    # The prints of the generator must not get into the results.
+    results = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    _serve(sys.stdin.buffer, results)
+
+
+pool = CustomGenerationPool(
+    int(os.environ.get("MATHEMA_CUSTOM_WORKERS", "1")),
+    float(os.environ.get("MATHEMA_CUSTOM_CPU_SECONDS", "5"))
+)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,539 @@
+"""Narrowing of the domains of the integer variables by the conditions.
+
+The values are drawn from the intervals of the variables and then checked by
+the conditions, so with conditions like `a + b < 10` or `b >= a` most of the
+draws are thrown away. Before generating, the conditions are searched for
+the linear comparisons of the integer variables (e.g. `a + b < 10`,
+`c >= b`, `a != 0`) and the sign comparisons of their products and
+quotients (e.g. `c/a <= 0`), which every solution satisfies:
+
+* the comparisons, which are the whole condition or the first parts of its
+  top-level `and` (up to the first part, which is not such a comparison,
+  as it could raise an error, and the errors make the condition satisfied);
+* the quotients, whose divisor is compared with zero before them
+  (e.g. `(a != 0) and (c/a <= 0)`).
+
+The intervals of the variables are first tightened by the linear comparisons.
+Then, if there are few enough combinations of all but the last of the
+constrained variables, all of them are enumerated with the number of values
+of the last variable allowed with each, and the values are drawn uniformly
+from all the allowed combinations with one random number. Otherwise they
+are drawn from the tightened intervals.
+
+Either way the values are drawn uniformly from a part of the intervals
+containing all the solutions, and all the conditions are still checked,
+so the solutions are distributed the same as when drawn from the intervals.
+The number of the allowed combinations also bounds the number of the
+different solutions, so the generation of more solutions fails at once.
+When it is close to the number of the solutions, the combinations are drawn
+without replacement instead (see `Domain.shuffled`), so no draw is wasted
+on a duplicate, and the generation fails as soon as all are drawn.
+"""
+
+from generator.types import FormulaType, VariableNameType, VariableProperties
+
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import product
+from math import ceil, floor, inf, prod
+from random import Random
+from typing import Callable, Iterable, Iterator, Mapping, TypeAlias
+
+import ast
+import operator
+
+
+# The enumerated combinations of all but the last constrained variable.
+MAX_ENUMERATION = 50_000
+_MAX_TIGHTENING_ROUNDS = 20
+
+AssignmentType: TypeAlias = Mapping[VariableNameType, int]
+# Lowest and highest allowed value (may be infinite) and the values excluded between them.
+AllowedType: TypeAlias = tuple[int | float, int | float, frozenset[int]]
+
+_COMPARISONS: dict[type[ast.cmpop], Callable[[int, int], bool]] = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+_SWAPPED_COMPARISONS: dict[type[ast.cmpop], type[ast.cmpop]] = {
+    ast.Lt: ast.Gt,
+    ast.LtE: ast.GtE,
+    ast.Gt: ast.Lt,
+    ast.GtE: ast.LtE,
+    ast.Eq: ast.Eq,
+    ast.NotEq: ast.NotEq,
+}
+
+
+def _at_most(coefficient: int, bound: int) -> AllowedType:
+    """The values of x with `coefficient * x <= bound`."""
+
+    if coefficient > 0:
+        return -inf, bound // coefficient, frozenset()
+    return -(bound // -coefficient), inf, frozenset()
+
+
+@dataclass(frozen=True)
+class _Linear:
+    """`sum(coefficient * variable) + constant <= 0`, or `!= 0` if `not_equal`."""
+
+    coefficients: tuple[tuple[VariableNameType, int], ...]
+    constant: int
+    not_equal: bool = False
+
+    @property
+    def names(self) -> frozenset[VariableNameType]:
+        return frozenset(name for name, _ in self.coefficients)
+
+    def _rest(self, name: VariableNameType, assignment: AssignmentType) -> int:
+        return self.constant + sum(
+            coefficient * assignment[other]
+            for other, coefficient in self.coefficients if other != name
+        )
+
+    def holds(self, assignment: AssignmentType) -> bool:
+        value = self.constant + sum(
+            coefficient * assignment[name] for name, coefficient in self.coefficients
+        )
+        return value != 0 if self.not_equal else value <= 0
+
+    def allowed(self, name: VariableNameType, assignment: AssignmentType) -> AllowedType:
+        coefficient = dict(self.coefficients)[name]
+        rest = self._rest(name, assignment)
+
+        if not self.not_equal:
+            return _at_most(coefficient, -rest)
+        if rest % coefficient == 0:
+            return -inf, inf, frozenset((-rest // coefficient,))
+        return -inf, inf, frozenset()
+
+    def bound(self, name: VariableNameType, domains: Mapping[VariableNameType, range]) -> AllowedType:
+        """The values of the variable allowed with any values of the others from their domains."""
+
+        if self.not_equal:
+            return -inf, inf, frozenset()
+
+        coefficient = dict(self.coefficients)[name]
+        lowest_rest = self.constant + sum(
+            min(coefficient * domains[other][0], coefficient * domains[other][-1])
+            for other, coefficient in self.coefficients if other != name
+        )
+        return _at_most(coefficient, -lowest_rest)
+
+
+@dataclass(frozen=True)
+class _Sign:
+    """`sign(left) * sign(right) <comparison> 0`: the sign of their product or quotient."""
+
+    left: VariableNameType
+    right: VariableNameType
+    comparison: Callable[[int, int], bool]
+
+    @property
+    def names(self) -> frozenset[VariableNameType]:
+        return frozenset((self.left, self.right))
+
+    def holds(self, assignment: AssignmentType) -> bool:
+        return self.comparison(_sign(assignment[self.left]) * _sign(assignment[self.right]), 0)
+
+    def allowed(self, name: VariableNameType, assignment: AssignmentType) -> AllowedType:
+        other_sign = _sign(assignment[self.right if name == self.left else self.left])
+        signs = [sign for sign in (-1, 0, 1) if self.comparison(sign * other_sign, 0)]
+
+        match signs:
+            case []:
+                return 1, 0, frozenset()
+            case [-1, 1]:
+                return -inf, inf, frozenset((0,))
+        return (-inf if signs[0] < 0 else 0), (inf if signs[-1] > 0 else 0), frozenset()
+
+    def bound(self, name: VariableNameType, domains: Mapping[VariableNameType, range]) -> AllowedType:
+        return -inf, inf, frozenset()
+
+
+_Constraint: TypeAlias = _Linear | _Sign
+
+
+def _sign(value: int) -> int:
+    return (value > 0) - (value < 0)
+
+
+def _linear_expression(
+    node: ast.expr,
+    names: frozenset[VariableNameType]
+) -> tuple[dict[VariableNameType, int], int] | None:
+    """The integer coefficients of the variables and the constant of the expression.
+    None if the expression is not linear in the variables with integer coefficients.
+    """
+
+    match node:
+        case ast.Constant(value=bool()):
+            return None
+        case ast.Constant(value=int() as value):
+            return {}, value
+        case ast.Constant(value=float() as value) if value.is_integer():
+            return {}, int(value)
+        case ast.Name(id=name) if name in names:
+            return {name: 1}, 0
+        case ast.UnaryOp(op=ast.UAdd() | ast.USub() as op, operand=operand):
+            expression = _linear_expression(operand, names)
+            if expression is None or isinstance(op, ast.UAdd):
+                return expression
+            coefficients, constant = expression
+            return {name: -coefficient for name, coefficient in coefficients.items()}, -constant
+        case ast.BinOp(left=left, op=ast.Add() | ast.Sub() | ast.Mult() as op, right=right):
+            left_expression = _linear_expression(left, names)
+            right_expression = _linear_expression(right, names)
+            if left_expression is None or right_expression is None:
+                return None
+            (left_coefficients, left_constant), (right_coefficients, right_constant) = (
+                left_expression, right_expression
+            )
+
+            if isinstance(op, ast.Mult):
+                if left_coefficients and right_coefficients:
+                    return None
+                if right_coefficients:
+                    left_coefficients, right_coefficients = right_coefficients, left_coefficients
+                    left_constant, right_constant = right_constant, left_constant
+                return (
+                    {name: coefficient * right_constant for name, coefficient in left_coefficients.items()},
+                    left_constant * right_constant
+                )
+
+            sign = 1 if isinstance(op, ast.Add) else -1
+            coefficients = dict(left_coefficients)
+            for name, coefficient in right_coefficients.items():
+                coefficients[name] = coefficients.get(name, 0) + sign * coefficient
+            return coefficients, left_constant + sign * right_constant
+
+    return None
+
+
+def _comparison_constraints(
+    left: ast.expr,
+    comparison: ast.cmpop,
+    right: ast.expr,
+    names: frozenset[VariableNameType],
+    nonzero: set[VariableNameType]
+) -> list[_Constraint] | None:
+    """The constraints of `left <comparison> right`, or None if it is not recognized."""
+
+    if type(comparison) not in _COMPARISONS:
+        return None
+
+    left_expression = _linear_expression(left, names)
+    right_expression = _linear_expression(right, names)
+
+    if left_expression is not None and right_expression is not None:
+        (left_coefficients, left_constant), (right_coefficients, right_constant) = (
+            left_expression, right_expression
+        )
+        coefficients = dict(left_coefficients)
+        for name, coefficient in right_coefficients.items():
+            coefficients[name] = coefficients.get(name, 0) - coefficient
+        coefficients = {name: coefficient for name, coefficient in coefficients.items() if coefficient}
+        constant = left_constant - right_constant
+
+        def linear(sign: int, shift: int = 0, not_equal: bool = False) -> _Linear:
+            return _Linear(
+                tuple(sorted((name, sign * coefficient) for name, coefficient in coefficients.items())),
+                sign * constant + shift,
+                not_equal
+            )
+
+        match comparison:
+            case ast.Lt():
+                return [linear(1, 1)]
+            case ast.LtE():
+                return [linear(1)]
+            case ast.Gt():
+                return [linear(-1, 1)]
+            case ast.GtE():
+                return [linear(-1)]
+            case ast.Eq():
+                return [linear(1), linear(-1)]
+        return [linear(1, not_equal=True)]
+
+    # The sign of a product or a quotient, compared with zero.
+    if isinstance(left, ast.Constant) and not isinstance(right, ast.Constant):
+        left, right = right, left
+        comparison = _SWAPPED_COMPARISONS[type(comparison)]()
+
+    match left, right:
+        case (
+            ast.BinOp(left=ast.Name(id=dividend), op=ast.Mult() | ast.Div() as op, right=ast.Name(id=divisor)),
+            ast.Constant(value=0)
+        ) if dividend in names and divisor in names and dividend != divisor:
+            # The quotient raises an error with zero divisor, unless checked before.
+            if isinstance(op, ast.Div) and divisor not in nonzero:
+                return None
+            return [_Sign(dividend, divisor, _COMPARISONS[type(comparison)])]
+
+    return None
+
+
+def _condition_constraints(
+    condition: FormulaType,
+    names: frozenset[VariableNameType]
+) -> list[_Constraint]:
+    """The constraints every solution satisfies by the condition."""
+
+    try:
+        tree = ast.parse(condition.strip(), mode="eval").body
+    except SyntaxError:
+        return []
+
+    parts = tree.values if isinstance(tree, ast.BoolOp) and isinstance(tree.op, ast.And) else [tree]
+    constraints: list[_Constraint] = []
+    # The variables, which are not zero if the checked parts are satisfied.
+    nonzero: set[VariableNameType] = set()
+
+    for part in parts:
+        if not isinstance(part, ast.Compare):
+            break
+
+        operands = [part.left, *part.comparators]
+        for left, comparison, right in zip(operands, part.ops, operands[1:]):
+            comparison_constraints = _comparison_constraints(left, comparison, right, names, nonzero)
+            if comparison_constraints is None:
+                return constraints
+
+            for constraint in comparison_constraints:
+                constraints.append(constraint)
+                if (
+                    isinstance(constraint, _Linear) and len(constraint.names) == 1
+                    and not constraint.holds({name: 0 for name in constraint.names})
+                ):
+                    nonzero |= constraint.names
+
+    return constraints
+
+
+def _count(domain: range, allowed: AllowedType) -> tuple[int, int, tuple[int, ...]]:
+    """The number of the allowed values of the domain, the lowest one
+    and the excluded values between the lowest and the highest one.
+    """
+
+    lowest, highest, excluded = allowed
+    lowest = max(domain.start, lowest)
+    highest = min(domain.stop - 1, highest)
+    if lowest > highest:
+        return 0, 0, ()
+
+    excluded_values = tuple(sorted(value for value in excluded if lowest <= value <= highest))
+    return int(highest - lowest + 1) - len(excluded_values), int(lowest), excluded_values
+
+
+def _intersect(allowed: Iterable[AllowedType]) -> AllowedType:
+    lowest, highest, excluded = -inf, inf, frozenset()
+    for other_lowest, other_highest, other_excluded in allowed:
+        lowest, highest = max(lowest, other_lowest), min(highest, other_highest)
+        excluded |= other_excluded
+    return lowest, highest, excluded
+
+
+@dataclass
+class Domain:
+    """The narrowed domain of the integer variables of a generation."""
+
+    # The upper bound of the number of the different solutions, None if unknown.
+    max_solutions: int | None = None
+    # The constrained variables, drawn by `draw`: tightened intervals, or
+    # all but the last one enumerated, with the allowed values of the last one.
+    intervals: dict[VariableNameType, range] = field(default_factory=dict)
+    enumerated_names: tuple[VariableNameType, ...] = ()
+    last_name: VariableNameType = ""
+    combinations: list[tuple[tuple[int, ...], int, tuple[int, ...]]] = field(default_factory=list)
+    cumulative_counts: list[int] = field(default_factory=list)
+    # The integer variables not constrained by the conditions.
+    other_intervals: dict[VariableNameType, range] = field(default_factory=dict)
+
+    @property
+    def _num_of_constrained(self) -> int:
+        if self.cumulative_counts:
+            return self.cumulative_counts[-1]
+        return prod(len(interval) for interval in self.intervals.values())
+
+    @property
+    def size(self) -> int:
+        """The number of the combinations of the values of all the integer variables."""
+
+        return self._num_of_constrained * prod(len(interval) for interval in self.other_intervals.values())
+
+    def _constrained_values(self, index: int) -> dict[VariableNameType, int]:
+        if not self.cumulative_counts:
+            return _mixed_radix_values(self.intervals, index)
+
+        combination_index = bisect_right(self.cumulative_counts, index)
+        values, value, excluded = self.combinations[combination_index]
+
+        # The offset among the allowed values of the last variable.
+        value += index - (self.cumulative_counts[combination_index - 1] if combination_index else 0)
+        for excluded_value in excluded:
+            if excluded_value > value:
+                break
+            value += 1
+
+        return dict(zip(self.enumerated_names, values)) | {self.last_name: value}
+
+    def draw(self, rng: Random) -> dict[VariableNameType, int]:
+        """Draw the values of the constrained variables uniformly."""
+
+        if not self.cumulative_counts:
+            return {name: rng.randint(interval.start, interval.stop - 1) for name, interval in self.intervals.items()}
+
+        return self._constrained_values(rng.randrange(self.cumulative_counts[-1]))
+
+    def shuffled(self, rng: Random) -> Iterator[dict[VariableNameType, int]]:
+        """The values of all the integer variables, every combination once,
+        in uniformly random order. Generated lazily: the Fisher-Yates shuffle
+        of the indices of the combinations keeps only the swapped indices.
+        """
+
+        num_of_constrained = self._num_of_constrained
+        size = self.size
+        swapped: dict[int, int] = {}
+
+        for position in range(size):
+            chosen = rng.randrange(position, size)
+            index = swapped.get(chosen, chosen)
+            swapped[chosen] = swapped.pop(position, position)
+
+            yield self._constrained_values(index % num_of_constrained) | _mixed_radix_values(
+                self.other_intervals, index // num_of_constrained
+            )
+
+
+def _mixed_radix_values(intervals: Mapping[VariableNameType, range], index: int) -> dict[VariableNameType, int]:
+    """The values of the variables of the combination with the index,
+    in the order of all the combinations of the intervals.
+    """
+
+    values = {}
+    for name, interval in intervals.items():
+        index, offset = divmod(index, len(interval))
+        values[name] = interval[offset]
+    return values
+
+
+def _integer_domain(properties: VariableProperties) -> range:
+    # The same values as drawn by the generator: the integers of the interval,
+    # none if the interval is empty or has one point.
+    interval = properties.interval
+    if interval.start >= interval.stop:
+        return range(0)
+    return range(ceil(interval.start), floor(interval.stop) + 1)
+
+
+@lru_cache(maxsize=64)
+def _narrow(
+    integer_domains: tuple[tuple[VariableNameType, range], ...],
+    has_fractions: bool,
+    conditions: frozenset[FormulaType]
+) -> Domain:
+    domains = dict(integer_domains)
+    names = frozenset(domains)
+    constraints = [
+        constraint
+        for condition in sorted(conditions)
+        for constraint in _condition_constraints(condition, names)
+    ]
+    constrained_names = sorted(frozenset().union(*(constraint.names for constraint in constraints)))
+
+    # Tighten the intervals by the linear constraints, until they do not change
+    # or one of them is empty.
+    tightened = all(domains.values())
+    for _ in range(_MAX_TIGHTENING_ROUNDS):
+        if not tightened:
+            break
+        tightened = False
+
+        for constraint, name in (
+            (constraint, name) for constraint in constraints for name in constraint.names
+        ):
+            lowest, highest, _ = constraint.bound(name, domains)
+            domain = range(
+                int(max(domains[name].start, lowest)),
+                int(min(domains[name].stop - 1, highest)) + 1
+            )
+
+            if len(domain) < len(domains[name]):
+                domains[name] = domain if domain else range(0)
+                tightened = bool(domain)
+                if not domain:
+                    break
+
+    other_combinations = prod(len(domains[name]) for name in names if name not in constrained_names)
+    domain = Domain(
+        intervals={name: domains[name] for name in constrained_names},
+        other_intervals={name: domains[name] for name in sorted(names) if name not in constrained_names}
+    )
+
+    if not all(domains.values()):
+        domain.max_solutions = 0
+        return domain
+    if not constrained_names:
+        domain.max_solutions = None if has_fractions else other_combinations
+        return domain
+
+    # The variable with the most values is the last one, so the least are enumerated.
+    last_name = max(constrained_names, key=lambda name: len(domains[name]))
+    enumerated_names = tuple(name for name in constrained_names if name != last_name)
+
+    if prod(len(domains[name]) for name in enumerated_names) > MAX_ENUMERATION:
+        if not has_fractions:
+            domain.max_solutions = prod(len(interval) for interval in domains.values())
+        return domain
+
+    enumerated_constraints = [
+        constraint for constraint in constraints if last_name not in constraint.names
+    ]
+    last_constraints = [constraint for constraint in constraints if last_name in constraint.names]
+    total = 0
+
+    for values in product(*(domains[name] for name in enumerated_names)):
+        assignment = dict(zip(enumerated_names, values))
+        if not all(constraint.holds(assignment) for constraint in enumerated_constraints):
+            continue
+
+        count, lowest, excluded = _count(
+            domains[last_name],
+            _intersect(constraint.allowed(last_name, assignment) for constraint in last_constraints)
+        )
+        if count:
+            total += count
+            domain.combinations.append((values, lowest, excluded))
+            domain.cumulative_counts.append(total)
+
+    domain.enumerated_names = enumerated_names
+    domain.last_name = last_name
+    if total == 0 or not has_fractions:
+        domain.max_solutions = total * other_combinations
+
+    return domain
+
+
+def narrow(
+    variables: Mapping[VariableNameType, VariableProperties],
+    conditions: Iterable[FormulaType]
+) -> Domain:
+    """The narrowed domain of the integer variables by the conditions."""
+
+    return _narrow(
+        tuple(
+            (name, _integer_domain(properties))
+            for name, properties in variables.items()
+            if not properties.is_proper_fraction and not properties.is_decimal_fraction
+        ),
+        any(
+            properties.is_proper_fraction or properties.is_decimal_fraction
+            for properties in variables.values()
+        ),
+        frozenset(conditions)
+    )
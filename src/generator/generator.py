@@ -1,14 +1,41 @@
 from typing import Any
-from generator import _generator_builtins
+from generator import _generator_builtins, condition_order, domains
+from generator.stages import plan_stages
 from generator.types import *
 
+import metrics
+
+from collections import Counter
 from fractions import Fraction
-from random import randint, uniform
-from typing import Iterable
+from functools import lru_cache
+from random import Random
+from threading import Lock
+from types import CodeType
+from typing import Callable, Iterable
 from time import time
 
+import ast
+import random
+
+
+# Evaluation errors are counted per (formula, exception type) and printed
+# as a summary at most once per this number of seconds.
+ERRORS_REPORT_INTERVAL = 60.0
+
+# The values are drawn without replacement, if all the variables are integer,
+# and their domain has at most this many times more combinations than the
+# number of the solutions, as then most of the draws would be duplicates.
+WITHOUT_REPLACEMENT_FACTOR = 4
+
+_evaluation_errors: Counter[tuple[FormulaType, str]] = Counter()
+_evaluation_errors_lock = Lock()
+_last_errors_report_time = time()
+
 
-def _generate_value(properties: VariableProperties) -> VariableValueType | None:
+def _generate_value(
+    properties: VariableProperties,
+    rng: Random
+) -> VariableValueType | None:
     """Generate a value for a variable based on its properties.
     Returns None if the random value generation failed.
     """
@@ -19,9 +46,9 @@ def _generate_value(properties: VariableProperties) -> VariableValueType | None:
     value = float("inf")
 
     if properties.is_proper_fraction:
-        denominator = randint(2, 5)
+        denominator = rng.randint(2, 5)
 
-        numerator = randint(
+        numerator = rng.randint(
             int(properties.interval.start * denominator),
             int(properties.interval.stop * denominator)
         )
@@ -33,44 +60,261 @@ def _generate_value(properties: VariableProperties) -> VariableValueType | None:
 
         value = float(fraction)
     elif properties.is_decimal_fraction:
-        random_value = uniform(*properties.interval.float_tuple)
+        random_value = rng.uniform(*properties.interval.float_tuple)
 
-        value = round(random_value, randint(2, 2))
+        value = round(random_value, rng.randint(2, 2))
         
         if value.is_integer():
             return None
     else:
-        value = randint(*properties.interval.int_tuple)
+        value = rng.randint(*properties.interval.int_tuple)
 
     if properties.interval.contains(value):
         return value
     return None
 
 
+def _draw_values(
+    variables: Mapping[VariableNameType, VariableProperties],
+    rng: Random
+) -> dict[VariableNameType, VariableValueType] | None:
+    """Draw the values of all the variables.
+    Returns None if the random value generation failed.
+    """
+
+    values: dict[VariableNameType, VariableValueType] = {}
+
+    for var, properties in variables.items():
+        value = _generate_value(properties, rng)
+        if value is None:
+            return None
+        values[var] = value
+
+    return values
+
+
+def report_evaluation_errors(force: bool = False) -> None:
+    """Print the summary of the evaluation errors counted since the last
+    report, if the report interval has passed (or if forced).
+    """
+
+    global _last_errors_report_time
+
+    with _evaluation_errors_lock:
+        now = time()
+        if not _evaluation_errors or (
+            not force and now - _last_errors_report_time < ERRORS_REPORT_INTERVAL
+        ):
+            return
+
+        errors = _evaluation_errors.copy()
+        _evaluation_errors.clear()
+        period = now - _last_errors_report_time
+        _last_errors_report_time = now
+
+    print(
+        f"Log (OK): {errors.total()} evaluation errors in the last {period:.0f} s:",
+        *(
+            f"    {count} × {error} in {formula}"
+            for (formula, error), count in errors.most_common()
+        ),
+        sep="\n", flush=True
+    )
+
+    for (formula, error), count in errors.items():
+        metrics.increment("mathema_evaluation_errors_total", count, formula=formula, error=error)
+
+
+def _count_evaluation_error(formula: FormulaType, error: Exception) -> None:
+    with _evaluation_errors_lock:
+        _evaluation_errors[(formula, type(error).__name__)] += 1
+
+    if time() - _last_errors_report_time >= ERRORS_REPORT_INTERVAL:
+        report_evaluation_errors()
+
+
+def _zero_divisor_names(node: ast.expr) -> frozenset[VariableNameType] | None:
+    """Names of the variables, any of which being zero makes the expression zero
+    (e.g. `a` for `a`, `2*a` or `-a`, `a, b` for `a*b`).
+    Returns None if there are no such names or they can not be found statically.
+    """
+
+    match node:
+        case ast.Name(id=name):
+            return frozenset((name,))
+        case ast.UnaryOp(op=ast.USub() | ast.UAdd(), operand=operand):
+            return _zero_divisor_names(operand)
+        case ast.BinOp(left=left, op=ast.Mult(), right=right):
+            names: set[VariableNameType] = set()
+
+            for factor in (left, right):
+                if isinstance(factor, ast.Constant) and factor.value:
+                    continue
+
+                factor_names = _zero_divisor_names(factor)
+                if factor_names is None:
+                    return None
+                names |= factor_names
+
+            return frozenset(names) or None
+
+    return None
+
+
+def _unconditional_divisors(node: ast.AST) -> set[frozenset[VariableNameType]]:
+    """Find the divisors that are always evaluated when the expression is,
+    i.e. are not behind a short-circuiting `and`/`or`, conditional expression
+    or a chained comparison.
+    """
+
+    divisors: set[frozenset[VariableNameType]] = set()
+
+    match node:
+        case ast.BoolOp(values=[first, *_]):
+            children: list[ast.AST] = [first]
+        case ast.IfExp(test=test):
+            children = [test]
+        case ast.Compare(left=left, comparators=[first, *_]):
+            children = [left, first]
+        case ast.Lambda() | ast.ListComp() | ast.SetComp() | ast.DictComp() | ast.GeneratorExp():
+            children = []
+        case _:
+            children = list(ast.iter_child_nodes(node))
+
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Div, ast.FloorDiv, ast.Mod)):
+        names = _zero_divisor_names(node.right)
+        if names is not None:
+            divisors.add(names)
+
+    for child in children:
+        divisors |= _unconditional_divisors(child)
+
+    return divisors
+
+
+@lru_cache(maxsize=1024)
+def _compile_formula(formula: FormulaType) -> tuple[CodeType, tuple[VariableNameType, ...]]:
+    """Compile a formula once.
+    Returns the code object and the names of the variables, for which zero
+    value is known to make the formula fail with division by zero.
+    """
+
+    tree = ast.parse(formula.strip(), mode="eval")
+
+    zero_divisors: set[VariableNameType] = set()
+    for names in _unconditional_divisors(tree.body):
+        zero_divisors |= names
+
+    return compile(tree, "<formula>", "eval"), tuple(sorted(zero_divisors))
+
+
 def evaluate(
     formula: FormulaType,
     values: Mapping[VariableNameType, VariableValueType]
 ) -> Any:
     """Evaluate a formula (Python expression) with the given values.
-    Returns the result of the evaluation or False if an exception occurs.
+    Returns the result of the evaluation or -inf if an exception occurs.
     """
     try:
-        evaluation = eval(formula, _generator_builtins.__dict__, values)
+        code, zero_divisors = _compile_formula(formula)
+
+        # Short-circuit the cases which would raise ZeroDivisionError anyway.
+        for name in zero_divisors:
+            if values.get(name) == 0:
+                return float("-inf")
+
+        evaluation = eval(code, _generator_builtins.__dict__, values)
         if isinstance(evaluation, complex):
             return float("-inf")
         return evaluation
     except Exception as e:
-        print("Log (OK):", formula, e, flush=True)
+        _count_evaluation_error(formula, e)
         return float("-inf")
 
 
-def _is_solution(
-    values: Mapping[VariableNameType, VariableValueType],
-    conditions: Iterable[FormulaType]
-) -> bool:
-    """Check if the given values satisfy all the given conditions."""
+class FormulaEvaluationError(Exception):
+    """The formula raised an exception, or its result is complex."""
+
+    def __init__(self, formula: FormulaType) -> None:
+        super().__init__(formula)
+        self.formula = formula
 
-    return all(evaluate(cond, values) for cond in conditions)
+
+def evaluate_strict(
+    formula: FormulaType,
+    values: Mapping[VariableNameType, VariableValueType]
+) -> Any:
+    """Evaluate a formula like `evaluate`, but raise FormulaEvaluationError
+    instead of returning -inf (which is truthy as a condition).
+    """
+
+    try:
+        code, _ = _compile_formula(formula)
+        evaluation = eval(code, _generator_builtins.__dict__, values)
+    except Exception as e:
+        raise FormulaEvaluationError(formula) from e
+
+    if isinstance(evaluation, complex):
+        raise FormulaEvaluationError(formula)
+    return evaluation
+
+
+def _record_generation(
+    generator_location: str,
+    result: str,
+    start_time: float,
+    attempts: int,
+    accepted: int,
+    duplicates: int,
+    rejections: Counter[FormulaType]
+) -> None:
+    """Report the statistics of a generation run to the metrics."""
+
+    metrics.increment_many(
+        {
+            "mathema_generation_attempts_total": attempts,
+            "mathema_generation_accepted_total": accepted,
+            "mathema_generation_duplicates_total": duplicates,
+        },
+        page=generator_location
+    )
+    for condition, count in rejections.items():
+        metrics.increment(
+            "mathema_generation_rejections_total", count,
+            page=generator_location, condition=condition
+        )
+    metrics.increment("mathema_generation_runs_total", page=generator_location, result=result)
+    metrics.observe("mathema_generation_seconds", time() - start_time, page=generator_location)
+
+
+def _plan_stages(
+    variables: Mapping[VariableNameType, VariableProperties],
+    conditions: tuple[FormulaType, ...],
+    answers: tuple[FormulaType, ...],
+    strict: bool
+) -> tuple[
+    list[tuple[VariableNameType, VariableProperties, Callable[..., Any] | None, tuple[FormulaType, ...]]],
+    tuple[VariableNameType, ...]
+]:
+    """The stages of drawing the variables as tuples of the name and the
+    properties of the variable, the predicate and the conditions of its checks,
+    and the names of the variables in the order of drawing.
+    """
+
+    stages = plan_stages(
+        conditions, tuple(variables), evaluate_strict if strict else evaluate, answers,
+        frozenset(
+            name for name, properties in variables.items()
+            if not properties.is_proper_fraction and not properties.is_decimal_fraction
+        )
+    )
+    return (
+        [
+            (stage.variable, variables[stage.variable], stage.predicate, stage.conditions)
+            for stage in stages
+        ],
+        tuple(stage.variable for stage in stages)
+    )
 
 
 def generate_solutions(
@@ -78,38 +322,148 @@ def generate_solutions(
     conditions: Iterable[FormulaType],
     num_of_solutions: int,
     generator_location: str,
-    max_attempts_per_solution: int = 50_000
+    max_attempts_per_solution: int = 50_000,
+    is_canceled: Callable[[], bool] | None = None,
+    rng: Random | None = None,
+    answer_variables: Mapping[VariableNameType, FormulaType] | None = None,
+    strict: bool = False
 ) -> set[Solution] | None:
     """Generate solutions for the given variables and conditions.
     Returns a set of solutions, or None if there are not enough solutions
-    generated within the given number of attempts, or empty set if the
-    generation task was canceled.
+    generated within the given number of attempts, or empty set if
+    `is_canceled` returned True (e.g. the generation task was canceled).
+    The values are drawn from `rng` (seeded from the global random generator
+    by default), so the same seed generates the same solutions.
+    The solutions carry the answers for the `answer_variables` formulas,
+    rounded to 4 decimal places, computed while checking the conditions.
+    With `strict`, a condition or an answer raising an exception rejects
+    the values (see `evaluate_strict`), instead of -inf being truthy.
     """
 
     solutions: set[Solution] = set()
     start_time = time()
-    generation_task = GenerationTask()
 
-    for _ in range(max_attempts_per_solution * num_of_solutions):
-        if generation_task.canceled or hd.location().path != generator_location:
+    # The variables are drawn in stages, checking every condition as soon as
+    # its variables are drawn (see `stages.py`).
+    variable_names = tuple(variables)
+    answer_names = tuple(answer_variables or ())
+    answers = tuple((answer_variables or {}).values())
+    conditions = condition_order.order_conditions(generator_location, conditions)
+    stages, draw_order = _plan_stages(variables, conditions, answers, strict)
+
+    # The integer variables constrained by the conditions are drawn together
+    # from their narrowed domain (see `domains.py`).
+    domain = domains.narrow(variables, conditions)
+
+    if rng is None:
+        rng = Random(random.getrandbits(64))
+
+    # The values of the measurements are drawn from a separate generator,
+    # so that `rng` draws the same values whatever the measured order.
+    sample_rng = Random(random.getrandbits(64))
+
+    if is_canceled is None:
+        def is_canceled() -> bool:
+            return False
+
+    # The statistics are collected in local variables and reported once,
+    # at the end of the run.
+    attempts = accepted = 0
+    rejections: Counter[FormulaType] = Counter()
+    count_rejections = metrics.ENABLED
+
+    def record(result: str) -> None:
+        report_evaluation_errors()
+
+        if metrics.ENABLED:
+            _record_generation(
+                generator_location, result, start_time,
+                attempts, accepted, accepted - len(solutions), rejections
+            )
+
+    if domain.max_solutions is not None and domain.max_solutions < num_of_solutions:
+        record("failed")
+        return None
+
+    shuffled_values = None
+    if (
+        len(domain.intervals) + len(domain.other_intervals) == len(variables)
+        and domain.size <= WITHOUT_REPLACEMENT_FACTOR * num_of_solutions
+    ):
+        shuffled_values = domain.shuffled(rng)
+
+    for attempts in range(1, max_attempts_per_solution * num_of_solutions + 1):
+        if is_canceled():
+            record("canceled")
             return set()
         if time() - start_time > 60:
+            record("timeout")
             return None
 
-        values: dict[VariableNameType, VariableValueType] = {}
+        if attempts % condition_order.SAMPLE_INTERVAL == 1:
+            # Measured with the values of all the variables, drawn separately.
+            sample_values = _draw_values(variables, sample_rng)
+            if sample_values is not None:
+                condition_order.measure(generator_location, conditions, sample_values)
+
+        drawn: list[VariableValueType] = []
+        if shuffled_values is None:
+            narrowed_values = domain.draw(rng)
+        else:
+            narrowed_values = next(shuffled_values, None)
+            if narrowed_values is None:
+                # All the combinations are drawn.
+                record("failed")
+                return None
+
+        # The result of the last predicate, the answers if all the checks pass.
+        checked: Any = -1
 
-        for var, properties in variables.items():
-            value = _generate_value(properties)
+        for name, properties, predicate, stage_conditions in stages:
+            value = narrowed_values.get(name)
             if value is None:
+                value = _generate_value(properties, rng)
+            if value is None:
+                if count_rejections:
+                    rejections["<interval>"] += 1
                 break
 
-            values[var] = value
+            drawn.append(value)
+
+            if predicate is not None:
+                try:
+                    checked = predicate(*drawn)
+                except FormulaEvaluationError as e:
+                    # Raised only with `strict`.
+                    if count_rejections:
+                        rejections[e.formula] += 1
+                    break
+
+                if type(checked) is int and checked >= 0:
+                    if count_rejections:
+                        rejections[stage_conditions[checked]] += 1
+                    break
         else:
-            if _is_solution(values, conditions):
-                solutions.add(Solution(values))
+            values = dict(zip(draw_order, drawn))
+            if draw_order != variable_names:
+                values = {name: values[name] for name in variable_names}
+
+            accepted += 1
+            solutions.add(
+                Solution(values, answers=Solution(dict(zip(answer_names, checked)), values))
+                if answers else Solution(values)
+            )
             if len(solutions) == num_of_solutions:
                 break
+
+        if attempts % condition_order.REORDER_INTERVAL == 0:
+            reordered_conditions = condition_order.order_conditions(generator_location, conditions)
+            if reordered_conditions != conditions:
+                conditions = reordered_conditions
+                stages, draw_order = _plan_stages(variables, conditions, answers, strict)
     else:
+        record("failed")
         return None
 
+    record("ok")
     return solutions
@@ -0,0 +1,292 @@
+"""Cache of the generation results by the normalized generation request.
+
+Instead of the solutions of every single request, the cache keeps a pool of
+feasible solutions per problem (the page, intervals, fraction flags,
+conditions and answer formulas), a few times larger than the requested number of solutions.
+Every request draws its solutions from the pool with its own seed, so
+repeated requests are served instantly, the users still get different
+examples, and the same seed draws the same solutions again.
+
+Every pool is generated with its own random seed, kept with the pool. The
+seed returned for a request drawn from a pool carries the seed of the pool
+in its high bits (above `DRAW_SEED_BITS`), so the same seed draws the same
+solutions from the same pool, even if the pool was evicted from the cache
+and generated again. The failed requests are cached too.
+Both are also written to the disk cache shared by the server processes,
+where they expire after the same TTL. The disk entries are kept in
+a namespace versioned by the source of the generator, so the pools of
+the previous versions are not served after a deploy. They are written as
+JSON of the values and the answers of the solutions, not pickled, as
+unpickling a file of the shared directory could run any code.
+
+Configured with the environment variables:
+
+* `MATHEMA_RESULT_CACHE_SIZE` — the number of the cached pools and
+  failures (256 by default).
+* `MATHEMA_RESULT_CACHE_TTL` — seconds to keep them for (600 by default).
+"""
+
+from generator.generator import generate_solutions
+from generator.types import FormulaType, Solution, VariableNameType, VariableProperties
+import disk_cache
+import metrics
+
+from hashlib import sha256
+from random import Random
+from threading import Lock
+from typing import Annotated, Callable, Hashable, Mapping, TypeAlias, cast
+
+import glob
+import json
+import os
+
+from cachetools import TTLCache
+
+
+# The pool is this many times larger than the requested number of solutions,
+# rounded up to a power of two, so that close numbers share a pool.
+POOL_FACTOR = 4
+# Pools of the problems with too few feasible solutions fail fast,
+# then the solutions are generated for the request directly.
+POOL_MAX_ATTEMPTS_PER_SOLUTION = 1000
+# The bits of the seed of a request drawing from a pool. The higher bits are
+# the seed of the pool, or zero for a request drawing from any pool.
+DRAW_SEED_BITS = 64
+
+# The disk cache is pruned of the entries older than the TTL once per this many writes.
+_PRUNE_INTERVAL = 100
+
+MISSING = object()
+
+
+def _namespace() -> str:
+    """The disk cache namespace of the pools of this version of the generator."""
+
+    source = sha256()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+        with open(path, "rb") as file:
+            source.update(file.read())
+
+    return "pools-" + source.hexdigest()[:12]
+
+
+_PoolType: TypeAlias = tuple[
+    Annotated[int, "seed"],
+    Annotated[tuple[Solution, ...], "solutions"]
+]
+
+_NAMESPACE = _namespace()
+disk_cache.remove_namespaces("pools", keep=_NAMESPACE)
+
+_TTL = float(os.environ.get("MATHEMA_RESULT_CACHE_TTL", "600"))
+_cache: TTLCache[Hashable, _PoolType | None] = TTLCache(
+    maxsize=int(os.environ.get("MATHEMA_RESULT_CACHE_SIZE", "256")),
+    ttl=_TTL
+)
+_lock = Lock()
+_num_of_writes = 0
+
+
+def _pool_size(num_of_solutions: int) -> int:
+    return POOL_FACTOR * (1 << max(num_of_solutions - 1, 0).bit_length())
+
+
+def _pool_key(problem: Hashable, num_of_solutions: int) -> Hashable:
+    return ("pool", problem, _pool_size(num_of_solutions))
+
+
+def _failure_key(problem: Hashable, num_of_solutions: int) -> Hashable:
+    return ("failure", problem, num_of_solutions)
+
+
+def _disk_key(key: Hashable) -> str:
+    # The conditions are sorted, as the order of a frozenset differs between processes.
+    kind, (location, variables, conditions, answer_variables), num_of_solutions = key
+    return repr((kind, location, variables, sorted(conditions), answer_variables, num_of_solutions))
+
+
+def _dumps(value: _PoolType | None) -> bytes:
+    if value is None:
+        return b"null"
+
+    seed, solutions = value
+    return json.dumps([
+        seed,
+        [
+            [dict(solution), None if solution.answers is None else dict(solution.answers)]
+            for solution in solutions
+        ]
+    ]).encode()
+
+
+def _loads(content: bytes) -> _PoolType | None | object:
+    """The pool or failure of the disk entry. `MISSING` if the entry is malformed."""
+
+    try:
+        value = json.loads(content)
+        if value is None:
+            return None
+
+        seed, solutions = value
+        return int(seed), tuple(
+            Solution(values, answers=None if answers is None else Solution(answers))
+            for values, answers in solutions
+        )
+    except (ValueError, TypeError, AttributeError):
+        return MISSING
+
+
+def _get(key: Hashable) -> _PoolType | None | object:
+    """The cached pool or failure, from the memory or the disk. `MISSING` if not cached."""
+
+    with _lock:
+        value = _cache.get(key, MISSING)
+    if value is not MISSING:
+        return value
+
+    content = disk_cache.read(_NAMESPACE, _disk_key(key), max_age=_TTL)
+    if content is None:
+        return MISSING
+
+    value = _loads(content)
+    if value is MISSING:
+        return MISSING
+
+    with _lock:
+        _cache[key] = value
+    return value
+
+
+def _put(key: Hashable, value: _PoolType | None) -> _PoolType | None:
+    """Cache the pool or failure. Returns the cached value, which is the one
+    written first, if another process has cached the same key meanwhile.
+    """
+
+    global _num_of_writes
+
+    written = _loads(disk_cache.write(_NAMESPACE, _disk_key(key), _dumps(value), max_age=_TTL))
+    if written is not MISSING:
+        value = cast(_PoolType | None, written)
+
+    with _lock:
+        _cache[key] = value
+        _num_of_writes += 1
+        prune = _num_of_writes % _PRUNE_INTERVAL == 0
+
+    if prune:
+        disk_cache.prune(_NAMESPACE, _TTL)
+
+    return value
+
+
+def _draw(pool: _PoolType, num_of_solutions: int, seed: int) -> tuple[set[Solution], int]:
+    """Draw the solutions from the pool. Returns them with the seed
+    of the draw and the pool.
+    """
+
+    pool_seed, solutions = pool
+    draw_seed = seed & ((1 << DRAW_SEED_BITS) - 1)
+
+    return (
+        set(Random(draw_seed).sample(solutions, num_of_solutions)),
+        pool_seed << DRAW_SEED_BITS | draw_seed
+    )
+
+
+def _fits(pool: _PoolType, seed: int) -> bool:
+    """Whether the seed of the request draws from the pool."""
+
+    return seed >> DRAW_SEED_BITS in (0, pool[0])
+
+
+def lookup(
+    problem: Hashable,
+    num_of_solutions: int,
+    seed: int
+) -> tuple[set[Solution] | None, int] | object:
+    """The cached result of the request: the solutions, or None if the
+    generation is known to fail, with the seed to generate them again.
+    `MISSING` if the result is not cached.
+    """
+
+    pool = _get(_pool_key(problem, num_of_solutions))
+
+    if pool is not MISSING and pool is not None:
+        if _fits(pool, seed):
+            metrics.increment("mathema_result_cache_hits_total")
+            return _draw(pool, num_of_solutions, seed)
+    elif _get(_failure_key(problem, num_of_solutions)) is not MISSING:
+        metrics.increment("mathema_result_cache_hits_total")
+        return None, seed
+
+    metrics.increment("mathema_result_cache_misses_total")
+    return MISSING
+
+
+def generate(
+    problem: Hashable,
+    variables: Mapping[VariableNameType, VariableProperties],
+    conditions: frozenset[FormulaType],
+    num_of_solutions: int,
+    generator_location: str,
+    seed: int,
+    is_canceled: Callable[[], bool],
+    answer_variables: Mapping[VariableNameType, FormulaType] | None = None
+) -> tuple[set[Solution] | None, int]:
+    """Generate the solutions of the request through the pool of its problem,
+    caching the pool. Returns the same as `generate_solutions`, with the seed
+    to generate the same solutions again.
+    The answers are cached with the solutions of the pool, as their formulas
+    are a part of the problem.
+    """
+
+    pool_key = _pool_key(problem, num_of_solutions)
+    pool = _get(pool_key)
+
+    # The pool of the seed is generated again, if another pool is cached instead.
+    if pool is MISSING or (pool is not None and not _fits(pool, seed)):
+        pool_seed = seed >> DRAW_SEED_BITS or Random().randrange(1, 1 << DRAW_SEED_BITS)
+        pool_solutions = generate_solutions(
+            variables,
+            conditions,
+            _pool_size(num_of_solutions),
+            generator_location,
+            max_attempts_per_solution=POOL_MAX_ATTEMPTS_PER_SOLUTION,
+            is_canceled=is_canceled,
+            rng=Random(pool_seed),
+            answer_variables=answer_variables
+        )
+        if is_canceled():
+            return set(), seed
+
+        # Sorted, as the order of a set of solutions differs between processes,
+        # and the same seed must draw the same solutions in all of them.
+        generated = (
+            (pool_seed, tuple(sorted(pool_solutions, key=lambda solution: tuple(sorted(solution.items())))))
+            if pool_solutions is not None else None
+        )
+
+        if pool is MISSING:
+            # Another process may have cached its pool meanwhile.
+            cached = _put(pool_key, generated)
+            if cached is not None and _fits(cached, seed):
+                generated = cached
+
+        pool = generated
+
+    if pool is not None:
+        return _draw(pool, num_of_solutions, seed)
+
+    solutions = generate_solutions(
+        variables,
+        conditions,
+        num_of_solutions,
+        generator_location,
+        is_canceled=is_canceled,
+        rng=Random(seed),
+        answer_variables=answer_variables
+    )
+    if solutions is None:
+        _put(_failure_key(problem, num_of_solutions), None)
+
+    return solutions, seed
@@ -0,0 +1,235 @@
+"""Admission control of the generation requests.
+
+Every generation goes through the scheduler, which:
+
+* runs at most `MATHEMA_GENERATION_CONCURRENCY` generations at once
+  (the number of CPUs by default) and queues the rest first in, first out;
+* is full with `MATHEMA_GENERATION_QUEUE` requests waiting (100 by default),
+  then the new requests are not admitted;
+* keeps at most one request per session: a new request of the session
+  replaces its previous one;
+* coalesces identical concurrent requests (the same page, intervals,
+  conditions and number of solutions) into one generation,
+  whose solutions are shared by all the requesting sessions;
+* serves the requests, whose results are cached, without queueing them.
+"""
+
+from generator import result_cache
+from generator.types import FormulaType, Solution, VariableNameType, VariableProperties
+import metrics
+import profiling
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from threading import Event, Lock
+from time import perf_counter
+from typing import Annotated, Hashable, Mapping, TypeAlias, cast
+
+import os
+
+
+RequestKeyType: TypeAlias = tuple[
+    Annotated[str, "location"],
+    Annotated[tuple[tuple[VariableNameType, float, float, bool, bool], ...], "variables"],
+    Annotated[frozenset[FormulaType], "conditions"],
+    Annotated[tuple[tuple[VariableNameType, FormulaType], ...], "answer variables"],
+    Annotated[int, "number of solutions"]
+]
+GenerationResultType: TypeAlias = tuple[
+    Annotated[set[Solution] | None, "solutions"],
+    Annotated[int, "seed"]
+]
+
+
+def request_key(
+    location: str,
+    variables: Mapping[VariableNameType, VariableProperties],
+    conditions: frozenset[FormulaType],
+    num_of_solutions: int,
+    answer_variables: Mapping[VariableNameType, FormulaType] | None = None
+) -> RequestKeyType:
+    """Normalized inputs of a generation, equal for the identical requests.
+    The answers are cached with the solutions, so their formulas are a part
+    of the inputs too.
+    """
+
+    return (
+        location,
+        tuple(sorted(
+            (
+                name,
+                properties.interval.start,
+                properties.interval.stop,
+                properties.is_proper_fraction,
+                properties.is_decimal_fraction
+            )
+            for name, properties in variables.items()
+        )),
+        conditions,
+        tuple(sorted((answer_variables or {}).items())),
+        num_of_solutions
+    )
+
+
+@dataclass(eq=False)
+class _Job:
+    key: RequestKeyType
+    variables: Mapping[VariableNameType, VariableProperties]
+    answer_variables: Mapping[VariableNameType, FormulaType]
+    seed: int
+    future: Future[GenerationResultType] = field(default_factory=Future)
+    # One cancel event per requesting session.
+    cancel_events: list[Event] = field(default_factory=list)
+    submit_time: float = field(default_factory=perf_counter)
+
+    @property
+    def canceled(self) -> bool:
+        return all(cancel_event.is_set() for cancel_event in self.cancel_events)
+
+
+class GenerationScheduler:
+    def __init__(self, max_concurrent: int, max_waiting: int) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+
+        self._executor = ThreadPoolExecutor(max_concurrent, thread_name_prefix="mathema-generation")
+        self._lock = Lock()
+        self._waiting: OrderedDict[RequestKeyType, _Job] = OrderedDict()
+        self._running: dict[RequestKeyType, _Job] = {}
+        self._num_running = 0
+        self._session_jobs: dict[Hashable, tuple[_Job, Event]] = {}
+
+    @property
+    def full(self) -> bool:
+        return len(self._waiting) >= self.max_waiting
+
+    def submit(
+        self,
+        session: Hashable,
+        variables: Mapping[VariableNameType, VariableProperties],
+        conditions: frozenset[FormulaType],
+        num_of_solutions: int,
+        location: str,
+        seed: int,
+        cancel_event: Event,
+        answer_variables: Mapping[VariableNameType, FormulaType] | None = None
+    ) -> Future[GenerationResultType]:
+        """Request a generation for the session.
+        Returns the future of the solutions (None if the generation failed,
+        empty set if canceled) and of the seed to generate them again,
+        which is derived from the seed of the first of the coalesced requests
+        (see `result_cache`).
+        The solutions carry the answers for the `answer_variables` formulas,
+        which are a part of the identical requests.
+        """
+
+        key = request_key(location, variables, conditions, num_of_solutions, answer_variables)
+
+        with self._lock:
+            previous = self._session_jobs.pop(session, None)
+            if previous is not None:
+                _, previous_cancel_event = previous
+                previous_cancel_event.set()
+
+            cached = result_cache.lookup(key[:4], num_of_solutions, seed)
+            if cached is not result_cache.MISSING:
+                future: Future[GenerationResultType] = Future()
+                future.set_result(cast(GenerationResultType, cached))
+                return future
+
+            job = self._running.get(key) or self._waiting.get(key)
+            if job is None or job.canceled:
+                if key in self._waiting:
+                    self._waiting.pop(key).future.set_result((set(), seed))
+
+                job = _Job(key, variables, answer_variables or {}, seed)
+                self._waiting[key] = job
+            else:
+                metrics.increment("mathema_generation_coalesced_total", page=location)
+
+            job.cancel_events.append(cancel_event)
+            self._session_jobs[session] = (job, cancel_event)
+
+            self._dispatch()
+
+        metrics.set_gauge("mathema_generation_queue_depth", len(self._waiting))
+        return job.future
+
+    def position(self, future: Future) -> int:
+        """Position of the request in the queue, starting from 1.
+        0 if the request is not waiting anymore.
+        """
+
+        with self._lock:
+            for position, job in enumerate(self._waiting.values(), 1):
+                if job.future is future:
+                    return position
+
+        return 0
+
+    def _dispatch(self) -> None:
+        """Start the waiting jobs while there are free slots. Called under the lock."""
+
+        while self._waiting and self._num_running < self.max_concurrent:
+            key, job = self._waiting.popitem(last=False)
+
+            if job.canceled:
+                job.future.set_result((set(), job.seed))
+                continue
+
+            self._running[key] = job
+            self._num_running += 1
+            metrics.observe(
+                "mathema_generation_wait_seconds", perf_counter() - job.submit_time, page=key[0]
+            )
+            self._executor.submit(self._run, job)
+
+    def _run(self, job: _Job) -> None:
+        location, _, conditions, _, num_of_solutions = job.key
+
+        try:
+            with profiling.profiled(
+                "generation", location,
+                n=num_of_solutions,
+                variables=",".join(
+                    f"{name}[{start:g},{stop:g}]"
+                    + ("p" if is_proper_fraction else "")
+                    + ("d" if is_decimal_fraction else "")
+                    for name, start, stop, is_proper_fraction, is_decimal_fraction in job.key[1]
+                ),
+                conditions=len(conditions)
+            ):
+                result = result_cache.generate(
+                    job.key[:4],
+                    job.variables,
+                    conditions,
+                    num_of_solutions,
+                    location,
+                    job.seed,
+                    is_canceled=lambda: job.canceled,
+                    answer_variables=job.answer_variables
+                )
+        except BaseException as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        finally:
+            with self._lock:
+                self._num_running -= 1
+                # A canceled job may have been replaced by a new one with the same key.
+                if self._running.get(job.key) is job:
+                    del self._running[job.key]
+                for session, (session_job, _) in list(self._session_jobs.items()):
+                    if session_job is job:
+                        del self._session_jobs[session]
+
+                self._dispatch()
+
+            metrics.set_gauge("mathema_generation_queue_depth", len(self._waiting))
+
+
+scheduler = GenerationScheduler(
+    int(os.environ.get("MATHEMA_GENERATION_CONCURRENCY", str(os.cpu_count() or 1))),
+    int(os.environ.get("MATHEMA_GENERATION_QUEUE", "100"))
+)
@@ -0,0 +1,128 @@
+"""Staged drawing of the variables with early rejection.
+
+Instead of drawing all the variables and then checking all the conditions,
+the variables are drawn one by one, and every condition is checked as soon as
+all the variables it references are drawn. An attempt stops at the first
+failed check, without drawing the rest of the variables.
+
+A condition of the form `x and y and ...` is also checked by its prefixes,
+which reference fewer variables (e.g. `a != 0` of `a != 0 and b != 0`).
+The prefix rejects the values only if it is falsy, in which case the whole
+condition is falsy too, so the accepted values are the same as when checking
+the whole conditions only. The whole condition is still checked, when all
+its variables are drawn.
+
+The variables referenced by the checks with the fewest variables are drawn
+first. The draw order depends only on the conditions, not on their order
+(which adapts while generating, see `condition_order.py`), so an attempt
+takes the same values from the random generator whatever the order, and the
+same seed generates the same solutions. The order of the conditions orders
+the checks within a stage.
+The answers are computed by the predicate of the last stage, reusing the
+subexpressions of its checks.
+"""
+
+from generator.compiler import EvaluateType, PredicateType, compile_conditions
+from generator.types import FormulaType, VariableNameType
+
+from dataclasses import dataclass
+from functools import lru_cache
+
+import ast
+
+
+@dataclass(frozen=True)
+class Stage:
+    # Drawn at this stage, after the variables of the previous stages.
+    variable: VariableNameType
+    # The conditions or their prefixes, checked once the variable is drawn.
+    checks: tuple[FormulaType, ...]
+    # The condition of every check, which the values fail if the check fails.
+    conditions: tuple[FormulaType, ...]
+    # Takes the values of the drawn variables in the order of the stages.
+    # Returns the index of the failed check, otherwise -1 or the values of
+    # the answers in the last stage. None if there are no checks and answers.
+    predicate: PredicateType | None
+
+
+def _names(node: ast.AST, variable_names: frozenset[VariableNameType]) -> frozenset[VariableNameType]:
+    return frozenset(
+        child.id for child in ast.walk(node)
+        if isinstance(child, ast.Name) and child.id in variable_names
+    )
+
+
+def _checks(
+    condition: FormulaType,
+    variable_names: frozenset[VariableNameType]
+) -> list[tuple[FormulaType, frozenset[VariableNameType]]]:
+    """The condition and its longest `and` prefixes referencing fewer variables,
+    with the referenced variables, the prefixes first.
+    """
+
+    try:
+        tree = ast.parse(condition.strip(), mode="eval").body
+    except SyntaxError:
+        return [(condition, variable_names)]
+
+    names = _names(tree, variable_names)
+    prefixes: dict[frozenset[VariableNameType], FormulaType] = {}
+
+    if isinstance(tree, ast.BoolOp) and isinstance(tree.op, ast.And):
+        for i in range(1, len(tree.values)):
+            prefix = tree.values[0] if i == 1 else ast.BoolOp(ast.And(), tree.values[:i])
+            prefix_names = _names(prefix, variable_names)
+
+            if prefix_names < names:
+                # The longer prefixes with the same variables overwrite the shorter ones.
+                prefixes[prefix_names] = ast.unparse(prefix)
+
+    return [(prefix, prefix_names) for prefix_names, prefix in prefixes.items()] + [(condition, names)]
+
+
+@lru_cache(maxsize=256)
+def plan_stages(
+    conditions: tuple[FormulaType, ...],
+    variable_names: tuple[VariableNameType, ...],
+    evaluate: EvaluateType,
+    answers: tuple[FormulaType, ...] = (),
+    integer_names: frozenset[VariableNameType] = frozenset()
+) -> tuple[Stage, ...]:
+    """Plan the order of drawing the variables and the checks after each one.
+    `evaluate` evaluates a single formula, when a predicate falls back to it.
+    The `integer_names` variables always have integer values.
+    """
+
+    all_names = frozenset(variable_names)
+    checks = [
+        (check, names, condition)
+        for condition in conditions
+        for check, names in _checks(condition, all_names)
+    ]
+
+    draw_order: list[VariableNameType] = []
+    for _, names, _ in sorted(checks, key=lambda check: (len(check[1]), check[0])):
+        draw_order += [name for name in variable_names if name in names and name not in draw_order]
+    draw_order += [name for name in variable_names if name not in draw_order]
+
+    stage_checks: list[dict[FormulaType, FormulaType]] = [{} for _ in draw_order]
+    for check, names, condition in checks:
+        stage = max((draw_order.index(name) for name in names), default=0)
+        stage_checks[stage].setdefault(check, condition)
+
+    stages = []
+    for i, (variable, checks_conditions) in enumerate(zip(draw_order, stage_checks)):
+        stage_answers = answers if i == len(draw_order) - 1 else ()
+
+        stages.append(Stage(
+            variable,
+            tuple(checks_conditions),
+            tuple(checks_conditions.values()),
+            compile_conditions(
+                tuple(checks_conditions), tuple(draw_order[:i + 1]), evaluate,
+                stage_answers, integer_names
+            )
+            if checks_conditions or stage_answers else None
+        ))
+
+    return tuple(stages)
@@ -2,6 +2,7 @@ from collections import OrderedDict
 from collections.abc import Mapping
 from dataclasses import dataclass
 from math import ceil
+from threading import Event
 from typing import Annotated, TypeAlias
 
 import hyperdiv as hd
@@ -37,10 +38,22 @@ class VariableProperties:
 
 
 class Solution(Mapping):
-    """Immutable and hashable mapping of variables to their values."""
-
-    def __init__(self, *solution_dictionary: Mapping[VariableNameType, VariableValueType]):
+    """Immutable and hashable mapping of variables to their values.
+    May carry the answers computed with it by the generator (the answer
+    variables and the variables of the solution), which do not take part
+    in the comparison and hashing.
+    """
+
+    answers: "Solution | None" = None
+
+    def __init__(
+        self,
+        *solution_dictionary: Mapping[VariableNameType, VariableValueType],
+        answers: "Solution | None" = None
+    ):
         self.__dict = {k: v for d in solution_dictionary for k, v in d.items()}
+        if answers is not None:
+            self.answers = answers
 
     def __iter__(self):
         return iter(self.__dict)
@@ -57,21 +70,33 @@ class Solution(Mapping):
 
 @hd.global_state
 class GenerationTask(hd.task):
-    """Global cancelable task to control the generation process."""
+    """Cancelable task to control the generation process.
+    Global within the session: every session (websocket connection) has its own.
+    Each run gets its own cancel event, so canceling or rerunning the task
+    never affects the other runs or sessions.
+    """
 
-    _canceled: bool = hd.Prop(hd.Any, False)
+    _cancel_event: Event | None = hd.Prop(hd.Any, None)
 
     @property
     def canceled(self) -> bool:
-        return self._canceled
-    
+        return self._cancel_event is not None and self._cancel_event.is_set()
+
+    @property
+    def cancel_event(self) -> Event:
+        """The cancel event of the current run."""
+
+        return self._cancel_event or Event()
+
     def cancel(self) -> None:
-        self._canceled = True
+        if self._cancel_event is not None:
+            self._cancel_event.set()
 
     def clear(self, *args, **kwargs) -> None:
         self.cancel()
         super().clear(*args, **kwargs)
     
     def run(self, *args, **kwargs) -> None:
-        self._canceled = False
+        if not self.running and not self.done:
+            self._cancel_event = Event()
         super().run(*args, **kwargs)
@@ -1,11 +1,25 @@
-from components import style
+# The startup time is measured from before the imports.
+from time import perf_counter
+_start_time = perf_counter()
+
+from components import session_results, style
+from components.components import GeneratorState
+from components.tex_image_generator import warm_up
+import metrics
 import registrar
+import task_executor
 from routes import (
     basic_arithmetic,
+    custom,
     linear_equations,
-    quadratic_equations
+    quadratic_equations,
+    worksheets
 )
 
+from threading import Thread
+from typing import Any
+
+import asyncio
 import os
 
 import hyperdiv as hd
@@ -14,7 +28,31 @@ import hyperdiv as hd
 router = registrar.router
 
 
+class _ByKey:
+    """A component argument of an `hd.cached` function.
+    The cache key hashes the arguments, and the components are new objects
+    on every render, so they are compared by their keys, which do not change.
+    """
+
+    def __init__(self, component: hd.Component | None) -> None:
+        self.component = component
+
+    def _key(self) -> Any:
+        return None if self.component is None else self.component._key
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _ByKey) and self._key() == other._key()
+
+
+# The static parts of the page are `hd.cached`: a re-render (e.g. after moving
+# a slider) reuses their components, unless the state they read has changed
+# (e.g. the location for the menu and the breadcrumbs, the theme for the images).
+
 @router.route("/")
+@hd.cached
 def index():
     hd.h1("Матема+").text_gradient = (0, hd.Color.neutral_800, hd.Color.neutral_900)
 
@@ -70,26 +108,37 @@ def index():
     )
 
 
+@hd.cached
+def sidebar_menu(drawer: _ByKey) -> None:
+    with hd.hbox(gap=1, align="center"):
+        hd.icon("gear", font_size=hd.FontSize.large)
+        hd.text("Генератори", font_size=hd.FontSize.large)
+
+    # The same as `app.add_sidebar_menu`, which adds the menu to the sidebar itself.
+    hd.navigation_menu(registrar.get_sidebar_menu(), drawer=drawer.component)
+
+
+@hd.cached
+def breadcrumb(location_path: str) -> None:
+    with hd.breadcrumb(margin=(0, 2, 0, 1)):
+        names = registrar.get_names(location_path)
+        if names is not None:
+            section_name, page_name = names
+            hd.breadcrumb_item(section_name, href="#")
+            hd.breadcrumb_item(page_name, href="#")
+
+
 def sidebar(app: hd.template) -> None:
     with app.sidebar:
-        with hd.hbox(gap=1, align="center"):
-            hd.icon("gear", font_size=hd.FontSize.large)
-            hd.text("Генератори", font_size=hd.FontSize.large)
+        sidebar_menu(_ByKey(app.drawer))
 
-    app.add_sidebar_menu(registrar.get_sidebar_menu())
     app.sidebar.background_color = hd.Color.neutral_50
     app.drawer.body_style = hd.style(background_color=hd.Color.neutral_50)
 
 
 def topbar(app: hd.template) -> None:
     with app.topbar_links:
-        with hd.breadcrumb(margin=(0, 2, 0, 1)):
-            loc = hd.location().path
-            names = registrar.get_names(loc)
-            if names is not None:
-                section_name, page_name = names
-                hd.breadcrumb_item(section_name, href="#")
-                hd.breadcrumb_item(page_name, href="#")
+        breadcrumb(hd.location().path)
 
 
 def content(app: hd.template, responsive_threshold: int) -> None:
@@ -108,6 +157,12 @@ def content(app: hd.template, responsive_threshold: int) -> None:
             router.run()
 
 
+def _report_startup_time() -> None:
+    startup_time = perf_counter() - _start_time
+    print(f"Log (OK): started in {startup_time:.2f} s.", flush=True)
+    metrics.set_gauge("mathema_startup_seconds", startup_time)
+
+
 def main() -> None:
     responsive_threshold = 1000
     
@@ -117,6 +172,10 @@ def main() -> None:
         responsive_threshold=responsive_threshold
     )
     
+    # Cancels the generation of the previous page on any location change,
+    # also to the pages without the generator components.
+    GeneratorState().reset_if_location_changed()
+
     sidebar(app)
     topbar(app)
     content(app, responsive_threshold)
@@ -125,11 +184,25 @@ def main() -> None:
 if __name__ == "__main__":
     os.environ["HD_PRODUCTION"] = "1"
     os.environ["HD_PRINT_OUTPUT"] = "0"
-    os.environ["HD_HOST"] = "0.0.0.0"
-    os.environ["HD_PORT"] = "8888"
+    # The balancer (see `balancer.py`) starts the workers on their own ports.
+    os.environ.setdefault("HD_HOST", "0.0.0.0")
+    os.environ.setdefault("HD_PORT", "8888")
+
+    metrics.start_exporter()
+    session_results.start_evictor()
+
+    # matplotlib is loaded in the background, while the server starts.
+    Thread(target=warm_up, daemon=True).start()
+
+    # hyperdiv serves on the event loop of the main thread, which runs the
+    # callback once the server listens on its port.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.call_soon(_report_startup_time)
 
     hd.run(
         main,
+        executor=task_executor.executor,
         index_page=hd.index_page(
             title="Матема+",
             css_assets=["/assets/index.css"],
@@ -0,0 +1,193 @@
+"""Metrics of the generation and rendering hot paths.
+
+Disabled by default. Enabled with the `MATHEMA_METRICS` environment variable:
+
+* `MATHEMA_METRICS=prometheus` serves the metrics in the Prometheus text
+  format at `http://localhost:<MATHEMA_METRICS_PORT>/metrics` (port 9888 by default).
+* `MATHEMA_METRICS=json` prints a JSON snapshot of the metrics every
+  `MATHEMA_METRICS_INTERVAL` seconds (60 by default).
+
+When disabled, the recording functions return immediately, and the hot
+loops check `ENABLED` once per call rather than once per iteration.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep, time
+from typing import Annotated, TypeAlias
+
+import json
+import os
+
+
+MetricKeyType: TypeAlias = tuple[
+    Annotated[str, "metric name"],
+    Annotated[tuple[tuple[str, str], ...], "sorted labels"]
+]
+
+
+ENABLED = os.environ.get("MATHEMA_METRICS", "") in ("prometheus", "json")
+
+_values: dict[MetricKeyType, float] = {}
+_lock = Lock()
+
+
+def _key(name: str, labels: dict[str, str]) -> MetricKeyType:
+    return name, tuple(sorted(labels.items()))
+
+
+def increment(name: str, value: float = 1, **labels: str) -> None:
+    """Add the value to a counter."""
+
+    if not ENABLED:
+        return
+
+    key = _key(name, labels)
+    with _lock:
+        _values[key] = _values.get(key, 0) + value
+
+
+def increment_many(counters: dict[str, float], **labels: str) -> None:
+    """Add the values to several counters with the same labels at once."""
+
+    if not ENABLED:
+        return
+
+    with _lock:
+        for name, value in counters.items():
+            key = _key(name, labels)
+            _values[key] = _values.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels: str) -> None:
+    """Set the current value of a gauge (e.g. a size in bytes)."""
+
+    if not ENABLED:
+        return
+
+    with _lock:
+        _values[_key(name, labels)] = value
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    """Record an observation of a summary (e.g. a duration in seconds)."""
+
+    if not ENABLED:
+        return
+
+    sum_key, count_key = _key(name + "_sum", labels), _key(name + "_count", labels)
+    with _lock:
+        _values[sum_key] = _values.get(sum_key, 0) + value
+        _values[count_key] = _values.get(count_key, 0) + 1
+
+
+def reset() -> None:
+    with _lock:
+        _values.clear()
+
+
+def _ratio(
+    values: dict[MetricKeyType, float],
+    name: str,
+    numerator: str,
+    denominators: tuple[str, ...]
+) -> None:
+    """Add a ratio gauge derived from the counters with the same labels."""
+
+    for (metric_name, labels), value in list(values.items()):
+        if metric_name != numerator:
+            continue
+
+        total = sum(values.get((denominator, labels), 0) for denominator in denominators)
+        if total:
+            values[(name, labels)] = value / total
+
+
+def snapshot() -> dict[MetricKeyType, float]:
+    """Copy of the current values, including the derived ratios."""
+
+    with _lock:
+        values = dict(_values)
+
+    _ratio(
+        values, "mathema_generation_acceptance_ratio",
+        "mathema_generation_accepted_total", ("mathema_generation_attempts_total",)
+    )
+    _ratio(
+        values, "mathema_generation_duplicate_ratio",
+        "mathema_generation_duplicates_total", ("mathema_generation_accepted_total",)
+    )
+    _ratio(
+        values, "mathema_image_cache_hit_ratio",
+        "mathema_image_cache_hits_total",
+        ("mathema_image_cache_hits_total", "mathema_image_cache_misses_total")
+    )
+
+    return values
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text() -> str:
+    lines: list[str] = []
+
+    for (name, labels), value in sorted(snapshot().items()):
+        labels_text = ",".join(
+            f'{label}="{_escape_label_value(label_value)}"'
+            for label, label_value in labels
+        )
+        lines.append(f"{name}{{{labels_text}}} {value}" if labels_text else f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def json_text() -> str:
+    return json.dumps({
+        "time": time(),
+        "metrics": [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(snapshot().items())
+        ]
+    }, ensure_ascii=False)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        body = prometheus_text().encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def _log_periodically(interval: float) -> None:
+    while True:
+        sleep(interval)
+        print(json_text(), flush=True)
+
+
+def start_exporter() -> None:
+    """Start the exporter chosen by `MATHEMA_METRICS` in a daemon thread."""
+
+    mode = os.environ.get("MATHEMA_METRICS", "")
+
+    if mode == "prometheus":
+        server = ThreadingHTTPServer(
+            ("localhost", int(os.environ.get("MATHEMA_METRICS_PORT", "9888"))),
+            _MetricsHandler
+        )
+        Thread(target=server.serve_forever, daemon=True).start()
+    elif mode == "json":
+        interval = float(os.environ.get("MATHEMA_METRICS_INTERVAL", "60"))
+        Thread(target=_log_periodically, args=(interval,), daemon=True).start()
@@ -0,0 +1,75 @@
+"""Per-request profiling of the generation and rendering.
+
+Disabled by default. `MATHEMA_PROFILE=1` wraps every generation task and
+every `show_solutions` call in a deterministic profiler (cProfile) and
+writes the profiles to `MATHEMA_PROFILE_DIR` (`profiles` by default).
+The file names contain the page route and the settings of the request,
+and the profiles can be opened with `pstats` or `snakeviz`.
+"""
+
+from contextlib import contextmanager
+from cProfile import Profile
+from hashlib import sha256
+from itertools import count
+from time import localtime, strftime, time
+from typing import Any, Iterator
+
+import os
+import re
+
+
+ENABLED = os.environ.get("MATHEMA_PROFILE", "") not in ("", "0")
+PROFILES_DIRECTORY = os.environ.get("MATHEMA_PROFILE_DIR", "profiles")
+
+_MAX_SETTINGS_LENGTH = 120
+
+# Numbers the profiles of the process, as the requests with the same
+# settings can finish within the same millisecond.
+_profile_numbers = count()
+
+
+def _profile_path(kind: str, location: str, settings: dict[str, Any]) -> str:
+    route = location.strip("/").replace("/", ".") or "index"
+    settings_text = re.sub(
+        r"[^\w.,=\-\[\]]+", "",
+        "_".join(f"{name}={value}" for name, value in settings.items())
+    )
+
+    # Long settings (e.g. the conditions) are cut, the hash keeps the names unique.
+    if len(settings_text) > _MAX_SETTINGS_LENGTH:
+        settings_text = (
+            settings_text[:_MAX_SETTINGS_LENGTH] + "_"
+            + sha256(settings_text.encode()).hexdigest()[:8]
+        )
+
+    now = time()
+    file_name = (
+        f"{strftime('%Y%m%d-%H%M%S', localtime(now))}.{int(now * 1000) % 1000:03d}"
+        f"_{os.getpid()}-{next(_profile_numbers)}_{kind}_{route}_{settings_text}.prof"
+    )
+
+    return os.path.join(PROFILES_DIRECTORY, file_name)
+
+
+@contextmanager
+def profiled(kind: str, location: str, **settings: Any) -> Iterator[None]:
+    """Profile the enclosed code and save the profile, if profiling is enabled."""
+
+    if not ENABLED:
+        yield
+        return
+
+    profile = Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiler is already active in this thread (nested call).
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        profile.disable()
+        os.makedirs(PROFILES_DIRECTORY, exist_ok=True)
+        profile.dump_stats(_profile_path(kind, location, settings))
@@ -68,6 +68,14 @@ def get_sidebar_menu() -> SidebarMenuType:
     return sidebar_menu
 
 
+def get_page_hrefs() -> list[str]:
+    return [
+        f"/{section_href}/{page_href}"
+        for section_href, (_, pages) in _page_register.items()
+        for page_href in pages
+    ]
+
+
 def get_names(href: str) -> tuple[str, str] | None:
     if "/" not in href[1:]:
         return None
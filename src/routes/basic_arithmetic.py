@@ -22,7 +22,6 @@ def addition():
     cp.heading(r"a + b", _get_image_cached)
 
     cp.coefficients_setup_section(
-        state,
         {
             "a": ("1", "10"),
             "b": ("1", "5")
@@ -30,7 +29,6 @@ def addition():
     )
 
     cp.extra_conditions_section(
-        state,
         (
             (
                 "Цілий результат",
@@ -64,7 +62,6 @@ def subtraction():
     cp.heading(r"a - b", _get_image_cached)
 
     cp.coefficients_setup_section(
-        state,
         {
             "a": ("1", "10"),
             "b": ("1", "5")
@@ -72,7 +69,6 @@ def subtraction():
     )
 
     cp.extra_conditions_section(
-        state,
         (
             (
                 "Невідʼємний результат",
@@ -101,7 +97,6 @@ def multiplication():
     cp.heading(r"a \cdot b", _get_image_cached)
 
     cp.coefficients_setup_section(
-        state,
         {
             "a": ("2", "9"),
             "b": ("2", "9")
@@ -127,7 +122,6 @@ def division():
     cp.heading(r"a : b", _get_image_cached)
 
     cp.coefficients_setup_section(
-        state,
         {
             "a": ("10", "100"),
             "b": ("2", "9")
@@ -135,7 +129,6 @@ def division():
     )
 
     cp.extra_conditions_section(
-        state,
         (
             (
                 "Цілий результат",
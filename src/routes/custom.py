@@ -0,0 +1,29 @@
+from components.custom_generator import custom_generator_section
+from components.tex_image_generator import get_memory_image_generator
+
+import registrar
+
+import hyperdiv as hd
+
+
+custom_registrar = registrar.registrar(
+    "Власні Генератори",
+    "custom"
+)
+
+# The templates are written by the users, so their images are not stored
+# in the assets, only the recent ones are kept in memory.
+_solutions_image_generator = get_memory_image_generator(maxsize=1024)
+
+
+@custom_registrar("Власний шаблон")
+def template():
+    hd.h2("Власний шаблон", margin_top=1)
+
+    hd.text(
+        "Опишіть змінні, умови та відповіді прикладів, як у генераторах сайту, "
+        "і шаблон прикладу в TeX. Вирази перевіряються, а генерація має "
+        "обмежений час."
+    )
+
+    custom_generator_section(_solutions_image_generator)
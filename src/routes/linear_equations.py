@@ -22,7 +22,6 @@ def simple():
     cp.heading(r"x + a = b", _get_image_cached)
 
     cp.coefficients_setup_section(
-        state,
         {
             "a": ("5", "40"),
             "b": ("5", "40")
@@ -30,7 +29,6 @@ def simple():
     )
     
     cp.extra_conditions_section(
-        state,
         (
             (
                 "Розвʼязок є невідʼємним",
@@ -65,7 +63,6 @@ def general():
     cp.heading(r"ax + b = c", _get_image_cached)
 
     cp.coefficients_setup_section(
-        state,
         {
             "a": ("2", "9"),
             "b": ("5", "40"),
@@ -74,7 +71,6 @@ def general():
     )
     
     cp.extra_conditions_section(
-        state,
         (
             (
                 "Розвʼязок є невідʼємним",
@@ -41,7 +41,6 @@ def incomplete_c():
     cp.heading(r"ax^2 + bx = 0", _get_image_cached)
 
     cp.coefficients_setup_section(
-        state,
         {
             "a": ("-12", "12"),
             "b": ("-20", "20")
@@ -50,7 +49,6 @@ def incomplete_c():
     )
     
     cp.extra_conditions_section(
-        state,
         (
             (
                 "Ненульовий розвʼязок є цілим",
@@ -80,7 +78,6 @@ def incomplete_b():
     cp.heading(r"ax^2 + c = 0", _get_image_cached)
 
     cp.coefficients_setup_section(
-        state,
         {
             "a": ("-12", "12"),
             "c": ("-20", "20")
@@ -89,7 +86,6 @@ def incomplete_b():
     )
     
     cp.extra_conditions_section(
-        state,
         (
             (
                 "Розвʼязки існують",
@@ -123,7 +119,6 @@ def complete():
     cp.heading(r"ax^2 + bx + c = 0", _get_image_cached)
 
     cp.coefficients_setup_section(
-        state,
         {
             "a": ("-12", "12"),
             "b": ("-20", "20"),
@@ -133,7 +128,6 @@ def complete():
     )
     
     cp.extra_conditions_section(
-        state,
         (
             (
                 "Хоча б один розвʼязок існує",
@@ -174,7 +168,6 @@ def biquadratic():
     cp.heading(r"ax^4 + bx^2 + c = 0", _get_image_cached)
 
     cp.coefficients_setup_section(
-        state,
         {
             "a": ("-12", "12"),
             "b": ("-20", "20"),
@@ -184,7 +177,6 @@ def biquadratic():
     )
     
     cp.extra_conditions_section(
-        state,
         (
             (
                 "Хоча б 2 розвʼязки існує",
@@ -0,0 +1,23 @@
+from components.worksheet_composer import worksheet_composer_section
+
+import registrar
+
+import hyperdiv as hd
+
+
+worksheets_registrar = registrar.registrar(
+    "Робочі Аркуші",
+    "worksheets"
+)
+
+
+@worksheets_registrar("Змішаний аркуш")
+def mixed():
+    hd.h2("Змішаний аркуш", margin_top=1)
+
+    hd.text(
+        "Оберіть кількість прикладів кожного типу. Приклади всіх типів "
+        "генеруються одночасно та збираються в один PDF-аркуш з відповідями."
+    )
+
+    worksheet_composer_section()
@@ -0,0 +1,146 @@
+"""Executor of the hyperdiv tasks, fair between the sessions.
+
+hyperdiv runs the tasks of all the sessions (websocket connections) in one
+thread pool, which serves them first in, first out, so a session starting
+many tasks delays everyone else. This executor keeps a queue per session
+and the workers take the tasks from the queues in turn (round-robin).
+
+Configured with the environment variable `MATHEMA_TASK_THREADS` — the number
+of the worker threads (10 by default).
+"""
+
+import metrics
+
+from concurrent.futures import Executor, Future
+from collections import OrderedDict, deque
+from threading import Condition, Thread
+from time import perf_counter
+from typing import Any, Callable, Hashable
+
+import os
+
+from hyperdiv.frame import Frame
+
+
+_WorkItemType = tuple[Future, Callable[..., Any], tuple, dict[str, Any], float]
+
+
+def _current_session() -> Hashable | None:
+    """The session submitting the task, or None outside of hyperdiv."""
+
+    try:
+        frame = Frame.current()
+    except RuntimeError:
+        return None
+
+    # hyperdiv creates one app runner per websocket connection, i.e. per session.
+    return id(frame._app_runner)
+
+
+class FairTaskExecutor(Executor):
+    """Thread pool executor with a queue of tasks per session,
+    served in turns.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        self.max_workers = max_workers
+
+        self._queues: OrderedDict[Hashable | None, deque[_WorkItemType]] = OrderedDict()
+        self._num_queued = 0
+        self._condition = Condition()
+        self._threads: list[Thread] = []
+        self._shutdown = False
+
+    @property
+    def num_queued(self) -> int:
+        return self._num_queued
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        future: Future = Future()
+        session = _current_session()
+
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit tasks after shutdown.")
+
+            # Threads are started on the first task, so importing is free.
+            if not self._threads:
+                self._start_workers()
+
+            self._queues.setdefault(session, deque()).append(
+                (future, fn, args, kwargs, perf_counter())
+            )
+            self._num_queued += 1
+            num_queued = self._num_queued
+            self._condition.notify()
+
+        metrics.set_gauge("mathema_task_queue_depth", num_queued)
+        return future
+
+    def _start_workers(self) -> None:
+        for i in range(self.max_workers):
+            thread = Thread(target=self._work, name=f"mathema-task-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_work_item(self) -> _WorkItemType | None:
+        """Take a task from the session that has waited the longest for its turn.
+        Returns None if the executor is shut down.
+        """
+
+        with self._condition:
+            while not self._queues and not self._shutdown:
+                self._condition.wait()
+
+            if not self._queues:
+                return None
+
+            session, queue = self._queues.popitem(last=False)
+            work_item = queue.popleft()
+            if queue:
+                self._queues[session] = queue
+
+            self._num_queued -= 1
+            num_queued = self._num_queued
+
+        metrics.set_gauge("mathema_task_queue_depth", num_queued)
+        return work_item
+
+    def _work(self) -> None:
+        while (work_item := self._next_work_item()) is not None:
+            future, fn, args, kwargs, submit_time = work_item
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            metrics.observe("mathema_task_queue_seconds", perf_counter() - submit_time)
+            start_time = perf_counter()
+
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+            metrics.observe("mathema_task_run_seconds", perf_counter() - start_time)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        with self._condition:
+            self._shutdown = True
+
+            if cancel_futures:
+                for queue in self._queues.values():
+                    for future, *_ in queue:
+                        future.cancel()
+                self._queues.clear()
+                self._num_queued = 0
+
+            self._condition.notify_all()
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+executor = FairTaskExecutor(int(os.environ.get("MATHEMA_TASK_THREADS", "10")))
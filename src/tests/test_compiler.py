@@ -0,0 +1,157 @@
+"""Run from the `src` directory:
+
+    python -m unittest discover tests
+"""
+
+from components.page_specs import discover_page_specs
+from components.worksheet_composer import NOT_GENERATOR_SECTIONS
+from generator import evaluate
+from generator.compiler import compile_conditions
+from generator.stages import plan_stages
+from generator.types import FormulaType, VariableNameType, VariableValueType
+import registrar
+from routes import (
+    basic_arithmetic,
+    linear_equations,
+    quadratic_equations
+)
+
+from math import isnan
+from random import Random
+from typing import Any, Sequence
+
+import unittest
+
+
+SAMPLES = 300
+# Drawn besides the values of the intervals, as they make the formulas
+# raise (division by zero) or evaluate to complex numbers.
+SPECIAL_VALUES = (0, 1, -1)
+
+
+def _expected(
+    conditions: Sequence[FormulaType],
+    answers: Sequence[FormulaType],
+    values: dict[VariableNameType, VariableValueType]
+) -> int | tuple[Any, ...]:
+    """The result of the predicate, evaluating the formulas one by one."""
+
+    for i, condition in enumerate(conditions):
+        if not evaluate(condition, values):
+            return i
+
+    if answers:
+        return tuple(round(evaluate(answer, values), 4) for answer in answers)
+    return -1
+
+
+def _normalized(result: int | tuple[Any, ...]) -> object:
+    # NaN answers are equal for the comparison.
+    if isinstance(result, tuple):
+        return tuple("nan" if isinstance(value, float) and isnan(value) else value for value in result)
+    return result
+
+
+class CompiledPredicateTest(unittest.TestCase):
+    def assertEquivalent(
+        self,
+        conditions: Sequence[FormulaType],
+        answers: Sequence[FormulaType],
+        samples: list[dict[VariableNameType, VariableValueType]],
+        integer_names: frozenset[VariableNameType] = frozenset()
+    ) -> None:
+        variable_names = tuple(samples[0])
+        predicate = compile_conditions(
+            tuple(conditions), variable_names, evaluate, tuple(answers), integer_names
+        )
+
+        for values in samples:
+            self.assertEqual(
+                _normalized(predicate(*values.values())),
+                _normalized(_expected(conditions, answers, values)),
+                msg=f"{conditions} {answers} {values}"
+            )
+
+    def assertStagesEquivalent(
+        self,
+        conditions: Sequence[FormulaType],
+        answers: Sequence[FormulaType],
+        samples: list[dict[VariableNameType, VariableValueType]],
+        integer_names: frozenset[VariableNameType] = frozenset()
+    ) -> None:
+        stages = plan_stages(tuple(conditions), tuple(samples[0]), evaluate, tuple(answers), integer_names)
+        drawn: list[VariableNameType] = []
+
+        for i, stage in enumerate(stages):
+            drawn.append(stage.variable)
+            if stage.predicate is None:
+                continue
+
+            stage_answers = answers if i == len(stages) - 1 else ()
+            for values in samples:
+                stage_values = {name: values[name] for name in drawn}
+                self.assertEqual(
+                    _normalized(stage.predicate(*stage_values.values())),
+                    _normalized(_expected(stage.checks, stage_answers, stage_values)),
+                    msg=f"{stage.checks} {stage_answers} {stage_values}"
+                )
+
+    def test_registered_pages(self) -> None:
+        hrefs = [
+            href for href in registrar.get_page_hrefs()
+            if not href.startswith(NOT_GENERATOR_SECTIONS)
+        ]
+        specs = discover_page_specs(hrefs)
+        self.assertTrue(specs)
+
+        for page, spec in specs.items():
+            conditions = sorted(spec.conditions(range(len(spec.extra_conditions))))
+            answers = list(spec.answer_variables.values())
+            rng = Random(page)
+
+            for is_integer in (True, False):
+                samples = []
+                for _ in range(SAMPLES):
+                    values: dict[VariableNameType, VariableValueType] = {}
+                    for name, properties in spec.variables().items():
+                        start, stop = properties.interval.int_tuple
+                        if rng.random() < 0.25:
+                            values[name] = rng.choice(SPECIAL_VALUES)
+                        elif is_integer:
+                            values[name] = rng.randint(start, stop)
+                        else:
+                            values[name] = round(rng.uniform(start, stop), 1)
+                    samples.append(values)
+
+                integer_names = frozenset(samples[0]) if is_integer else frozenset()
+                with self.subTest(page=page, is_integer=is_integer):
+                    self.assertEquivalent(conditions, answers, samples, integer_names)
+                    self.assertStagesEquivalent(conditions, answers, samples, integer_names)
+
+    def test_exceptions_and_complex_results(self) -> None:
+        rng = Random(0)
+        samples = [
+            {"a": rng.randint(-3, 3), "b": rng.randint(-3, 3), "c": rng.randint(-3, 3)}
+            for _ in range(SAMPLES)
+        ]
+        conditions = [
+            # Raises ZeroDivisionError, which `evaluate` turns into -inf,
+            # satisfying the condition.
+            "1 / a > 0",
+            "a % b != 1",
+            # Complex for the negative values, which is -inf for `evaluate`.
+            "(b * b - 4 * a * c) ** 0.5",
+            "(b * b - 4 * a * c) ** 0.5 != 1",
+            "is_square(b * b - 4 * a * c) or c > 0",
+        ]
+        answers = ["(-b + (b * b - 4 * a * c) ** 0.5) / (2 * a)", "c / (a - b)", "b ** 2"]
+
+        for integer_names in (frozenset(("a", "b", "c")), frozenset()):
+            with self.subTest(integer_names=integer_names):
+                self.assertEquivalent(conditions, answers, samples, integer_names)
+                self.assertEquivalent(conditions, (), samples, integer_names)
+                self.assertStagesEquivalent(conditions, answers, samples, integer_names)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+"""Run from the `src` directory:
+
+    python -m unittest discover tests
+"""
+
+from generator import _generator_builtins
+from generator.custom import MAX_CONSTANT, FormulaError, check_formula, custom_generator
+from generator.custom_worker import BudgetExceededError, CustomGenerationPool
+from generator.generator import FormulaEvaluationError, evaluate_strict
+
+from queue import Empty
+
+import unittest
+
+
+VARIABLE_NAMES = frozenset(("a", "b"))
+
+
+class CheckFormulaTest(unittest.TestCase):
+    def assertRefused(self, formula: str) -> None:
+        with self.assertRaises(FormulaError, msg=formula):
+            check_formula(formula, VARIABLE_NAMES)
+
+    def test_accepts_the_grammar(self) -> None:
+        for formula in (
+            "a + b * 2 - 3 / a // b % 5",
+            "-a < b <= 10 and not a == b or a != 0",
+            "a if a > b else b",
+            "abs(a) + min(a, b) + max(a, b, 1)",
+            "is_square(a) and (a / b).is_integer()",
+            f"a < {MAX_CONSTANT}",
+        ):
+            with self.subTest(formula=formula):
+                check_formula(formula, VARIABLE_NAMES)
+
+    def test_refuses_names(self) -> None:
+        for formula in ("c + a", "__import__('os')", "_private", "round(a, -b)", "bounded_power(a, b)"):
+            with self.subTest(formula=formula):
+                self.assertRefused(formula)
+
+    def test_refuses_attributes(self) -> None:
+        for formula in ("a.real", "a.__class__", "(a).is_integer", "a.is_integer(1)"):
+            with self.subTest(formula=formula):
+                self.assertRefused(formula)
+
+    def test_refuses_subscripts(self) -> None:
+        for formula in ("a[0]", "(a, b)[0]"):
+            with self.subTest(formula=formula):
+                self.assertRefused(formula)
+
+    def test_refuses_strings(self) -> None:
+        for formula in ("'a'", "a == b'b'", "f'{a}'", "None"):
+            with self.subTest(formula=formula):
+                self.assertRefused(formula)
+
+    def test_refuses_keyword_arguments(self) -> None:
+        for formula in ("max(a, key=b)", "min(a, b, default=0)", "max(*a)"):
+            with self.subTest(formula=formula):
+                self.assertRefused(formula)
+
+    def test_refuses_too_large_constants(self) -> None:
+        for formula in (f"a < {MAX_CONSTANT + 1}", f"a > -{MAX_CONSTANT + 1}", "a < 1e10"):
+            with self.subTest(formula=formula):
+                self.assertRefused(formula)
+
+    def test_refuses_the_other_expressions(self) -> None:
+        for formula in ("lambda: a", "[a for a in b]", "(c := a)", "a if", "a; b"):
+            with self.subTest(formula=formula):
+                self.assertRefused(formula)
+
+    def test_bounds_the_large_powers(self) -> None:
+        for formula in ("10**10**8", "9**9**9"):
+            with self.subTest(formula=formula):
+                checked = check_formula(f"a < {formula}", VARIABLE_NAMES)
+
+                self.assertNotIn("**", checked)
+                self.assertIn("bounded_power", checked)
+                with self.assertRaises(FormulaEvaluationError):
+                    evaluate_strict(checked, {"a": 1, "b": 1})
+
+    def test_bounds_the_powers_of_the_variables(self) -> None:
+        checked = check_formula("a ** b > 0", VARIABLE_NAMES)
+
+        self.assertEqual(evaluate_strict(checked, {"a": 2, "b": 10}), True)
+        with self.assertRaises(FormulaEvaluationError):
+            evaluate_strict(checked, {"a": 10, "b": 10 ** 6})
+        with self.assertRaises(FormulaEvaluationError):
+            evaluate_strict(checked, {"a": -1, "b": 0.5})
+
+    def test_bounded_power(self) -> None:
+        self.assertEqual(_generator_builtins.bounded_power(2, 10), 1024)
+        self.assertEqual(_generator_builtins.bounded_power(1, 10 ** 8), 1)
+        with self.assertRaises(OverflowError):
+            _generator_builtins.bounded_power(9, 9 ** 9)
+        with self.assertRaises(ValueError):
+            _generator_builtins.bounded_power(-1, 0.5)
+
+
+class CustomGeneratorTest(unittest.TestCase):
+    def test_refuses_invalid_names(self) -> None:
+        for name in ("_a", "max", "bounded_power", "if", "a b", "а"):
+            with self.subTest(name=name), self.assertRaises(FormulaError):
+                custom_generator({name: (0, 1)}, [], {})
+
+        with self.assertRaises(FormulaError):
+            custom_generator({"a": (0, 1)}, [], {"a": "a + 1"})
+
+    def test_refuses_the_generators_over_the_limits(self) -> None:
+        with self.assertRaises(ValueError):
+            custom_generator({}, [], {})
+        with self.assertRaises(ValueError):
+            custom_generator({"a": (0, 10 ** 7)}, [], {})
+        with self.assertRaises(ValueError):
+            custom_generator({"a": (0, 1)}, ["a > 0"] * 11, {})
+
+    def test_keeps_the_sources(self) -> None:
+        generator = custom_generator({"a": (1, 10), "b": (1, 10)}, ["a ** b > 1", " "], {"c": "a * b"})
+
+        self.assertEqual(generator.conditions, ("bounded_power(a, b) > 1",))
+        self.assertEqual(generator.answer_variables, {"c": "a * b"})
+        self.assertEqual(generator.source(generator.conditions[0]), "a ** b > 1")
+
+
+class CustomGenerationPoolTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.pool = CustomGenerationPool(1, 1)
+
+    def tearDown(self) -> None:
+        while True:
+            try:
+                worker = self.pool._idle.get_nowait()
+            except Empty:
+                break
+            if worker is not None:
+                worker.kill()
+
+    def test_generates(self) -> None:
+        generator = custom_generator({"a": (1, 100), "b": (1, 100)}, ["a % b == 0", "a != b"], {"c": "a // b"})
+
+        solutions = self.pool.generate(generator, 5, 42)
+
+        assert solutions is not None
+        self.assertEqual(len(solutions), 5)
+        for solution in solutions:
+            self.assertEqual(solution["a"] % solution["b"], 0)
+            self.assertEqual(solution.answers["c"], solution["a"] // solution["b"])
+
+        self.assertEqual(self.pool.generate(generator, 5, 42), solutions)
+
+    def test_exceeds_the_cpu_budget(self) -> None:
+        generator = custom_generator(
+            {"a": (-10 ** 6, 10 ** 6), "b": (-10 ** 6, 10 ** 6)},
+            ["a * b % 999983 == 7", "(a + b) % 999979 == 3"],
+            {}
+        )
+
+        with self.assertRaises(BudgetExceededError):
+            self.pool.generate(generator, 10, 42)
+
+        # The killed worker is started again on the next request.
+        generator = custom_generator({"a": (1, 10)}, ["a > 5"], {})
+        solutions = self.pool.generate(generator, 3, 42)
+        assert solutions is not None
+        self.assertEqual(len(solutions), 3)
+
+    def test_refuses_the_formulas_raising_for_all_the_values(self) -> None:
+        generator = custom_generator({"a": (1, 10)}, ["a > 0", "1 / (a - a) > 0"], {})
+
+        with self.assertRaises(FormulaError) as context:
+            self.pool.generate(generator, 3, 42)
+        self.assertEqual(context.exception.formula, "1 / (a - a) > 0")
+
+    def test_canceled(self) -> None:
+        generator = custom_generator({"a": (1, 10)}, ["a > 5"], {})
+
+        self.assertEqual(self.pool.generate(generator, 3, 42, is_canceled=lambda: True), set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+"""Run from the `src` directory:
+
+    python -m unittest discover tests
+"""
+
+from generator import condition_order, generate_solutions
+from generator.types import Interval, VariableProperties
+
+from random import Random
+
+import unittest
+
+
+class GenerateSolutionsTest(unittest.TestCase):
+    def test_same_seed_after_warming_condition_order(self) -> None:
+        location = "/tests/same_seed"
+        variables = {
+            "a": VariableProperties(Interval(1.0, 10.0), False, True),
+            "b": VariableProperties(Interval(-10.0, 10.0), False, True),
+            "c": VariableProperties(Interval(-5.0, 5.0), True, False),
+        }
+        # The single variable conditions differ in selectivity, so the
+        # measured order differs from the initial (arbitrary) one.
+        conditions = {"a > 2", "c < -3", "b != 0", "b ** 2 - 4 * a * c >= 0"}
+        answer_variables = {"d": "b ** 2 - 4 * a * c"}
+
+        def generate(seed: int) -> list:
+            solutions = generate_solutions(
+                variables, conditions, 50, location,
+                rng=Random(seed), answer_variables=answer_variables
+            )
+            assert solutions is not None
+            return sorted(tuple(solution.items()) for solution in solutions)
+
+        condition_order._statistics.pop(location, None)
+        cold = generate(42)
+
+        for seed in range(40):
+            generate(seed)
+
+        self.assertEqual(generate(42), cold)
+
+
+if __name__ == "__main__":
+    unittest.main()